@@ -0,0 +1,383 @@
+"""
+Offline bulk ingestion for migrations and backfills.
+
+    python -m app.cli /data/export --user-id <firebase_uid>
+
+Walks a local directory and runs the ingestion pipeline in-process for
+every PDF, image and text file (.txt, .md), with no HTTP hops and no
+Firebase auth:
+
+- Files are hashed, parsed and chunked in a process pool (--workers).
+- Chunks are embedded concurrently (--concurrency) through the shared
+  embedding batcher, so each Gemini request carries many chunks.
+- Chunks are written straight to Postgres `document_chunks` in multi-row
+  INSERTs of --batch-size rows.
+- Originals, thumbnails, summaries, the knowledge graph and document
+  metadata are stored like the HTTP pipeline does (see the --no-* flags).
+  PDF summaries run inline (map-reduce over the whole document, see
+  services/summary_service.py) instead of as deferred jobs.
+
+Each completed file is appended to the --checkpoint file, so an
+interrupted run resumes where it stopped. A file that was partly
+ingested when the run stopped is ingested again from the start without
+duplicating anything: chunk ids are derived from the user, file hash and
+chunk index, document metadata is keyed by the file hash, and the
+knowledge graph of a file hash is only counted once (see
+FirestoreService.save_graph). Originals and thumbnails are stored under
+their hash, so they are overwritten in place.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import firebase_admin
+from firebase_admin import credentials
+from sqlalchemy.dialects.postgresql import insert
+
+from .core.config import get_settings
+from .core.database import engine, document_chunks
+from .core.uploads import SpooledUpload, READ_CHUNK_SIZE
+from .services.batch_ingest import detect_kind
+from .services.chunk_pool import ChunkPool
+from .services.embedding_service import embedding_service
+from .services.firestore_service import firestore_service
+from .services.ingestion_pipeline import IngestionError, chunk_id, save_graph, store_thumbnails
+from .services.processing_service import processing_service
+from .services.storage_service import storage_service
+from .services.summary_service import summary_service
+
+settings = get_settings()
+
+TEXT_SUFFIXES = (".txt", ".md")
+
+
+def detect_file_kind(path: str) -> Optional[str]:
+    """Classify a local file as "pdf", "image" or "text", or None to skip it."""
+    if path.lower().endswith(TEXT_SUFFIXES):
+        return "text"
+    kind = detect_kind(os.path.basename(path), None)
+    return kind if kind in ("pdf", "image") else None
+
+
+def iter_files(root: str) -> Iterator[str]:
+    """Yield files under root in a stable order, skipping hidden files and directories."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if not name.startswith("."):
+                yield os.path.join(dirpath, name)
+
+
+class Checkpoint:
+    """Append-only JSON-lines record of files that were fully ingested."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._done = set()
+
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            for line in data.splitlines():
+                try:
+                    self._done.add(json.loads(line)["key"])
+                except (ValueError, KeyError):
+                    # Torn last line of an interrupted run
+                    continue
+            torn = bool(data) and not data.endswith(b"\n")
+        else:
+            torn = False
+
+        self._file = open(path, "a", encoding="utf-8")
+        if torn:
+            self._file.write("\n")
+
+    @staticmethod
+    def key(path: str) -> str:
+        """Identify a file version by absolute path, size and modification time."""
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._done
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def mark_done(self, key: str, **details: Any) -> None:
+        """Durably record a finished file."""
+        self._done.add(key)
+        self._file.write(json.dumps({"key": key, **details}) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def parse_file(path: str, kind: str) -> Dict[str, Any]:
+    """
+    Hash and chunk one file (blocking; runs in a pool worker process).
+
+    Images are only hashed here; OCR needs Gemini and runs in the parent.
+
+    Returns:
+        Dict with 'sha256', 'size', 'chunks' (text and, for PDFs, page
+        range), 'preview' (leading text) and 'pages'
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+            digest.update(block)
+            size += len(block)
+
+    parsed = {"sha256": digest.hexdigest(), "size": size, "chunks": [], "preview": "", "pages": 0}
+    if kind == "text":
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        parsed["chunks"] = [{"text": chunk} for chunk in embedding_service.chunk_text(text)]
+    elif kind == "pdf":
+        parsed.update(processing_service.extract_pdf_chunks(path))
+    return parsed
+
+
+def insert_chunk_rows(rows: List[Dict[str, Any]]) -> None:
+    """Insert chunks into document_chunks in one statement, skipping ids already stored (blocking)."""
+    with engine.begin() as conn:
+        conn.execute(insert(document_chunks).on_conflict_do_nothing(index_elements=["id"]), rows)
+
+
+class BulkIngestor:
+    def __init__(self, user_id: str, checkpoint: Checkpoint, workers: int = os.cpu_count() or 1,
+                 concurrency: int = 64, batch_size: int = 500, files_in_flight: Optional[int] = None,
+                 graph: bool = True, upload: bool = True, summaries: bool = True):
+        self.user_id = user_id
+        self.checkpoint = checkpoint
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        # Enough files in flight that parsing overlaps embedding
+        self.files_in_flight = files_in_flight or self.workers * 2
+        self.graph = graph
+        self.upload = upload
+        self.summaries = summaries
+        self._chunk_pool = ChunkPool(concurrency, concurrency)
+        self.stats = {"files": 0, "failed": 0, "skipped": 0, "chunks": 0}
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        async def embed(index: int, text: str) -> List[float]:
+            return await embedding_service.generate_embedding(text)
+
+        return await self._chunk_pool.map(texts, embed)
+
+    async def _insert(self, rows: List[Dict[str, Any]]) -> None:
+        for start in range(0, len(rows), self.batch_size):
+            await asyncio.to_thread(insert_chunk_rows, rows[start:start + self.batch_size])
+
+    async def _extract(self, spooled: SpooledUpload, kind: str, parsed: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Chunks of a parsed file, running OCR where the parser found no text."""
+        if kind == "image":
+            with spooled.as_upload_file() as file:
+                text = await processing_service.extract_text_from_image(file)
+            if not text or len(text.strip()) < 5:
+                return []
+            return [{"text": chunk} for chunk in embedding_service.chunk_text(text)]
+
+        if kind == "pdf" and len(parsed["preview"].strip()) < 10:
+            # Scanned PDF: fall back to the OCR-capable parser
+            with spooled.as_upload_file() as file:
+                parsed.update(await processing_service.chunk_pdf(file))
+            if len(parsed["preview"].strip()) < 10:
+                raise IngestionError("Could not extract text from PDF")
+
+        return parsed["chunks"]
+
+    async def ingest_file(self, path: str, kind: str, parsed: Dict[str, Any]) -> Dict[str, Any]:
+        """Store, OCR, embed, index and graph one parsed file."""
+        filename = os.path.basename(path)
+        content_type = "text/plain" if kind == "text" else mimetypes.guess_type(filename)[0]
+        # Points at the original file; close() is never called so it isn't deleted
+        spooled = SpooledUpload(path, parsed["size"], parsed["sha256"], filename, content_type)
+
+        chunks = await self._extract(spooled, kind, parsed)
+        texts = [c["text"] for c in chunks]
+
+        metadata: Dict[str, Any] = {"type": kind, "source": filename}
+        file_url = None
+        if kind != "text" and self.upload:
+            with spooled.as_upload_file() as file:
+                file_url = await storage_service.upload_file(
+                    file, folder=f"{kind}s/{self.user_id}", content_hash=spooled.sha256
+                )
+            metadata["file_url"] = file_url
+            if kind == "image":
+                metadata["image_url"] = file_url
+                metadata["thumbnail_urls"] = await store_thumbnails(self.user_id, spooled)
+
+        async def graph():
+            if not self.graph:
+                return None
+            return await save_graph(self.user_id, texts,
+                                    [chunk_id(self.user_id, spooled.sha256, index) for index in range(len(texts))],
+                                    spooled.sha256)
+
+        embeddings, _ = await asyncio.gather(self._embed(texts), graph())
+
+        rows = [
+            {
+                "id": chunk_id(self.user_id, spooled.sha256, index),
+                "user_id": self.user_id,
+                "text": chunk["text"],
+                "embedding": embedding,
+                "metadata": {
+                    **metadata,
+                    **({"page_start": chunk["page_start"], "page_end": chunk["page_end"]} if "page_start" in chunk else {}),
+                    "chunk_index": index,
+                    "chunk_count": len(chunks)
+                }
+            }
+            for index, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+        ]
+
+        summary = None
+        if kind == "pdf" and self.summaries:
+            summary = (await summary_service.summarize_document(texts))["summary"] or None
+        if summary:
+            rows.append({
+                "id": chunk_id(self.user_id, spooled.sha256, "summary"),
+                "user_id": self.user_id,
+                "text": f"Document Summary for {filename}:\n{summary}",
+                "embedding": await embedding_service.generate_embedding(f"Summary of {filename}: {summary}"),
+                "metadata": {"type": "summary", "source": filename, "file_url": file_url, "is_summary": True}
+            })
+
+        await self._insert(rows)
+
+        if kind != "text":
+            await firestore_service.save_document_metadata(
+                user_id=self.user_id,
+                filename=filename,
+                file_url=file_url,
+                file_type=kind,
+                chunks_count=len(chunks),
+                summary=summary,
+                content_hash=spooled.sha256
+            )
+
+        return {"chunks": len(chunks), "sha256": spooled.sha256}
+
+    async def _process(self, pool: ProcessPoolExecutor, path: str, kind: str, key: str) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            parsed = await loop.run_in_executor(pool, parse_file, path, kind)
+            result = await self.ingest_file(path, kind, parsed)
+        except Exception as e:
+            # Left out of the checkpoint, so the next run retries it
+            self.stats["failed"] += 1
+            print(f"❌ {path}: {e}")
+            return
+
+        self.checkpoint.mark_done(key, **result)
+        self.stats["files"] += 1
+        self.stats["chunks"] += result["chunks"]
+
+    def _pending_files(self, root: str) -> Iterator[Tuple[str, str, str]]:
+        for path in iter_files(root):
+            kind = detect_file_kind(path)
+            if kind is None:
+                continue
+            key = Checkpoint.key(path)
+            if key in self.checkpoint:
+                self.stats["skipped"] += 1
+                continue
+            yield path, kind, key
+
+    async def run(self, root: str) -> Dict[str, int]:
+        """
+        Ingest every supported file under root that isn't checkpointed yet.
+
+        Returns:
+            Counts of ingested, failed and already-checkpointed files and stored chunks
+        """
+        started = time.monotonic()
+        slots = asyncio.Semaphore(self.files_in_flight)
+        tasks = set()
+
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn")) as pool:
+            for path, kind, key in self._pending_files(root):
+                # Bounded fan-out keeps memory flat for millions of files
+                await slots.acquire()
+                task = asyncio.create_task(self._process(pool, path, kind, key))
+                tasks.add(task)
+
+                def finished(task):
+                    tasks.discard(task)
+                    slots.release()
+
+                task.add_done_callback(finished)
+
+                done = self.stats["files"] + self.stats["failed"]
+                if done and done % 100 == 0:
+                    rate = self.stats["chunks"] / (time.monotonic() - started)
+                    print(f"📥 {done} files, {self.stats['chunks']} chunks ({rate:.0f} chunks/s)")
+
+            if tasks:
+                await asyncio.gather(*tasks)
+
+        print(f"✅ Bulk ingestion finished in {time.monotonic() - started:.0f}s: {self.stats}")
+        return self.stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Bulk-ingest a local directory.")
+    parser.add_argument("root", help="Directory to ingest")
+    parser.add_argument("--user-id", required=True, help="Firebase user id that will own the documents")
+    parser.add_argument("--checkpoint", default="ingest-checkpoint.jsonl",
+                        help="File recording finished files, for resuming (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parsing processes")
+    parser.add_argument("--concurrency", type=int, default=64, help="Chunks embedded concurrently")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per INSERT")
+    parser.add_argument("--no-graph", action="store_true", help="Skip knowledge graph extraction")
+    parser.add_argument("--no-upload", action="store_true", help="Don't copy originals to storage")
+    parser.add_argument("--no-summary", action="store_true", help="Skip PDF summaries")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        parser.error(f"{args.root} is not a directory")
+
+    # Firestore and Storage use the Admin SDK's service credentials; no user auth
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(settings.FIREBASE_CREDENTIALS), {
+            'storageBucket': settings.FIREBASE_STORAGE_BUCKET
+        })
+
+    checkpoint = Checkpoint(args.checkpoint)
+    ingestor = BulkIngestor(
+        args.user_id,
+        checkpoint,
+        workers=args.workers,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        graph=not args.no_graph,
+        upload=not args.no_upload,
+        summaries=not args.no_summary
+    )
+    try:
+        stats = asyncio.run(ingestor.run(args.root))
+    finally:
+        checkpoint.close()
+        processing_service.shutdown()
+
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
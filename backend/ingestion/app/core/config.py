@@ -32,6 +32,98 @@ class Settings(BaseSettings):
     # RAG Service Configuration
     RAG_SERVICE_URL: str = os.getenv("RAG_SERVICE_URL", "http://rag:8001")
 
+    # Ingestion Job Queue Configuration
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "2"))
+    INGEST_JOB_MAX_ATTEMPTS: int = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+    INGEST_JOB_POLL_INTERVAL: float = float(os.getenv("INGEST_JOB_POLL_INTERVAL", "1.0"))
+    INGEST_JOB_RETRY_BACKOFF: float = float(os.getenv("INGEST_JOB_RETRY_BACKOFF", "10.0"))
+    # Running jobs not updated for this long are assumed dead and re-claimed
+    INGEST_JOB_LOCK_TIMEOUT: int = int(os.getenv("INGEST_JOB_LOCK_TIMEOUT", "900"))
+    # Maximum seconds a single pipeline stage (upload, extract, embed, ...) may run
+    INGEST_STAGE_TIMEOUT: float = float(os.getenv("INGEST_STAGE_TIMEOUT", "600"))
+
+    # Chunking: "tokens" (token-aware; counts are estimated, see services/chunker.py)
+    # or "chars" (the original fixed-size character chunks)
+    CHUNKER: str = os.getenv("CHUNKER", "tokens").lower()
+    CHUNK_SIZE_CHARS: int = int(os.getenv("CHUNK_SIZE_CHARS", "500"))
+    CHUNK_OVERLAP_CHARS: int = int(os.getenv("CHUNK_OVERLAP_CHARS", "100"))
+    CHUNK_MAX_TOKENS: int = int(os.getenv("CHUNK_MAX_TOKENS", "384"))
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "72"))
+    # Input limit of the embedding model; chunks never exceed it
+    EMBED_MAX_INPUT_TOKENS: int = int(os.getenv("EMBED_MAX_INPUT_TOKENS", "2048"))
+
+    # Embedding Micro-Batching (texts per API request, max wait to fill a batch)
+    EMBED_BATCH_SIZE: int = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+    EMBED_BATCH_WAIT_MS: float = float(os.getenv("EMBED_BATCH_WAIT_MS", "10"))
+
+    # Batch / Archive Uploads
+    INGEST_BATCH_MAX_FILES: int = int(os.getenv("INGEST_BATCH_MAX_FILES", "1000"))
+    # Limits per extracted archive member and per whole batch (guards against zip bombs)
+    INGEST_BATCH_MAX_FILE_BYTES: int = int(os.getenv("INGEST_BATCH_MAX_FILE_BYTES", str(100 * 1024 * 1024)))
+    INGEST_BATCH_MAX_TOTAL_BYTES: int = int(os.getenv("INGEST_BATCH_MAX_TOTAL_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+    # Streaming Text Ingestion (POST /ingest/text/stream)
+    INGEST_STREAM_MAX_BYTES: int = int(os.getenv("INGEST_STREAM_MAX_BYTES", str(500 * 1024 * 1024)))
+    INGEST_STREAM_MAX_LINE_BYTES: int = int(os.getenv("INGEST_STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
+
+    # Chunk Processing Concurrency (embed + insert per chunk)
+    INGEST_CHUNK_CONCURRENCY: int = int(os.getenv("INGEST_CHUNK_CONCURRENCY", "8"))
+    # Upper bound across all requests and jobs in this process
+    INGEST_GLOBAL_CHUNK_CONCURRENCY: int = int(os.getenv("INGEST_GLOBAL_CHUNK_CONCURRENCY", "32"))
+
+    # File Storage Configuration ("firebase" or "local")
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "firebase")
+    # Resumable upload part size in bytes (rounded down to a multiple of 256 KiB)
+    STORAGE_CHUNK_SIZE: int = int(os.getenv("STORAGE_CHUNK_SIZE", str(8 * 1024 * 1024)))
+    STORAGE_LOCAL_ROOT: str = os.getenv("STORAGE_LOCAL_ROOT", "/app/storage")
+    STORAGE_LOCAL_BASE_URL: str = os.getenv("STORAGE_LOCAL_BASE_URL", "")
+
+    # Directory for spooled uploads (defaults to the system temp dir)
+    INGEST_SPOOL_DIR: str = os.getenv("INGEST_SPOOL_DIR", "")
+    # Queued uploads are kept here until their job finishes; job rows only
+    # reference them, so every worker must see the same directory
+    INGEST_QUEUE_DIR: str = os.getenv("INGEST_QUEUE_DIR", "/app/queue")
+    # Largest file accepted by /ingest/pdf and /ingest/image
+    INGEST_UPLOAD_MAX_BYTES: int = int(os.getenv("INGEST_UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+
+    # PDF Parsing Process Pool (0 workers parses in a thread instead)
+    PDF_PARSE_WORKERS: int = int(os.getenv("PDF_PARSE_WORKERS", str(os.cpu_count() or 1)))
+    PDF_PARSE_MIN_PAGES_PER_TASK: int = int(os.getenv("PDF_PARSE_MIN_PAGES_PER_TASK", "10"))
+    # CPU seconds a single document may spend in text extraction
+    PDF_PARSE_CPU_LIMIT: float = float(os.getenv("PDF_PARSE_CPU_LIMIT", "120"))
+
+    # OCR Image Preparation (long side in pixels, JPEG quality)
+    OCR_MAX_DIMENSION: int = int(os.getenv("OCR_MAX_DIMENSION", "1600"))
+    OCR_JPEG_QUALITY: int = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+    # WebP quality of image thumbnails shown in search results
+    THUMBNAIL_QUALITY: int = int(os.getenv("THUMBNAIL_QUALITY", "75"))
+
+    # OCR Fallback for PDF Pages Without a Text Layer
+    PDF_OCR_ENABLED: bool = os.getenv("PDF_OCR_ENABLED", "true").lower() == "true"
+    PDF_OCR_CONCURRENCY: int = int(os.getenv("PDF_OCR_CONCURRENCY", "4"))
+    PDF_OCR_CACHE_SIZE: int = int(os.getenv("PDF_OCR_CACHE_SIZE", "256"))
+
+    # Knowledge Graph Extraction (chunks are packed into prompts of up to
+    # GRAPH_PROMPT_MAX_TOKENS estimated tokens; calls in flight per process)
+    GRAPH_PROMPT_MAX_TOKENS: int = int(os.getenv("GRAPH_PROMPT_MAX_TOKENS", "4000"))
+    GRAPH_EXTRACTION_CONCURRENCY: int = int(os.getenv("GRAPH_EXTRACTION_CONCURRENCY", "4"))
+    # "llm" (Gemini), "local" (rule-based, CPU only) or "hybrid" (local entities, Gemini relations)
+    GRAPH_EXTRACTION_BACKEND: str = os.getenv("GRAPH_EXTRACTION_BACKEND", "llm").lower()
+
+    # Graph Analysis (deferred "graph_analysis" jobs: communities and PageRank)
+    # At most one analysis per user per interval, run when the interval ends
+    GRAPH_ANALYSIS_INTERVAL: int = int(os.getenv("GRAPH_ANALYSIS_INTERVAL", "300"))
+
+    # Graph Snapshots (deferred "graph_snapshot" jobs fold documents' counts
+    # into the stored snapshot; at most one per user per interval)
+    GRAPH_SNAPSHOT_COMPACT_INTERVAL: int = int(os.getenv("GRAPH_SNAPSHOT_COMPACT_INTERVAL", "10"))
+
+    # Document Summaries (deferred "summary" jobs; map-reduce over sections)
+    # Characters of text (or of section summaries) per summarization call
+    SUMMARY_SECTION_CHARS: int = int(os.getenv("SUMMARY_SECTION_CHARS", "30000"))
+    # Concurrent summarization calls across all jobs in this process
+    SUMMARY_CONCURRENCY: int = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+
     # CORS Configuration
     CORS_ORIGINS: str = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:3001")
 
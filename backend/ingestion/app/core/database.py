@@ -1,6 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON, text
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON, LargeBinary, Index, MetaData, Table, Uuid, func, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, deferred
 from pgvector.sqlalchemy import Vector
 from datetime import datetime
 from .config import get_settings
@@ -22,6 +23,128 @@ class TextChunk(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     source = Column(String, index=True)  # e.g., filename or "text_input"
 
+class IngestionJob(Base):
+    """
+    Durable ingestion job.
+
+    Rows are claimed by workers with SELECT ... FOR UPDATE SKIP LOCKED,
+    so several workers (or service replicas) can share the queue.
+    """
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False, index=True)
+    kind = Column(String, nullable=False)  # "pdf", "image", "summary", "graph_snapshot" or "graph_analysis"
+    status = Column(String, nullable=False, default="queued", index=True)  # queued, running, succeeded, failed
+    filename = Column(String)
+    content_type = Column(String)
+    content_hash = Column(String, nullable=False)
+    idempotency_key = Column(String, nullable=True)
+    # JSON request of deferred jobs, cleared once the job finishes. Deferred so
+    # status reads and progress updates don't load it; only JobQueue.claim() undefers it.
+    payload = deferred(Column(LargeBinary, nullable=True))
+    # Queued upload file of file jobs (under INGEST_QUEUE_DIR), removed once the job finishes
+    payload_path = Column(String, nullable=True)
+    stage = Column(String, nullable=True)
+    progress = Column(JSON, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    run_after = Column(DateTime, default=datetime.utcnow)  # Retry backoff
+    locked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # One live job per user and content, so retried uploads attach to it
+        Index(
+            "uq_ingestion_jobs_user_content",
+            "user_id", "content_hash",
+            unique=True,
+            postgresql_where=text("status <> 'failed'"),
+            sqlite_where=text("status <> 'failed'"),
+        ),
+        Index("ix_ingestion_jobs_user_key", "user_id", "idempotency_key"),
+    )
+
+class CacheEntry(Base):
+    """Persistent cache entry (see services/cache_service.py)."""
+    __tablename__ = "cache_entries"
+
+    namespace = Column(String, primary_key=True)  # e.g. "ocr"
+    key = Column(String, primary_key=True)
+    value = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class GraphSnapshot(Base):
+    """
+    A user's whole knowledge graph as one gzip-compressed JSON document
+    (see services/graph_snapshot.py), served as is by rag_service.
+    """
+    __tablename__ = "graph_snapshots"
+
+    user_id = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)  # Incremented on every rebuild or compaction
+    node_count = Column(Integer, nullable=False, default=0)
+    edge_count = Column(Integer, nullable=False, default=0)
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class GraphSnapshotDelta(Base):
+    """
+    A document's entity and relation counts, waiting to be folded into its
+    user's graph snapshot by a "graph_snapshot" job (see
+    services/graph_snapshot.py).
+    """
+    __tablename__ = "graph_snapshot_deltas"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)  # Folded in this order
+    user_id = Column(String, nullable=False, index=True)
+    data = Column(JSON, nullable=False)  # {"nodes": [[name, count]], "edges": [[source, target, type, weight]]}
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class GraphOverview(Base):
+    """
+    Communities and PageRank of a user's graph, computed from its snapshot
+    by deferred "graph_analysis" jobs (see services/graph_analysis.py).
+    """
+    __tablename__ = "graph_overviews"
+
+    user_id = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)  # Snapshot version analyzed
+    data = Column(LargeBinary, nullable=False)  # gzip-compressed JSON
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+class EntityMention(Base):
+    """
+    Link from a knowledge graph entity to a document chunk that mentions it
+    (see services/entity_mentions.py), for entity-scoped retrieval in
+    rag_service. The primary key doubles as the (user_id, entity) index.
+    """
+    __tablename__ = "entity_mentions"
+
+    user_id = Column(String, primary_key=True)
+    entity = Column(String, primary_key=True)
+    chunk_id = Column(Uuid(as_uuid=False), primary_key=True)  # document_chunks.id
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# rag_service's vector table, in the same database. Declared on its own
+# MetaData because rag_service owns the schema: init_db() never creates it.
+# Used by the offline bulk loader (app/cli.py) to insert chunks directly.
+rag_metadata = MetaData()
+
+document_chunks = Table(
+    "document_chunks",
+    rag_metadata,
+    Column("id", UUID(as_uuid=True), primary_key=True),
+    Column("user_id", String(255), nullable=False),
+    Column("text", Text, nullable=False),
+    Column("embedding", Vector(settings.EMBEDDING_DIMENSION), nullable=False),
+    Column("metadata", JSONB, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
 def init_db():
     # Create vector extension if not exists
     with engine.connect() as conn:
@@ -30,6 +153,11 @@ def init_db():
     
     Base.metadata.create_all(bind=engine)
 
+    # Columns added after the table was first created
+    with engine.connect() as conn:
+        conn.execute(text("ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS payload_path VARCHAR"))
+        conn.commit()
+
 def get_db():
     db = SessionLocal()
     try:
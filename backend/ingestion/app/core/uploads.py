@@ -0,0 +1,169 @@
+"""
+Upload spooling.
+
+An upload is written to a local temp file exactly once, hashing it on the
+way, and every consumer (job queue, storage upload, PDF/image parsing)
+reads from that file or a zero-copy mmap view of it. Peak memory per
+upload stays around one read buffer instead of several full copies.
+"""
+
+import hashlib
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional
+
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from .config import get_settings
+
+settings = get_settings()
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+PDF_CONTENT_TYPE = "application/pdf"
+IMAGE_CONTENT_TYPES = ["image/jpeg", "image/png", "image/webp"]
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when a spooled stream exceeds its size limit."""
+
+    def __init__(self, filename: Optional[str], max_bytes: int):
+        super().__init__(f"{filename or 'Upload'} is larger than {max_bytes} bytes")
+        self.filename = filename
+        self.max_bytes = max_bytes
+
+
+class SpooledUpload:
+    """
+    An upload stored in a local temp file, with its size and SHA-256.
+
+    Use it as a context manager (or call close()) to delete the file.
+    """
+
+    def __init__(self, path: str, size: int, sha256: str,
+                 filename: Optional[str] = None, content_type: Optional[str] = None):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type or "application/octet-stream"
+
+    @staticmethod
+    def _new_file(filename: Optional[str]):
+        suffix = os.path.splitext(filename or "")[1]
+        fd, path = tempfile.mkstemp(prefix="upload-", suffix=suffix, dir=settings.INGEST_SPOOL_DIR or None)
+        return os.fdopen(fd, "wb"), path
+
+    @classmethod
+    async def from_upload(cls, file: UploadFile, max_bytes: Optional[int] = None) -> "SpooledUpload":
+        """
+        Spool a request upload to disk in fixed-size reads, hashing as it goes.
+
+        Raises:
+            UploadTooLargeError: If the upload is longer than max_bytes
+        """
+        out, path = cls._new_file(file.filename)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with out:
+                await file.seek(0)
+                while True:
+                    block = await file.read(READ_CHUNK_SIZE)
+                    if not block:
+                        break
+                    size += len(block)
+                    if max_bytes is not None and size > max_bytes:
+                        raise UploadTooLargeError(file.filename, max_bytes)
+                    digest.update(block)
+                    out.write(block)
+        except BaseException:
+            os.unlink(path)
+            raise
+
+        return cls(path, size, digest.hexdigest(), file.filename, file.content_type)
+
+    @classmethod
+    def from_stream(cls, source: BinaryIO, filename: Optional[str] = None,
+                    content_type: Optional[str] = None, max_bytes: Optional[int] = None) -> "SpooledUpload":
+        """
+        Spool a blocking binary stream (e.g. an archive member) to disk, hashing as it goes.
+
+        Raises:
+            UploadTooLargeError: If the stream is longer than max_bytes
+        """
+        out, path = cls._new_file(filename)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with out:
+                for block in iter(lambda: source.read(READ_CHUNK_SIZE), b""):
+                    size += len(block)
+                    if max_bytes is not None and size > max_bytes:
+                        raise UploadTooLargeError(filename, max_bytes)
+                    digest.update(block)
+                    out.write(block)
+        except BaseException:
+            os.unlink(path)
+            raise
+
+        return cls(path, size, digest.hexdigest(), filename, content_type)
+
+    @classmethod
+    def from_bytes(cls, content: bytes, filename: Optional[str] = None,
+                   content_type: Optional[str] = None, sha256: Optional[str] = None) -> "SpooledUpload":
+        """Spool bytes already in memory (e.g. a queued job payload) to disk."""
+        out, path = cls._new_file(filename)
+        try:
+            with out:
+                out.write(content)
+        except BaseException:
+            os.unlink(path)
+            raise
+
+        return cls(path, len(content), sha256 or hashlib.sha256(content).hexdigest(), filename, content_type)
+
+    def open(self) -> BinaryIO:
+        """Open a new read handle, so concurrent readers don't share a cursor."""
+        return open(self.path, "rb")
+
+    @contextmanager
+    def as_upload_file(self) -> Iterator[UploadFile]:
+        """Wrap a new read handle in an UploadFile for services that expect one."""
+        with self.open() as f:
+            yield UploadFile(
+                file=f,
+                size=self.size,
+                filename=self.filename,
+                headers=Headers({"content-type": self.content_type})
+            )
+
+    @contextmanager
+    def view(self) -> Iterator[memoryview]:
+        """Zero-copy, read-only memoryview of the file contents (mmap-backed)."""
+        if self.size == 0:
+            yield memoryview(b"")
+            return
+
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = memoryview(mapped)
+            try:
+                yield data
+            finally:
+                data.release()
+
+    def close(self) -> None:
+        """Delete the spooled file."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -6,6 +6,8 @@ from firebase_admin import credentials
 
 from .core.config import get_settings
 from .core.database import init_db
+from .services.job_worker import start_workers, stop_workers
+from .services.processing_service import processing_service
 
 settings = get_settings()
 
@@ -21,7 +23,13 @@ async def lifespan(app: FastAPI):
     # Initialize DB
     init_db()
     
+    # Start background ingestion workers
+    workers = start_workers()
+    
     yield
+    
+    await stop_workers(workers)
+    processing_service.shutdown()
 
 from .routers import ingest, vector
 
@@ -0,0 +1,69 @@
+"""
+One-off migration of knowledge graphs saved with random document ids.
+
+    python -m app.migrate_graph --user-id <firebase_uid>
+    python -m app.migrate_graph --all
+
+Entity and relation documents used to get uuid4 ids; they are now keyed by
+a hash of the normalized name or triple (see services/firestore_service.py),
+so a name saved both before and after the change has two documents, and
+/graph/me lists it twice. This folds every old document's counter into
+the hashed one, deletes the old document, then rebuilds the user's graph
+snapshot and schedules a new graph analysis. Running it again is a no-op.
+"""
+
+import argparse
+import asyncio
+from typing import List, Optional
+
+import firebase_admin
+from firebase_admin import credentials
+
+from .core.config import get_settings
+from .services.firestore_service import firestore_service
+from .services.graph_analysis import graph_analysis_service
+from .services.graph_snapshot import graph_snapshot_service
+
+settings = get_settings()
+
+
+async def migrate_user(user_id: str) -> bool:
+    """Fold one user's old graph documents; True if there were any."""
+    folded = await firestore_service.fold_legacy_graph(user_id)
+    if not folded["entities"] and not folded["relations"]:
+        return False
+    await graph_snapshot_service.rebuild(user_id)
+    await graph_analysis_service.schedule(user_id)
+    print(f"♻️ Folded {folded['entities']} entities and {folded['relations']} relations for {user_id}")
+    return True
+
+
+async def migrate(user_ids: Optional[List[str]] = None) -> int:
+    """Migrate the given users (default: every user with a graph); returns how many changed."""
+    if user_ids is None:
+        user_ids = await firestore_service.graph_user_ids()
+    migrated = 0
+    for user_id in user_ids:
+        migrated += await migrate_user(user_id)
+    print(f"✅ Graph migration finished: {migrated} of {len(user_ids)} users had old documents")
+    return migrated
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.migrate_graph",
+                                     description="Fold old random-id graph documents into their hashed ids.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--user-id", action="append", help="Firebase user id to migrate (repeatable)")
+    target.add_argument("--all", action="store_true", help="Migrate every user with a graph")
+    args = parser.parse_args(argv)
+
+    # Firestore uses the Admin SDK's service credentials; no user auth
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(settings.FIREBASE_CREDENTIALS))
+
+    asyncio.run(migrate(None if args.all else args.user_id))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
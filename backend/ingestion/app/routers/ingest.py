@@ -3,24 +3,44 @@ Ingestion API Router.
 
 Provides endpoints for ingesting text, PDFs, and images.
 All endpoints require Firebase Auth and include user_id isolation.
+
+PDF and image uploads are queued as background jobs: the endpoint stores
+the file in the job queue and returns 202 with a job id, and progress is
+available from GET /ingest/jobs/{job_id}.
+
+POST /ingest/text/stream ingests very large text from a streamed
+(text/plain or NDJSON) body, indexing chunks while the body arrives.
+
+POST /ingest/batch takes many files, or zip/tar archives of them, in one
+request and returns a per-file report.
+
+Uploads are idempotent: retries of the same content (or with the same
+Idempotency-Key header) reuse the previous job or result instead of
+re-ingesting.
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+import asyncio
+
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Header, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from sqlalchemy.orm import Session
 
+from ..core.config import get_settings
 from ..core.database import get_db
 from ..core.auth import get_current_user
-from ..services.embedding_service import embedding_service
-from ..services.storage_service import storage_service
-from ..services.processing_service import processing_service
-from ..services.graph_service import graph_extraction_service
+from ..core.uploads import SpooledUpload, UploadTooLargeError, PDF_CONTENT_TYPE, IMAGE_CONTENT_TYPES
+from ..services.batch_ingest import ingest_batch
 from ..services.firestore_service import firestore_service
-from ..services.rag_client import rag_client
+from ..services.idempotency_service import idempotency_service
+from ..services.ingestion_pipeline import process_text, process_text_stream, IngestionError
+from ..services.job_queue import job_queue
+from ..services.text_stream import TextStream
 
 
+settings = get_settings()
+
 router = APIRouter(
     prefix="/ingest",
     tags=["Ingestion"]
@@ -28,7 +48,6 @@ router = APIRouter(
 
 security = HTTPBearer()
 
-
 class TextInput(BaseModel):
     text: str
     metadata: Optional[dict] = {}
@@ -39,9 +58,52 @@ class FileUrlInput(BaseModel):
     metadata: Optional[dict] = {}
 
 
+def _job_response(job: dict, response: Response) -> dict:
+    """Format a job for the client; finished duplicates are returned as 200."""
+    if job["status"] == "succeeded":
+        response.status_code = status.HTTP_200_OK
+
+    body = {
+        "status": job["status"],
+        "job_id": job["job_id"],
+        "status_url": f"/ingest/jobs/{job['job_id']}",
+        "message": "File accepted for ingestion"
+    }
+    if job.get("deduplicated"):
+        body["deduplicated"] = True
+        body["message"] = "File was already submitted for ingestion"
+    if job["status"] == "succeeded":
+        body["result"] = job["result"]
+    return body
+
+
+async def _enqueue_upload(user_id: str, kind: str, file: UploadFile,
+                          idempotency_key: Optional[str]) -> dict:
+    """Spool an upload to disk once (hashing it on the way) and add it to the job queue."""
+    try:
+        spooled = await SpooledUpload.from_upload(file, max_bytes=settings.INGEST_UPLOAD_MAX_BYTES)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    with spooled:
+        # The queue links the spooled file and only stores its path in the row
+        return await asyncio.to_thread(
+            job_queue.enqueue,
+            user_id=user_id,
+            kind=kind,
+            payload=None,
+            upload=spooled,
+            content_hash=spooled.sha256,
+            filename=file.filename,
+            content_type=file.content_type,
+            idempotency_key=idempotency_key
+        )
+
+
 @router.post("/text")
 async def ingest_text(
     input: TextInput,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ):
@@ -52,245 +114,114 @@ async def ingest_text(
     try:
         # Get user_id from Firebase token
         user_id = await get_current_user(credentials)
-        
-        # 1. Chunk text with overlap
-        chunks = embedding_service.chunk_text(input.text)
-        
-        # 2. Process each chunk
-        processed_chunks = []
-        for chunk_text in chunks:
-            # Generate embedding
-            embedding = await embedding_service.generate_embedding(chunk_text)
-            
-            # Send to rag_service
-            metadata = {
-                **input.metadata,
-                "type": "text",
-                "source": "text_input"
-            }
-            
-            result = await rag_client.insert_chunk(
-                user_id=user_id,
-                text=chunk_text,
-                embedding=embedding,
-                metadata=metadata
+
+        content_hash = idempotency_service.hash_content(input.text.encode("utf-8"))
+        return await idempotency_service.run_once(
+            user_id,
+            content_hash,
+            lambda: process_text(user_id, input.text, input.metadata),
+            idempotency_key=idempotency_key
+        )
+
+    except HTTPException:
+        raise
+    except IngestionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/text/stream")
+async def ingest_text_stream(
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Ingest a large text document streamed as the request body (text/plain or NDJSON).
+    Chunks are embedded and indexed while the body is still being received.
+    """
+    try:
+        # Get user_id from Firebase token
+        user_id = await get_current_user(credentials)
+
+        content_type = request.headers.get("content-type")
+        if not TextStream.supports(content_type):
+            raise HTTPException(
+                status_code=415,
+                detail="Body must be text/plain or application/x-ndjson"
             )
-            processed_chunks.append(result)
-        
-        # 3. Extract knowledge graph
-        graph_data = await graph_extraction_service.extract_from_chunks(chunks)
-        
-        # 4. Save to Firestore
-        if graph_data["entities"]:
-            await firestore_service.save_entities(user_id, graph_data["entities"])
-        if graph_data["relations"]:
-            await firestore_service.save_relations(user_id, graph_data["relations"])
-        
-        return {
-            "status": "success",
-            "user_id": user_id,
-            "chunks_processed": len(processed_chunks),
-            "entities_extracted": len(graph_data["entities"]),
-            "relations_extracted": len(graph_data["relations"]),
-            "message": "Text successfully ingested and indexed"
-        }
-        
+
+        # The text hash is only known once the body is read; until then
+        # retries are matched by Idempotency-Key only
+        async def process(check):
+            stream = TextStream(request.stream(), content_type)
+            return await process_text_stream(
+                user_id,
+                stream,
+                check_duplicate=lambda: check(stream.sha256)
+            )
+
+        return await idempotency_service.run_once_streamed(user_id, process, idempotency_key=idempotency_key)
+
+    except HTTPException:
+        raise
+    except IngestionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/pdf")
+@router.post("/pdf", status_code=status.HTTP_202_ACCEPTED)
 async def ingest_pdf(
+    response: Response,
     file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ):
     """
-    Upload PDF, extract text, chunk, embed, and index.
+    Accept a PDF for background ingestion (extract text, chunk, embed, and index).
     """
     try:
         # Get user_id from Firebase token
         user_id = await get_current_user(credentials)
-        
+
         # Validate file type
-        if file.content_type != "application/pdf":
+        if file.content_type != PDF_CONTENT_TYPE:
             raise HTTPException(status_code=400, detail="File must be a PDF")
-        
-        # 1. Upload to Firebase Storage
-        file_url = await storage_service.upload_file(file, folder=f"pdfs/{user_id}")
-        
-        # 2. Extract text from PDF
-        text = await processing_service.extract_text_from_pdf(file)
-        
-        if not text or len(text.strip()) < 10:
-            raise HTTPException(status_code=400, detail="Could not extract text from PDF")
-        
-        # 3. Chunk text
-        chunks = embedding_service.chunk_text(text)
-        
-        # 4. Process each chunk
-        processed_chunks = []
-        for chunk_text in chunks:
-            embedding = await embedding_service.generate_embedding(chunk_text)
-            
-            metadata = {
-                "type": "pdf",
-                "source": file.filename,
-                "file_url": file_url
-            }
-            
-            result = await rag_client.insert_chunk(
-                user_id=user_id,
-                text=chunk_text,
-                embedding=embedding,
-                metadata=metadata
-            )
-            processed_chunks.append(result)
-        
-        # 5. Extract knowledge graph
-        graph_data = await graph_extraction_service.extract_from_chunks(chunks)
-        
-        # 6. Save to Firestore
-        if graph_data["entities"]:
-            await firestore_service.save_entities(user_id, graph_data["entities"])
-        if graph_data["relations"]:
-            await firestore_service.save_relations(user_id, graph_data["relations"])
-        
-        # 7. Generate Summary
-        summary = await processing_service.summarize_text(text)
-
-        # Index summary as a special chunk for high-level retrieval
-        summary_embedding = await embedding_service.generate_embedding(f"Summary of {file.filename}: {summary}")
-        await rag_client.insert_chunk(
-            user_id=user_id,
-            text=f"Document Summary for {file.filename}:\n{summary}",
-            embedding=summary_embedding,
-            metadata={
-                "type": "summary",
-                "source": file.filename,
-                "file_url": file_url,
-                "is_summary": True
-            }
-        )
 
-        # 8. Save document metadata
-        await firestore_service.save_document_metadata(
-            user_id=user_id,
-            filename=file.filename,
-            file_url=file_url,
-            file_type="pdf",
-            chunks_count=len(chunks),
-            summary=summary
-        )
-        
-        return {
-            "status": "success",
-            "user_id": user_id,
-            "file_url": file_url,
-            "chunks_processed": len(processed_chunks),
-            "entities_extracted": len(graph_data["entities"]),
-            "relations_extracted": len(graph_data["relations"]),
-            "message": "PDF processed and indexed"
-        }
-        
+        job = await _enqueue_upload(user_id, "pdf", file, idempotency_key)
+        return _job_response(job, response)
+
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/image")
+@router.post("/image", status_code=status.HTTP_202_ACCEPTED)
 async def ingest_image(
+    response: Response,
     file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ):
     """
-    Upload image, OCR with Gemini Vision, chunk, embed, and index.
+    Accept an image for background ingestion (OCR with Gemini Vision, chunk, embed, and index).
     """
     try:
         # Get user_id from Firebase token
         user_id = await get_current_user(credentials)
-        
+
         # Validate file type
-        if file.content_type not in ["image/jpeg", "image/png", "image/webp"]:
+        if file.content_type not in IMAGE_CONTENT_TYPES:
             raise HTTPException(status_code=400, detail="File must be JPEG, PNG, or WebP image")
-        
-        # 1. Upload to Firebase Storage
-        file_url = await storage_service.upload_file(file, folder=f"images/{user_id}")
-        
-        # 2. Extract text using Gemini Vision OCR
-        text = await processing_service.extract_text_from_image(file)
-        
-        if not text or len(text.strip()) < 5:
-            # Still save image reference even without OCR text
-            await firestore_service.save_document_metadata(
-                user_id=user_id,
-                filename=file.filename,
-                file_url=file_url,
-                file_type="image",
-                chunks_count=0
-            )
-            return {
-                "status": "success",
-                "user_id": user_id,
-                "file_url": file_url,
-                "chunks_processed": 0,
-                "message": "Image uploaded but no text could be extracted"
-            }
-        
-        # 3. Chunk text
-        chunks = embedding_service.chunk_text(text)
-        
-        # 4. Process each chunk
-        processed_chunks = []
-        for chunk_text in chunks:
-            embedding = await embedding_service.generate_embedding(chunk_text)
-            
-            # Image chunks have special metadata for UI display
-            metadata = {
-                "type": "image",
-                "source": file.filename,
-                "file_url": file_url,
-                "image_url": file_url  # For RAG response
-            }
-            
-            result = await rag_client.insert_chunk(
-                user_id=user_id,
-                text=chunk_text,
-                embedding=embedding,
-                metadata=metadata
-            )
-            processed_chunks.append(result)
-        
-        # 5. Extract knowledge graph
-        graph_data = await graph_extraction_service.extract_from_chunks(chunks)
-        
-        # 6. Save to Firestore
-        if graph_data["entities"]:
-            await firestore_service.save_entities(user_id, graph_data["entities"])
-        if graph_data["relations"]:
-            await firestore_service.save_relations(user_id, graph_data["relations"])
-        
-        # 7. Save document metadata
-        await firestore_service.save_document_metadata(
-            user_id=user_id,
-            filename=file.filename,
-            file_url=file_url,
-            file_type="image",
-            chunks_count=len(chunks)
-        )
-        
-        return {
-            "status": "success",
-            "user_id": user_id,
-            "file_url": file_url,
-            "chunks_processed": len(processed_chunks),
-            "entities_extracted": len(graph_data["entities"]),
-            "relations_extracted": len(graph_data["relations"]),
-            "message": "Image processed with OCR and indexed"
-        }
-        
+
+        job = await _enqueue_upload(user_id, "image", file, idempotency_key)
+        return _job_response(job, response)
+
     except HTTPException:
         raise
     except Exception as e:
@@ -298,23 +229,63 @@ async def ingest_image(
 
 
 # Keep legacy endpoint for backwards compatibility
-@router.post("/upload")
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_file_legacy(
+    response: Response,
     file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ):
     """
     Legacy endpoint - routes to appropriate handler based on file type.
     """
-    if file.content_type == "application/pdf":
-        return await ingest_pdf(file, credentials, db)
-    elif file.content_type in ["image/jpeg", "image/png", "image/webp"]:
-        return await ingest_image(file, credentials, db)
+    if file.content_type == PDF_CONTENT_TYPE:
+        return await ingest_pdf(response, file, idempotency_key, credentials, db)
+    elif file.content_type in IMAGE_CONTENT_TYPES:
+        return await ingest_image(response, file, idempotency_key, credentials, db)
     else:
         raise HTTPException(status_code=400, detail="Unsupported file type. Use PDF or image (JPEG/PNG/WebP)")
 
 
+@router.post("/batch", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_batch_upload(
+    files: List[UploadFile] = File(...),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Accept many PDFs/images, or zip/tar archives of them, for background ingestion.
+    Archive members are extracted and deduplicated, and each file gets its own job.
+    """
+    try:
+        # Verified once for the whole batch
+        user_id = await get_current_user(credentials)
+        return await ingest_batch(user_id, files)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Get status, per-stage progress and result of an ingestion job.
+    """
+    user_id = await get_current_user(credentials)
+
+    job = await asyncio.to_thread(job_queue.get, job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job.pop("user_id", None)
+    return job
+
+
 @router.get("/documents")
 async def list_documents(
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -329,4 +300,3 @@ async def list_documents(
         return {"documents": documents}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
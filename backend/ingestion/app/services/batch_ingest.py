@@ -0,0 +1,261 @@
+"""
+Batch and archive ingestion.
+
+POST /ingest/batch accepts many files in one request (verifying the
+Firebase token once). Each file may be a PDF, an image, or a zip/tar
+archive whose members are stream-extracted one at a time: every file and
+member is spooled to disk with a size limit, hashed, deduplicated against the rest
+of the batch and the user's previous uploads, and queued as a normal
+ingestion job. Members are never all held in memory, and processing is
+bounded by the job worker and chunk pool limits like any other upload.
+
+The result is a per-file report; a corrupt archive or member, or a file
+that could not be queued, is reported as failed instead of failing the
+whole batch. The batch size limit counts the files that are queued, so
+archives count by their extracted members.
+"""
+
+import asyncio
+import mimetypes
+import os
+import tarfile
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import UploadFile
+
+from ..core.config import get_settings
+from ..core.uploads import SpooledUpload, UploadTooLargeError, PDF_CONTENT_TYPE, IMAGE_CONTENT_TYPES
+from .job_queue import job_queue
+
+settings = get_settings()
+
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+TAR_CONTENT_TYPES = {"application/x-tar", "application/gzip", "application/x-gzip",
+                     "application/x-gtar", "application/x-bzip2", "application/x-xz"}
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+def detect_kind(filename: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    """
+    Classify a file as "pdf", "image", "zip" or "tar".
+
+    The declared content type wins; generic types (or none, for archive
+    members) fall back to the filename extension.
+
+    Returns:
+        The kind, or None if the file type is unsupported
+    """
+    name = (filename or "").lower()
+    if not content_type or content_type == "application/octet-stream":
+        content_type = mimetypes.guess_type(name)[0]
+
+    if content_type == PDF_CONTENT_TYPE:
+        return "pdf"
+    if content_type in IMAGE_CONTENT_TYPES:
+        return "image"
+    if content_type in ZIP_CONTENT_TYPES or name.endswith(".zip"):
+        return "zip"
+    if content_type in TAR_CONTENT_TYPES or name.endswith(TAR_SUFFIXES):
+        return "tar"
+    return None
+
+
+def _is_hidden(path: str) -> bool:
+    """OS metadata entries (__MACOSX/, .DS_Store, ._resource forks) aren't user files."""
+    parts = path.replace("\\", "/").split("/")
+    return "__MACOSX" in parts or any(part.startswith(".") for part in parts if part)
+
+
+class BatchIngestion:
+    """State of one batch request: the report, seen hashes and byte budget."""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.files: List[Dict[str, Any]] = []
+        self.truncated = False
+        self._seen: Dict[str, str] = {}
+        self._total_bytes = 0
+
+    @property
+    def full(self) -> bool:
+        return len(self.files) >= settings.INGEST_BATCH_MAX_FILES
+
+    @property
+    def remaining_bytes(self) -> int:
+        return settings.INGEST_BATCH_MAX_TOTAL_BYTES - self._total_bytes
+
+    def _add(self, filename: Optional[str], status: str, archive: Optional[str] = None, **details: Any) -> None:
+        entry = {"filename": filename, "status": status}
+        if archive is not None:
+            entry["archive"] = archive
+        entry.update(details)
+        self.files.append(entry)
+
+    def _enqueue(self, spooled: SpooledUpload, kind: str, archive: Optional[str] = None,
+                 name: Optional[str] = None) -> None:
+        """Queue a spooled file as an ingestion job (blocking), unless it repeats this batch."""
+        name = name or spooled.filename
+        first = self._seen.get(spooled.sha256)
+        if first is not None:
+            self._add(name, "duplicate", archive, reason=f"Same content as {first}")
+            return
+        self._seen[spooled.sha256] = name
+
+        try:
+            job = job_queue.enqueue(
+                user_id=self.user_id,
+                kind=kind,
+                payload=None,
+                upload=spooled,
+                content_hash=spooled.sha256,
+                filename=spooled.filename,
+                content_type=spooled.content_type
+            )
+        except Exception as e:
+            print(f"❌ Could not queue {name} for {self.user_id}: {e}")
+            # A later copy in this batch may still be queued
+            del self._seen[spooled.sha256]
+            self._add(name, "failed", archive, reason=f"Could not queue file: {e}")
+            return
+
+        self._add(
+            name,
+            "deduplicated" if job.get("deduplicated") else "queued",
+            archive,
+            job_id=job["job_id"],
+            job_status=job["status"],
+            status_url=f"/ingest/jobs/{job['job_id']}"
+        )
+
+    @staticmethod
+    def _zip_members(path: str) -> Iterator[Tuple[str, int, Any]]:
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, lambda info=info: archive.open(info)
+
+    @staticmethod
+    def _tar_members(path: str) -> Iterator[Tuple[str, int, Any]]:
+        with tarfile.open(path, mode="r:*") as archive:
+            for member in archive:
+                # Links and devices are skipped; nothing is ever written to member paths
+                if member.isfile():
+                    yield member.name, member.size, lambda member=member: archive.extractfile(member)
+
+    def add_archive(self, archive: SpooledUpload, kind: str) -> None:
+        """
+        Stream-extract an archive and queue its supported members (blocking).
+
+        Args:
+            archive: The spooled archive
+            kind: "zip" or "tar"
+        """
+        members = self._zip_members(archive.path) if kind == "zip" else self._tar_members(archive.path)
+        try:
+            for name, declared_size, open_member in members:
+                if _is_hidden(name):
+                    continue
+                if self.full:
+                    self.truncated = True
+                    return
+                self._add_member(archive.filename, name, declared_size, open_member)
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+            self._add(archive.filename, "failed", reason=f"Corrupt or unreadable archive: {e}")
+
+    def _add_member(self, archive_name: str, name: str, declared_size: int, open_member) -> None:
+        filename = os.path.basename(name)
+        content_type = mimetypes.guess_type(filename)[0]
+        kind = detect_kind(filename, content_type)
+
+        if kind in ("zip", "tar"):
+            self._add(name, "skipped", archive_name, reason="Nested archives are not supported")
+            return
+        if kind is None:
+            self._add(name, "skipped", archive_name, reason="Unsupported file type")
+            return
+
+        max_bytes = min(settings.INGEST_BATCH_MAX_FILE_BYTES, self.remaining_bytes)
+        # Headers can lie, so the limit is also enforced while extracting
+        if declared_size > max_bytes:
+            self._add(name, "skipped", archive_name, reason=f"File is larger than {max_bytes} bytes")
+            return
+
+        try:
+            with open_member() as source:
+                spooled = SpooledUpload.from_stream(source, filename, content_type, max_bytes=max_bytes)
+        except UploadTooLargeError as e:
+            self._add(name, "skipped", archive_name, reason=str(e))
+            return
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError, RuntimeError, NotImplementedError) as e:
+            # CRC mismatch, truncated data, encrypted or unsupported compression
+            self._add(name, "failed", archive_name, reason=f"Could not extract file: {e}")
+            return
+
+        with spooled:
+            self._total_bytes += spooled.size
+            self._enqueue(spooled, kind, archive_name, name)
+
+    async def add_upload(self, file: UploadFile) -> None:
+        """Spool one uploaded file and queue it, or its members if it is an archive."""
+        if self.full:
+            self.truncated = True
+            return
+
+        kind = detect_kind(file.filename, file.content_type)
+        if kind is None:
+            self._add(file.filename, "skipped", reason="Unsupported file type")
+            return
+
+        if self.remaining_bytes <= 0:
+            self._add(file.filename, "skipped", reason="Batch size limit reached")
+            return
+
+        archive = kind in ("zip", "tar")
+        # Limits are enforced while spooling, so an oversized upload never
+        # lands on disk in full. Archives aren't held to the per-file limit:
+        # their members are, as they are extracted.
+        max_bytes = min(settings.INGEST_UPLOAD_MAX_BYTES, self.remaining_bytes)
+        if not archive:
+            max_bytes = min(max_bytes, settings.INGEST_BATCH_MAX_FILE_BYTES)
+        try:
+            spooled = await SpooledUpload.from_upload(file, max_bytes=max_bytes)
+        except UploadTooLargeError as e:
+            self._add(file.filename, "skipped", reason=str(e))
+            return
+
+        with spooled:
+            if archive:
+                # Members count against the batch limit as they are extracted
+                await asyncio.to_thread(self.add_archive, spooled, kind)
+                return
+
+            self._total_bytes += spooled.size
+            await asyncio.to_thread(self._enqueue, spooled, kind)
+
+    def report(self) -> Dict[str, Any]:
+        """Per-file results with counts by status."""
+        summary: Dict[str, int] = {}
+        for entry in self.files:
+            summary[entry["status"]] = summary.get(entry["status"], 0) + 1
+        return {"files": self.files, "summary": summary, "truncated": self.truncated}
+
+
+async def ingest_batch(user_id: str, files: List[UploadFile]) -> Dict[str, Any]:
+    """
+    Queue a batch of uploaded files and archives for ingestion.
+
+    Args:
+        user_id: Owner of the uploads
+        files: PDFs, images, and zip/tar archives of them
+
+    Returns:
+        Report with one entry per file or archive member
+    """
+    batch = BatchIngestion(user_id)
+    for file in files:
+        await batch.add_upload(file)
+
+    report = batch.report()
+    print(f"📦 Batch for {user_id}: {report['summary']}")
+    return report
@@ -0,0 +1,101 @@
+"""
+Persistent key-value cache in Postgres.
+
+Expensive, deterministic results (e.g. OCR text) are stored in the
+`cache_entries` table under a namespace, so they survive restarts and are
+shared by all service replicas. Cache failures are logged and treated as
+misses; they never fail the caller.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy.exc import IntegrityError
+
+from ..core.database import SessionLocal, CacheEntry
+
+# Keys per query in bulk reads, to keep IN lists reasonable
+BULK_KEYS = 500
+
+
+class PersistentCache:
+    def __init__(self, namespace: str, session_factory=SessionLocal):
+        self.namespace = namespace
+        self._session_factory = session_factory
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._session_factory() as db:
+            entry = db.get(CacheEntry, (self.namespace, key))
+            return None if entry is None else entry.value
+
+    def _set(self, key: str, value: Any) -> None:
+        with self._session_factory() as db:
+            db.merge(CacheEntry(namespace=self.namespace, key=key, value=value, created_at=datetime.utcnow()))
+            try:
+                db.commit()
+            except IntegrityError:
+                # A concurrent writer stored the same key first
+                db.rollback()
+
+    def _get_many(self, keys: List[str]) -> Dict[str, Any]:
+        found = {}
+        with self._session_factory() as db:
+            for start in range(0, len(keys), BULK_KEYS):
+                entries = db.query(CacheEntry).filter(
+                    CacheEntry.namespace == self.namespace,
+                    CacheEntry.key.in_(keys[start:start + BULK_KEYS])
+                )
+                found.update((entry.key, entry.value) for entry in entries)
+        return found
+
+    def _set_many(self, values: Dict[str, Any]) -> None:
+        with self._session_factory() as db:
+            now = datetime.utcnow()
+            for key, value in values.items():
+                db.merge(CacheEntry(namespace=self.namespace, key=key, value=value, created_at=now))
+            try:
+                db.commit()
+            except IntegrityError:
+                # A concurrent writer stored some of the keys first; store the rest one by one
+                db.rollback()
+                for key, value in values.items():
+                    self._set(key, value)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Get a cached value, or None on a miss."""
+        try:
+            return await asyncio.to_thread(self._get, key)
+        except Exception as e:
+            print(f"⚠️ Cache '{self.namespace}' read failed: {e}")
+            return None
+
+    async def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value."""
+        try:
+            await asyncio.to_thread(self._set, key, value)
+        except Exception as e:
+            print(f"⚠️ Cache '{self.namespace}' write failed: {e}")
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Get cached values for many keys in one round trip; misses are left out."""
+        if not keys:
+            return {}
+        try:
+            return await asyncio.to_thread(self._get_many, keys)
+        except Exception as e:
+            print(f"⚠️ Cache '{self.namespace}' read failed: {e}")
+            return {}
+
+    async def set_many(self, values: Dict[str, Any]) -> None:
+        """Store many JSON-serializable values in one transaction."""
+        if not values:
+            return
+        try:
+            await asyncio.to_thread(self._set_many, values)
+        except Exception as e:
+            print(f"⚠️ Cache '{self.namespace}' write failed: {e}")
+
+
+ocr_cache = PersistentCache("ocr")
+summary_cache = PersistentCache("summary")
+graph_cache = PersistentCache("graph")
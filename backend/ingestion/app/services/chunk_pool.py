@@ -0,0 +1,131 @@
+"""
+Bounded-concurrency worker pool for per-chunk ingestion work.
+
+Each chunk is embedded and inserted by one of a fixed number of workers,
+so embedding calls for some chunks overlap vector inserts for others.
+Concurrency is capped per request (INGEST_CHUNK_CONCURRENCY) and across
+the whole service (INGEST_GLOBAL_CHUNK_CONCURRENCY), so a single large
+document can't monopolize the embedding API or rag_service.
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Sequence
+
+from ..core.config import get_settings
+
+settings = get_settings()
+
+
+ChunkWorker = Callable[[int, Any], Awaitable[Any]]
+DoneCallback = Callable[[int], Awaitable[None]]
+
+
+class ChunkPool:
+    def __init__(self, per_request_limit: int, global_limit: int):
+        self.per_request_limit = max(1, per_request_limit)
+        self._global_slots = asyncio.Semaphore(max(1, global_limit))
+
+    async def map(
+        self,
+        items: Sequence[Any],
+        worker: ChunkWorker,
+        limit: Optional[int] = None,
+        on_done: Optional[DoneCallback] = None
+    ) -> List[Any]:
+        """
+        Run `worker(index, item)` for every item with bounded concurrency.
+
+        If any call fails, the remaining work is cancelled and the error
+        is raised.
+
+        Args:
+            items: Chunks to process
+            worker: Coroutine function called with the chunk index and chunk
+            limit: Per-request concurrency (defaults to INGEST_CHUNK_CONCURRENCY)
+            on_done: Optional callback called with the number of finished chunks
+
+        Returns:
+            Worker results in the same order as `items`
+        """
+        results: List[Any] = [None] * len(items)
+        if not items:
+            return results
+
+        pending = iter(enumerate(items))
+        done = 0
+
+        async def run_worker():
+            nonlocal done
+            # Workers share one iterator, so each item is taken exactly once
+            for index, item in pending:
+                async with self._global_slots:
+                    results[index] = await worker(index, item)
+                done += 1
+                if on_done is not None:
+                    await on_done(done)
+
+        await self._run_workers(run_worker, min(limit or self.per_request_limit, len(items)))
+        return results
+
+    async def map_stream(
+        self,
+        items: AsyncIterator[Any],
+        worker: ChunkWorker,
+        limit: Optional[int] = None,
+        on_done: Optional[DoneCallback] = None
+    ) -> int:
+        """
+        Like map(), for items produced while they are being processed
+        (e.g. chunks cut from a request body that is still arriving).
+
+        An item is only pulled when a worker is free, so slow embedding
+        applies backpressure to the producer and at most `limit` items are
+        in flight. Worker results are discarded.
+
+        Returns:
+            Number of items processed
+        """
+        pull_lock = asyncio.Lock()
+        next_index = 0
+        done = 0
+
+        async def next_item():
+            nonlocal next_index
+            # Async iterators can't be advanced concurrently
+            async with pull_lock:
+                try:
+                    item = await items.__anext__()
+                except StopAsyncIteration:
+                    return None
+                next_index += 1
+                return next_index - 1, item
+
+        async def run_worker():
+            nonlocal done
+            while (entry := await next_item()) is not None:
+                async with self._global_slots:
+                    await worker(*entry)
+                done += 1
+                if on_done is not None:
+                    await on_done(done)
+
+        await self._run_workers(run_worker, limit or self.per_request_limit)
+        return done
+
+    @staticmethod
+    async def _run_workers(run_worker: Callable[[], Awaitable[None]], worker_count: int) -> None:
+        """Run worker_count copies of run_worker; on error, cancel the rest and re-raise."""
+        tasks = [asyncio.create_task(run_worker()) for _ in range(worker_count)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+
+chunk_pool = ChunkPool(
+    per_request_limit=settings.INGEST_CHUNK_CONCURRENCY,
+    global_limit=settings.INGEST_GLOBAL_CHUNK_CONCURRENCY
+)
@@ -0,0 +1,286 @@
+"""
+Token-aware text chunking.
+
+Chunks hold at most CHUNK_MAX_TOKENS tokens, so they fit the embedding
+model's input the same way for English, Russian, Kazakh or Chinese text.
+A chunk ends at a sentence end in its second half, otherwise at a space,
+otherwise anywhere (unspaced CJK text). The next chunk starts after the
+first sentence end of the same kind within the last CHUNK_OVERLAP_TOKENS
+of the previous one, so overlap is whole sentences and unpunctuated text
+doesn't turn into a run of tiny overlapping slivers.
+
+Token counts are estimated without a tokenizer: CJK characters are about
+one token each, Cyrillic text about three characters per token and other
+text about four (estimate_tokens). Measuring every character's script
+costs more than the old character chunker spent on the whole text, so
+chunks are sized from the text at hand instead: pure-ASCII text gets
+four characters per token, text with no space or a 。 in a chunk's
+first CHUNK_MAX_TOKENS characters (CJK) one, and other spaced text
+(Cyrillic) three. Spaced CJK text without 。 (Korean, or CJK words in a
+Russian sentence) can therefore come out over the limit by the estimate.
+
+Sentence ends (. ! ? … followed by whitespace, CJK 。！？, blank lines)
+are only looked for where a chunk can end, one str.rfind per terminator
+until one is found, so the work per chunk is a handful of C-speed
+searches over that chunk (see benchmarks/chunker_benchmark.py).
+
+TextChunker is push-based: text can be fed in pieces (PDF pages, request
+body reads) and chunks come out as soon as they are complete, with only
+about one chunk of unchunked text held in memory. It is the default;
+CHUNKER=chars switches back to CharacterChunker, the original fixed-size
+character chunker on the same interface.
+"""
+
+import bisect
+import math
+from typing import Any, Dict, List, Optional
+
+from ..core.config import get_settings
+
+settings = get_settings()
+
+# Sentence terminators in the order they are tried, and whether they need
+# whitespace after them to end a sentence
+SPACED_ENDS = ((".", True), ("!", True), ("?", True), ("…", True), ("。", False), ("！", False), ("？", False),
+               ("\n\n", False))
+CJK_ENDS = SPACED_ENDS[4:7] + SPACED_ENDS[:4] + SPACED_ENDS[7:]
+
+# Characters per token of the sparsest text; a window this many times
+# CHUNK_MAX_TOKENS always holds at least a full chunk
+MAX_CHARS_PER_TOKEN = 4
+# Characters per token of spaced non-ASCII (Cyrillic) text
+ALPHABET_CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the embedding-model token count of text (linear, no tokenizer)."""
+    length = len(text)
+    # Count characters by UTF-8 width with two C-speed encodes: 2-byte
+    # characters (Cyrillic, accented Latin) add one byte each, 3-byte ones
+    # (CJK, also a few symbols) two
+    extra = len(text.encode("utf-8", "surrogatepass")) - length
+    if not extra:
+        return math.ceil(length / 4)
+    non_ascii = length - len(text.encode("ascii", "ignore"))
+    wide = max(extra - non_ascii, 0)
+    cyrillic = max(non_ascii - wide, 0)
+    return wide + math.ceil(cyrillic / 3 + (length - non_ascii) / 4)
+
+
+class TextChunker:
+    """
+    Incremental token-aware chunker.
+
+    Feed text with feed(), then call finish() once; both return the chunks
+    completed so far as dicts with 'text' (and 'page_start'/'page_end' when
+    pieces were fed with page numbers).
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None):
+        # Never exceed what the embedding model accepts
+        self.max_tokens = max(1, min(max_tokens or settings.CHUNK_MAX_TOKENS, settings.EMBED_MAX_INPUT_TOKENS))
+        self.overlap_tokens = max(0, min(
+            settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens,
+            self.max_tokens // 2
+        ))
+        self._window = self.max_tokens * MAX_CHARS_PER_TOKEN
+        # Unchunked text and the absolute document offset of its first character
+        self._buffer = ""
+        self._offset = 0
+        self._page_offsets: List[int] = []
+        self._page_numbers: List[int] = []
+
+    def _page_at(self, offset: int) -> int:
+        return self._page_numbers[max(bisect.bisect_right(self._page_offsets, offset) - 1, 0)]
+
+    def _make_chunk(self, start: int, end: int) -> Optional[Dict[str, Any]]:
+        """Chunk of buffer[start:end] with its pages, or None if it is blank."""
+        raw = self._buffer[start:end]
+        text = raw.strip()
+        if not text:
+            return None
+        chunk = {"text": text}
+        if self._page_numbers:
+            first = self._offset + start + len(raw) - len(raw.lstrip())
+            chunk["page_start"] = self._page_at(first)
+            chunk["page_end"] = self._page_at(first + len(text) - 1)
+        return chunk
+
+    def _drain(self, final: bool) -> List[Dict[str, Any]]:
+        """Cut every chunk that is complete, then forget the text before the next one."""
+        buffer = self._buffer
+        stop = len(buffer)
+        window = self._window
+        # Mid-stream, only cut once the text could hold a full chunk, so a
+        # chunk never depends on how the text was split into pieces
+        if not final and stop <= window:
+            return []
+
+        max_tokens, overlap_tokens = self.max_tokens, self.overlap_tokens
+        find, rfind = buffer.find, buffer.rfind
+        all_ascii = buffer.isascii()
+        pages = bool(self._page_numbers)
+        chunks = []
+        append = chunks.append
+        last = stop if final else stop - window
+        start = 0
+        # Chunk size, half of it, overlap and terminators by kind of text
+        overlap = overlap_tokens / max_tokens
+        dense = (max_tokens, max_tokens // 2, int(max_tokens * overlap), CJK_ENDS)
+        ascii_only = (window, window // 2, int(window * overlap), SPACED_ENDS)
+        chars = max_tokens * ALPHABET_CHARS_PER_TOKEN
+        alphabet = (chars, chars // 2, int(chars * overlap), SPACED_ENDS)
+        # Next space and next 。 at or after start (stop if there is none),
+        # found once per run of text rather than once per chunk
+        space = full_stop = -1
+        while start < last:
+            # Characters that fit the token limit, from this chunk's own text:
+            # text without spaces, or with CJK sentences, is counted as CJK
+            if all_ascii:
+                chars, half, overlap, ends = ascii_only
+            else:
+                if space < start:
+                    space = find(" ", start) % (stop + 1)
+                if space >= start + max_tokens:
+                    chars, half, overlap, ends = dense
+                else:
+                    if full_stop < start:
+                        full_stop = find("。", start) % (stop + 1)
+                    if full_stop < start + max_tokens:
+                        chars, half, overlap, ends = dense
+                    elif buffer[start] < "\x80" and buffer[start:start + window].isascii():
+                        chars, half, overlap, ends = ascii_only
+                    else:
+                        chars, half, overlap, ends = alphabet
+
+            limit = start + chars
+            if limit >= stop:
+                end = next_start = stop
+            else:
+                # Last sentence end in the second half, by terminator order;
+                # . ! ? … only count before whitespace
+                middle = limit - half
+                for mark, spaced in ends:
+                    position = rfind(mark, middle, limit)
+                    while spaced and position != -1 and not buffer[position + 1].isspace():
+                        position = rfind(mark, middle, position)
+                    if position != -1:
+                        end = next_start = position + 1
+                        # Overlap: the next chunk starts after the first
+                        # sentence end of the same kind near this one's end
+                        if overlap:
+                            position = find(mark, end - overlap, end - 1)
+                            while spaced and position != -1 and not buffer[position + 1].isspace():
+                                position = find(mark, position + 1, end - 1)
+                            if position != -1:
+                                next_start = position + 1
+                        break
+                else:
+                    end = next_start = rfind(" ", middle, limit) + 1 or limit
+
+            if pages:
+                chunk = self._make_chunk(start, end)
+                if chunk is not None:
+                    append(chunk)
+            else:
+                text = buffer[start:end].strip()
+                if text:
+                    append({"text": text})
+            start = next_start
+
+        self._forget(start)
+        return chunks
+
+    def _forget(self, start: int) -> None:
+        """Drop the buffered text (and pages) before buffer index start."""
+        self._buffer = self._buffer[start:]
+        self._offset += start
+        if self._page_offsets:
+            keep_from = max(bisect.bisect_right(self._page_offsets, self._offset) - 1, 0)
+            del self._page_offsets[:keep_from]
+            del self._page_numbers[:keep_from]
+
+    def feed(self, text: str, page: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Add the next piece of the document and return newly completed chunks.
+
+        Args:
+            text: Next piece of text, of any size
+            page: Page number the piece belongs to, if pages are tracked
+        """
+        if not text:
+            return []
+        if page is not None:
+            self._page_offsets.append(self._offset + len(self._buffer))
+            self._page_numbers.append(page)
+        self._buffer += text
+        return self._drain(final=False)
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Flush the remaining chunks once all text has been fed."""
+        return self._drain(final=True)
+
+
+class CharacterChunker(TextChunker):
+    """
+    Incremental fixed-size character chunker (the original chunking).
+
+    A chunk is at most CHUNK_SIZE_CHARS characters and ends at the first
+    boundary found in its second half, in the order of BOUNDARIES; the
+    next chunk starts CHUNK_OVERLAP_CHARS before its end. Chunk sizes are
+    not token-aware.
+    """
+
+    BOUNDARIES = [". ", ".\n", "! ", "? ", "\n\n", "\n"]
+
+    def __init__(self, chunk_size: Optional[int] = None, overlap: Optional[int] = None):
+        super().__init__()
+        self.chunk_size = max(1, chunk_size or settings.CHUNK_SIZE_CHARS)
+        # Less than half a chunk, so every chunk moves the start forward
+        self.overlap = max(0, min(
+            settings.CHUNK_OVERLAP_CHARS if overlap is None else overlap,
+            self.chunk_size // 2 - 1
+        ))
+        self._window = self.chunk_size
+
+    def _drain(self, final: bool) -> List[Dict[str, Any]]:
+        buffer = self._buffer
+        stop = len(buffer)
+        size = self.chunk_size
+        chunks = []
+        start = 0
+        while start < stop and (final or stop - start > size):
+            end = stop
+            if stop - start > size:
+                low, end = start + size // 2, start + size
+                for boundary in self.BOUNDARIES:
+                    position = buffer.rfind(boundary, low, end)
+                    if position != -1:
+                        end = position + len(boundary)
+                        break
+            chunk = self._make_chunk(start, end)
+            if chunk is not None:
+                chunks.append(chunk)
+            start = stop if end >= stop else end - self.overlap
+
+        self._forget(start)
+        return chunks
+
+
+def make_chunker(max_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None) -> TextChunker:
+    """
+    Chunker selected by CHUNKER ("tokens" or "chars").
+
+    Explicit token sizes always get the token-aware chunker.
+    """
+    if max_tokens is None and overlap_tokens is None and settings.CHUNKER == "chars":
+        return CharacterChunker()
+    return TextChunker(max_tokens, overlap_tokens)
+
+
+def chunk_text(text: str, max_tokens: Optional[int] = None,
+               overlap_tokens: Optional[int] = None) -> List[str]:
+    """Split a whole text into chunks (see make_chunker)."""
+    chunker = make_chunker(max_tokens, overlap_tokens)
+    chunks = chunker.feed(text) + chunker.finish()
+    return [chunk["text"] for chunk in chunks]
@@ -1,6 +1,8 @@
+import asyncio
 import google.generativeai as genai
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from ..core.config import get_settings
+from .chunker import chunk_text, make_chunker
 
 settings = get_settings()
 
@@ -10,13 +12,71 @@ genai.configure(api_key=settings.GEMINI_API_KEY)
 class EmbeddingService:
     def __init__(self):
         self.model = settings.GEMINI_EMBEDDING_MODEL
+        # Micro-batching state: texts waiting for the next batched API call
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle = None
+        self._loop = None
+        self._batches = set()
 
     async def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for a single text chunk."""
+        """
+        Generate embedding for a single text chunk.
+
+        Concurrent calls (from every chunk worker, job and batch upload in
+        the process) are coalesced into one API request of up to
+        EMBED_BATCH_SIZE texts, waiting at most EMBED_BATCH_WAIT_MS for a
+        batch to fill.
+        """
+        if settings.EMBED_BATCH_SIZE <= 1:
+            return (await self._embed_batch([text]))[0]
+
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop, self._pending, self._flush_handle = loop, [], None
+
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= settings.EMBED_BATCH_SIZE:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(settings.EMBED_BATCH_WAIT_MS / 1000, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """Send the pending texts as one batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch = [(text, future) for text, future in self._pending if not future.cancelled()]
+        self._pending = []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
         try:
-            result = genai.embed_content(
+            embeddings = await self._embed_batch([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed several texts in one API request."""
+        try:
+            # The Gemini SDK call is blocking; run it in a thread so concurrent
+            # chunk workers don't stall the event loop
+            result = await asyncio.to_thread(
+                genai.embed_content,
                 model=self.model,
-                content=text,
+                content=texts,
                 task_type="retrieval_document",
                 title="Embedding of text chunk",
                 output_dimensionality=768  # Use 768 dimensions for storage efficiency
@@ -26,52 +86,47 @@ class EmbeddingService:
             print(f"Error generating embedding: {e}")
             raise e
 
-    def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
+    def chunk_text(self, text: str, max_tokens: Optional[int] = None,
+                   overlap_tokens: Optional[int] = None) -> List[str]:
         """
-        Split text into chunks with overlap for better context preservation.
-        
-        Uses character-based splitting with sentence boundary awareness.
-        
+        Split text into overlapping chunks with the CHUNKER chunker (see chunker.py).
+
         Args:
             text: Text to split
-            chunk_size: Target size in characters (default 500)
-            overlap: Overlap between chunks in characters (default 100)
-            
+            max_tokens: Chunk size limit in tokens; if given, chunks are token-aware
+            overlap_tokens: Overlap between chunks in tokens (default CHUNK_OVERLAP_TOKENS)
+
         Returns:
             List of text chunks
         """
-        if not text or len(text) < chunk_size:
-            return [text] if text else []
-        
-        chunks = []
-        start = 0
-        text_length = len(text)
-        
-        while start < text_length:
-            # Find end position
-            end = start + chunk_size
-            
-            if end >= text_length:
-                # Last chunk
-                chunks.append(text[start:].strip())
-                break
-            
-            # Try to break at sentence boundary
-            best_break = end
-            for boundary in ['. ', '.\n', '! ', '? ', '\n\n', '\n']:
-                pos = text.rfind(boundary, start + chunk_size // 2, end)
-                if pos != -1:
-                    best_break = pos + len(boundary)
-                    break
-            
-            chunk = text[start:best_break].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            # Move start with overlap
-            start = best_break - overlap if best_break > overlap else best_break
-        
-        return chunks
+        return chunk_text(text, max_tokens, overlap_tokens)
+
+    def chunk_pages(
+        self,
+        pages: Iterable[Tuple[int, str]],
+        max_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Incrementally chunk a stream of (page_number, text) pages.
+
+        Produces the same chunks as chunk_text() on the joined pages, but
+        yields each chunk as soon as enough text has arrived and only keeps
+        the unchunked tail of the text in memory.
+
+        Args:
+            pages: Iterable of (page_number, page_text), e.g. a lazy PDF reader
+            max_tokens: Chunk size limit in tokens; if given, chunks are token-aware
+            overlap_tokens: Overlap between chunks in tokens (default CHUNK_OVERLAP_TOKENS)
+
+        Yields:
+            Dicts with 'text', 'page_start' and 'page_end'
+        """
+        chunker = make_chunker(max_tokens, overlap_tokens)
+        for page_number, page_text in pages:
+            if page_text:
+                yield from chunker.feed(page_text + "\n", page=page_number)
+        yield from chunker.finish()
 
 embedding_service = EmbeddingService()
 
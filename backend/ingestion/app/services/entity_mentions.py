@@ -0,0 +1,70 @@
+"""
+Entity -> chunk mention index.
+
+store_graph() records which chunks mention each extracted entity in
+`entity_mentions`, keyed by the chunk's id in rag_service's
+document_chunks. rag_service uses it to restrict or boost vector search
+to the chunks that mention the entities of a question (entity-scoped
+retrieval).
+
+The Firestore entity documents are not used for this: their `mentions`
+array would grow without bound on frequently mentioned entities.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+from sqlalchemy.dialects.postgresql import insert
+
+from ..core.database import SessionLocal, EntityMention
+
+# Rows per INSERT statement
+BATCH_SIZE = 1000
+
+
+class EntityMentionService:
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+
+    def _insert(self, rows: List[Dict[str, str]]) -> None:
+        now = datetime.utcnow()
+        with self._session_factory() as db:
+            for start in range(0, len(rows), BATCH_SIZE):
+                batch = [{**row, "created_at": now} for row in rows[start:start + BATCH_SIZE]]
+                # Re-ingested chunks (e.g. bulk loads with stable ids) keep their links
+                db.execute(insert(EntityMention).on_conflict_do_nothing(), batch)
+            db.commit()
+
+    async def record(self, user_id: str, chunk_ids: Sequence[str],
+                     chunk_entities: Sequence[Sequence[str]]) -> int:
+        """
+        Link each chunk to the entities extracted from it.
+
+        Failures are logged and never fail the caller; the chunks are still
+        found by plain vector search.
+
+        Args:
+            user_id: Owner of the chunks
+            chunk_ids: Chunk ids, as stored in document_chunks
+            chunk_entities: Entity names per chunk, aligned with chunk_ids
+
+        Returns:
+            Number of links recorded
+        """
+        rows = list({
+            (entity, str(chunk_id)): {"user_id": user_id, "entity": entity, "chunk_id": str(chunk_id)}
+            for chunk_id, entities in zip(chunk_ids, chunk_entities)
+            for entity in entities
+        }.values())
+        if not rows:
+            return 0
+        try:
+            await asyncio.to_thread(self._insert, rows)
+        except Exception as e:
+            print(f"⚠️ Could not record entity mentions for {user_id}: {e}")
+            return 0
+        return len(rows)
+
+
+entity_mention_service = EntityMentionService()
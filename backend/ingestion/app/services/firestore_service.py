@@ -1,17 +1,71 @@
 """
 Firestore service for Knowledge Graph storage.
 
-Stores entities and relations in Firebase Firestore.
+Stores entities and relations in Firebase Firestore. Graph documents have
+deterministic IDs and are written with merge-sets in batches, so saving a
+document's graph costs a few round trips and re-ingesting content updates
+counters instead of duplicating nodes and edges.
+
+Every entity or relation write also increments the user's graph version
+(graph/meta/{user_id}/state), which readers such as the RAG service's
+adjacency cache and /graph/me ETags check to know when their copy is
+stale. save_graph() also records each document's content hash
+(graph/applied/{user_id}/{sha256}) so a retried document doesn't add its
+counts twice.
 """
 
+import asyncio
+import hashlib
 import uuid
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import firebase_admin
 from firebase_admin import firestore
 from datetime import datetime
 
 
+def normalize_name(name: str) -> str:
+    """Entity names are stored lowercase with collapsed whitespace."""
+    return " ".join(name.split()).lower()
+
+
+def entity_id(name: str) -> str:
+    """Deterministic document ID of an entity (by normalized name)."""
+    return hashlib.sha256(normalize_name(name).encode("utf-8")).hexdigest()
+
+
+def relation_id(source: str, target: str, relation_type: str) -> str:
+    """Deterministic document ID of a relation (by its normalized triple)."""
+    key = "\x1f".join([normalize_name(source), normalize_name(target), relation_type])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def entity_counts(entities: List[str]) -> Dict[str, int]:
+    """Mentions per normalized entity name."""
+    counts: Dict[str, int] = {}
+    for entity_name in entities:
+        name = normalize_name(entity_name)
+        if name:
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def relation_weights(relations: List[Dict[str, str]]) -> Dict[Tuple[str, str, str], int]:
+    """Occurrences per normalized (source, target, type) triple."""
+    weights: Dict[Tuple[str, str, str], int] = {}
+    for rel in relations:
+        source = normalize_name(rel.get("source") or "")
+        target = normalize_name(rel.get("target") or "")
+        if not source or not target:
+            continue
+        key = (source, target, rel.get("type") or "relates_to")
+        weights[key] = weights.get(key, 0) + 1
+    return weights
+
+
 class FirestoreService:
+    # Firestore accepts at most 500 writes per batch
+    BATCH_SIZE = 500
+
     def __init__(self):
         self._db = None
     
@@ -22,73 +76,254 @@ class FirestoreService:
             self._db = firestore.client()
         return self._db
     
+    def graph_meta_ref(self, user_id: str):
+        """Document holding the version of a user's graph."""
+        return self.db.collection("graph").document("meta").collection(user_id).document("state")
+
+    async def _commit_graph_writes(self, user_id: str, writes: List[Tuple[Any, Dict[str, Any]]]) -> None:
+        """Commit graph writes and bump the user's graph version."""
+        if writes:
+            # In the last batch, so readers that see the new version see every write
+            writes.append((self.graph_meta_ref(user_id), {
+                "version": firestore.Increment(1),
+                "updated_at": datetime.utcnow()
+            }))
+        await self._commit_writes(writes)
+
+    async def _commit_writes(self, writes: List[Tuple[Any, Optional[Dict[str, Any]]]]) -> None:
+        """
+        Merge-set documents (or delete them, for data None) in WriteBatch
+        commits of up to BATCH_SIZE writes.
+        """
+        for start in range(0, len(writes), self.BATCH_SIZE):
+            batch = self.db.batch()
+            for ref, data in writes[start:start + self.BATCH_SIZE]:
+                if data is None:
+                    batch.delete(ref)
+                else:
+                    batch.set(ref, data, merge=True)
+            await asyncio.to_thread(batch.commit)
+
     async def save_entities(self, user_id: str, entities: List[str], source_chunk_id: str = None) -> List[str]:
         """
         Save entities to Firestore.
         
+        Entity documents are keyed by a hash of the normalized name, so
+        saving an entity again updates the same document (incrementing its
+        mention_count) instead of querying for it first.
+        
         Args:
             user_id: User who owns these entities
             entities: List of entity names
             source_chunk_id: Optional source chunk reference
             
         Returns:
-            List of created entity IDs
+            List of entity IDs, one per distinct name
         """
-        entity_ids = []
+        counts = entity_counts(entities)
+        await self._commit_graph_writes(user_id, self._entity_writes(user_id, counts, source_chunk_id))
+        return [entity_id(name) for name in counts]
+
+    def _entity_writes(self, user_id: str, counts: Dict[str, int],
+                       source_chunk_id: str = None) -> List[Tuple[Any, Dict[str, Any]]]:
         entities_ref = self.db.collection("graph").document("entities").collection(user_id)
-        
-        for entity_name in entities:
-            # Check if entity already exists
-            existing = entities_ref.where("name", "==", entity_name.lower()).limit(1).get()
-            
-            if existing:
-                # Update mentions
-                doc = existing[0]
-                doc.reference.update({
-                    "mentions": firestore.ArrayUnion([source_chunk_id] if source_chunk_id else []),
-                    "updated_at": datetime.utcnow()
-                })
-                entity_ids.append(doc.id)
-            else:
-                # Create new entity
-                entity_id = str(uuid.uuid4())
-                entities_ref.document(entity_id).set({
-                    "name": entity_name.lower(),
-                    "user_id": user_id,
-                    "mentions": [source_chunk_id] if source_chunk_id else [],
-                    "created_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                })
-                entity_ids.append(entity_id)
-        
-        return entity_ids
+        writes = []
+        for name, count in counts.items():
+            data = {
+                "name": name,
+                "user_id": user_id,
+                "mention_count": firestore.Increment(count),
+                "updated_at": datetime.utcnow()
+            }
+            if source_chunk_id:
+                data["mentions"] = firestore.ArrayUnion([source_chunk_id])
+            writes.append((entities_ref.document(entity_id(name)), data))
+        return writes
     
     async def save_relations(self, user_id: str, relations: List[Dict[str, str]]) -> List[str]:
         """
         Save relations to Firestore.
         
+        Relation documents are keyed by a hash of (source, target, type), so
+        re-ingesting content increments the edge's weight instead of adding
+        a duplicate edge.
+        
         Args:
             user_id: User who owns these relations
             relations: List of relation dicts with source, target, type
             
         Returns:
-            List of created relation IDs
+            List of relation IDs, one per distinct edge
         """
-        relation_ids = []
+        weights = relation_weights(relations)
+        await self._commit_graph_writes(user_id, self._relation_writes(user_id, weights))
+        return [relation_id(*key) for key in weights]
+
+    def _relation_writes(self, user_id: str,
+                         weights: Dict[Tuple[str, str, str], int]) -> List[Tuple[Any, Dict[str, Any]]]:
         relations_ref = self.db.collection("graph").document("relations").collection(user_id)
-        
-        for rel in relations:
-            relation_id = str(uuid.uuid4())
-            relations_ref.document(relation_id).set({
-                "source": rel.get("source", "").lower(),
-                "target": rel.get("target", "").lower(),
-                "type": rel.get("type", "relates_to"),
+        return [
+            (
+                relations_ref.document(relation_id(*key)),
+                {
+                    "source": key[0],
+                    "target": key[1],
+                    "type": key[2],
+                    "user_id": user_id,
+                    "weight": firestore.Increment(weight),
+                    "updated_at": datetime.utcnow()
+                }
+            )
+            for key, weight in weights.items()
+        ]
+
+    def graph_applied_ref(self, user_id: str, content_hash: str):
+        """Marker document of a content hash whose graph is in the user's counters."""
+        return self.db.collection("graph").document("applied").collection(user_id).document(content_hash)
+
+    async def save_graph(self, user_id: str, entities: List[str], relations: List[Dict[str, str]],
+                         content_hash: Optional[str] = None) -> bool:
+        """
+        Save a document's entities and relations, at most once per content hash.
+
+        Counters are increments, so applying the same document twice (a job
+        retry, a resumed bulk run) would double them. Given the document's
+        content hash, a marker is written in the last batch together with
+        the version bump, and a document whose marker exists is skipped.
+        Only a crash between the batches of one very large graph (more than
+        BATCH_SIZE writes) can still leave part of it applied twice.
+
+        Args:
+            user_id: User who owns the graph
+            entities: List of entity names
+            relations: List of relation dicts with source, target, type
+            content_hash: sha256 of the document, if known
+
+        Returns:
+            False if the graph of content_hash was already saved
+        """
+        if content_hash:
+            marker = self.graph_applied_ref(user_id, content_hash)
+            if (await asyncio.to_thread(marker.get)).exists:
+                return False
+        writes = (self._entity_writes(user_id, entity_counts(entities))
+                  + self._relation_writes(user_id, relation_weights(relations)))
+        if not writes:
+            return True
+        if content_hash:
+            writes.append((marker, {"applied_at": datetime.utcnow()}))
+        await self._commit_graph_writes(user_id, writes)
+        return True
+    
+    def _load_graph(self, user_id: str) -> Dict[str, Any]:
+        graph_ref = self.db.collection("graph")
+        entities = graph_ref.document("entities").collection(user_id).select(["name", "mention_count"]).stream()
+        relations = graph_ref.document("relations").collection(user_id).select(["source", "target", "type", "weight"]).stream()
+        # Counters are summed by normalized key: until fold_legacy_graph() has
+        # run, a name can have an old random-id document next to its hashed one
+        nodes: Dict[str, int] = {}
+        for doc in entities:
+            data = doc.to_dict()
+            name = normalize_name(data.get("name") or "")
+            if name:
+                # Entities saved before mention_count existed were mentioned at least once
+                nodes[name] = nodes.get(name, 0) + data.get("mention_count", 1)
+        edges: Dict[Tuple[str, str, str], int] = {}
+        for doc in relations:
+            data = doc.to_dict()
+            source = normalize_name(data.get("source") or "")
+            target = normalize_name(data.get("target") or "")
+            if source and target:
+                key = (source, target, data.get("type") or "relates_to")
+                edges[key] = edges.get(key, 0) + data.get("weight", 1)
+        return {"nodes": nodes, "edges": edges}
+
+    def _legacy_graph_writes(self, user_id: str) -> Tuple[List[Tuple[Any, Optional[Dict[str, Any]]]], int, int]:
+        graph_ref = self.db.collection("graph")
+        entities_ref = graph_ref.document("entities").collection(user_id)
+        relations_ref = graph_ref.document("relations").collection(user_id)
+        # Each old document's counter and its deletion are adjacent, and
+        # BATCH_SIZE is even, so both always land in the same batch
+        writes: List[Tuple[Any, Optional[Dict[str, Any]]]] = []
+        entities = relations = 0
+        for doc in entities_ref.select(["name", "mention_count"]).stream():
+            data = doc.to_dict()
+            name = normalize_name(data.get("name") or "")
+            if not name or doc.id == entity_id(name):
+                continue
+            writes.append((entities_ref.document(entity_id(name)), {
+                "name": name,
                 "user_id": user_id,
-                "created_at": datetime.utcnow()
+                "mention_count": firestore.Increment(data.get("mention_count", 1)),
+                "updated_at": datetime.utcnow()
+            }))
+            writes.append((doc.reference, None))
+            entities += 1
+        for doc in relations_ref.select(["source", "target", "type", "weight"]).stream():
+            data = doc.to_dict()
+            source = normalize_name(data.get("source") or "")
+            target = normalize_name(data.get("target") or "")
+            relation_type = data.get("type") or "relates_to"
+            if not source or not target or doc.id == relation_id(source, target, relation_type):
+                continue
+            writes.append((relations_ref.document(relation_id(source, target, relation_type)), {
+                "source": source,
+                "target": target,
+                "type": relation_type,
+                "user_id": user_id,
+                "weight": firestore.Increment(data.get("weight", 1)),
+                "updated_at": datetime.utcnow()
+            }))
+            writes.append((doc.reference, None))
+            relations += 1
+        return writes, entities, relations
+
+    async def fold_legacy_graph(self, user_id: str) -> Dict[str, int]:
+        """
+        Move a user's old random-id entity and relation documents onto
+        their deterministic ids.
+
+        Graph documents written before ids were derived from names had
+        random ids, so a name saved again since has two documents. Each old
+        document's counter is added to the hashed document (created if
+        needed) and the old document is deleted in the same batch, so a
+        rerun after a failure picks up where it stopped without counting
+        anything twice.
+
+        Args:
+            user_id: User whose graph to migrate
+
+        Returns:
+            Number of folded entity and relation documents
+        """
+        writes, entities, relations = await asyncio.to_thread(self._legacy_graph_writes, user_id)
+        await self._commit_graph_writes(user_id, writes)
+        return {"entities": entities, "relations": relations}
+
+    async def graph_user_ids(self) -> List[str]:
+        """Users that have graph entities or relations."""
+        def list_users():
+            graph_ref = self.db.collection("graph")
+            return sorted({
+                collection.id
+                for name in ("entities", "relations")
+                for collection in graph_ref.document(name).collections()
             })
-            relation_ids.append(relation_id)
+
+        return await asyncio.to_thread(list_users)
+
+    async def load_graph(self, user_id: str) -> Dict[str, Any]:
+        """
+        Read a user's whole graph.
         
-        return relation_ids
+        Args:
+            user_id: User ID
+            
+        Returns:
+            Dict with 'nodes' (name -> mention count) and 'edges'
+            ((source, target, type) -> weight)
+        """
+        return await asyncio.to_thread(self._load_graph, user_id)
     
     async def get_entity_graph(self, user_id: str, entity_name: str) -> Dict[str, Any]:
         """
@@ -136,10 +371,15 @@ class FirestoreService:
         }
     
     async def save_document_metadata(self, user_id: str, filename: str, file_url: str, 
-                                      file_type: str, chunks_count: int, summary: str = None) -> str:
+                                      file_type: str, chunks_count: int, summary: str = None,
+                                      content_hash: str = None) -> str:
         """
         Save document metadata to Firestore.
         
+        Given the file's content hash, it is the metadata ID, so saving the
+        same file again (a retried job, a resumed bulk run) updates one
+        record instead of adding another.
+        
         Args:
             user_id: User ID
             filename: Original filename
@@ -147,11 +387,12 @@ class FirestoreService:
             file_type: Type (pdf, image, text)
             chunks_count: Number of chunks created
             summary: Optional document summary
+            content_hash: Optional sha256 of the file
             
         Returns:
             Document metadata ID
         """
-        doc_id = str(uuid.uuid4())
+        doc_id = content_hash or str(uuid.uuid4())
         docs_ref = self.db.collection("documents").document(user_id).collection("files")
         
         data = {
@@ -166,10 +407,25 @@ class FirestoreService:
         if summary:
             data["summary"] = summary
             
-        docs_ref.document(doc_id).set(data)
+        # Merged, so a summary added to an earlier save of the file is kept
+        await asyncio.to_thread(docs_ref.document(doc_id).set, data, merge=True)
         
         return doc_id
 
+    async def update_document_summary(self, user_id: str, doc_id: str, summary: str) -> None:
+        """
+        Attach a summary to saved document metadata.
+
+        Args:
+            user_id: User ID
+            doc_id: Document metadata ID from save_document_metadata
+            summary: Document summary
+        """
+        docs_ref = self.db.collection("documents").document(user_id).collection("files")
+        await asyncio.to_thread(
+            docs_ref.document(doc_id).update, {"summary": summary, "summarized_at": datetime.utcnow()}
+        )
+
 
     async def get_user_documents(self, user_id: str) -> List[Dict[str, Any]]:
         """
@@ -0,0 +1,240 @@
+"""
+Knowledge graph communities and centrality.
+
+Deferred "graph_analysis" jobs (see ingestion_pipeline.py) analyze a
+user's graph snapshot (see graph_snapshot.py) and store the result in
+`graph_overviews`, which rag_service's /graph/overview endpoint serves at
+increasing levels of detail:
+
+- Communities come from weighted label propagation: every node repeatedly
+  takes the label carrying the most edge weight among its neighbours,
+  until labels settle. It is near-linear in the number of edges and needs
+  no parameters.
+- Centrality is weighted PageRank along relation direction (targets of
+  "is_a"/"part_of" edges gain rank), plus each node's degree.
+
+Jobs are scheduled after each graph write, at most one per user per
+GRAPH_ANALYSIS_INTERVAL seconds, and run when the interval ends, so a
+bulk upload is analyzed once rather than once per document.
+"""
+
+import asyncio
+import gzip
+import json
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..core.config import get_settings
+from ..core.database import SessionLocal, GraphOverview
+from .job_queue import job_queue
+
+settings = get_settings()
+
+DAMPING = 0.85
+PAGERANK_ITERATIONS = 50
+PAGERANK_TOLERANCE = 1e-6
+PROPAGATION_ITERATIONS = 20
+
+
+def pagerank(node_count: int, edges: List[Tuple[int, int, float]]) -> List[float]:
+    """
+    Weighted PageRank by power iteration.
+
+    Args:
+        node_count: Number of nodes (0..node_count-1)
+        edges: (source, target, weight) triples
+
+    Returns:
+        Rank per node, summing to 1
+    """
+    if not node_count:
+        return []
+    out_weight = [0.0] * node_count
+    outgoing: List[List[Tuple[int, float]]] = [[] for _ in range(node_count)]
+    for source, target, weight in edges:
+        outgoing[source].append((target, weight))
+        out_weight[source] += weight
+    dangling = [node for node in range(node_count) if not out_weight[node]]
+
+    rank = [1.0 / node_count] * node_count
+    for _ in range(PAGERANK_ITERATIONS):
+        # Rank of nodes without outgoing edges is spread over every node
+        base = (1 - DAMPING + DAMPING * sum(rank[node] for node in dangling)) / node_count
+        new_rank = [base] * node_count
+        for source in range(node_count):
+            if out_weight[source]:
+                share = DAMPING * rank[source] / out_weight[source]
+                for target, weight in outgoing[source]:
+                    new_rank[target] += share * weight
+        delta = sum(abs(new - old) for new, old in zip(new_rank, rank))
+        rank = new_rank
+        if delta < PAGERANK_TOLERANCE:
+            break
+    return rank
+
+
+def label_propagation(node_count: int, edges: List[Tuple[int, int, float]], seed: int = 0) -> List[int]:
+    """
+    Weighted label propagation communities, edges taken as undirected.
+
+    Args:
+        node_count: Number of nodes (0..node_count-1)
+        edges: (source, target, weight) triples
+        seed: Seed of the visiting order, so results are reproducible
+
+    Returns:
+        Community label per node (labels are node numbers, not contiguous)
+    """
+    neighbours: List[Dict[int, float]] = [{} for _ in range(node_count)]
+    for source, target, weight in edges:
+        if source != target:
+            neighbours[source][target] = neighbours[source].get(target, 0.0) + weight
+            neighbours[target][source] = neighbours[target].get(source, 0.0) + weight
+
+    labels = list(range(node_count))
+    order = [node for node in range(node_count) if neighbours[node]]
+    rng = random.Random(seed)
+    for _ in range(PROPAGATION_ITERATIONS):
+        rng.shuffle(order)
+        changed = 0
+        for node in order:
+            weights: Dict[int, float] = {}
+            for other, weight in neighbours[node].items():
+                label = labels[other]
+                weights[label] = weights.get(label, 0.0) + weight
+            best = max(weights.values())
+            current = labels[node]
+            # Keep the current label on ties, so labels settle instead of flapping
+            if weights.get(current) != best:
+                labels[node] = min(label for label, weight in weights.items() if weight == best)
+                changed += 1
+        if not changed:
+            break
+    return labels
+
+
+def analyze_graph(nodes: Dict[str, int], edges: Dict[Tuple[str, str, str], int]) -> Dict[str, Any]:
+    """
+    Communities and ranks of a graph, in the stored overview format.
+
+    Args:
+        nodes: Entity name -> mention count
+        edges: (source, target, type) -> weight
+
+    Returns:
+        Dict with 'clusters' (id, label, size, rank; by rank, descending),
+        'cluster_edges' ([cluster, cluster, weight]), 'nodes' ([name,
+        cluster, rank, degree, mentions]; by rank, descending) and 'edges'
+        ([node, node, type, weight], node positions in 'nodes', ordered by
+        the lower-ranked endpoint)
+    """
+    names = list(nodes)
+    ids = {name: node for node, name in enumerate(names)}
+    for source, target, _ in edges:
+        for name in (source, target):
+            if name not in ids:
+                ids[name] = len(names)
+                names.append(name)
+    numbered = [(ids[source], ids[target], float(weight)) for (source, target, _), weight in edges.items()]
+
+    ranks = pagerank(len(names), numbered)
+    labels = label_propagation(len(names), numbered)
+    degree = [0] * len(names)
+    for source, target, _ in numbered:
+        degree[source] += 1
+        degree[target] += 1
+
+    # Clusters numbered by total rank, each labelled after its top node
+    order = sorted(range(len(names)), key=lambda node: -ranks[node])
+    position = {node: index for index, node in enumerate(order)}
+    cluster_rank: Dict[int, float] = {}
+    cluster_size: Dict[int, int] = {}
+    cluster_top: Dict[int, int] = {}
+    for node in order:
+        label = labels[node]
+        cluster_rank[label] = cluster_rank.get(label, 0.0) + ranks[node]
+        cluster_size[label] = cluster_size.get(label, 0) + 1
+        cluster_top.setdefault(label, node)
+    cluster_ids = {label: index for index, label in enumerate(sorted(cluster_rank, key=lambda l: -cluster_rank[l]))}
+
+    cluster_edges: Dict[Tuple[int, int], float] = {}
+    for source, target, weight in numbered:
+        a, b = sorted((cluster_ids[labels[source]], cluster_ids[labels[target]]))
+        if a != b:
+            cluster_edges[(a, b)] = cluster_edges.get((a, b), 0.0) + weight
+
+    return {
+        "clusters": [
+            {
+                "id": cluster_ids[label],
+                "label": names[cluster_top[label]],
+                "size": cluster_size[label],
+                "rank": round(cluster_rank[label], 8)
+            }
+            for label in sorted(cluster_ids, key=cluster_ids.get)
+        ],
+        "cluster_edges": [[a, b, weight] for (a, b), weight in cluster_edges.items()],
+        "nodes": [
+            [names[node], cluster_ids[labels[node]], round(ranks[node], 8), degree[node], nodes.get(names[node], 0)]
+            for node in order
+        ],
+        # Ordered by their lower-ranked endpoint, so the edges among the top
+        # k nodes are a prefix of the list
+        "edges": sorted(
+            ([position[ids[source]], position[ids[target]], relation, weight]
+             for (source, target, relation), weight in edges.items()),
+            key=lambda edge: max(edge[0], edge[1])
+        ),
+    }
+
+
+class GraphAnalysisService:
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+
+    def _enqueue(self, user_id: str) -> Dict[str, Any]:
+        interval = max(settings.GRAPH_ANALYSIS_INTERVAL, 1)
+        window = int(time.time() // interval)
+        return job_queue.enqueue(
+            user_id=user_id,
+            kind="graph_analysis",
+            payload=b"{}",
+            # One job per user and interval; it runs once the interval is over
+            content_hash=f"graph_analysis:{window}",
+            content_type="application/json",
+            run_after=datetime.utcfromtimestamp((window + 1) * interval)
+        )
+
+    async def schedule(self, user_id: str) -> None:
+        """Queue an analysis of the user's graph (deduplicated per interval)."""
+        try:
+            await asyncio.to_thread(self._enqueue, user_id)
+        except Exception as e:
+            # The next graph write schedules it again
+            print(f"⚠️ Could not schedule graph analysis for {user_id}: {e}")
+
+    def _version(self, user_id: str) -> Optional[int]:
+        with self._session_factory() as db:
+            overview = db.get(GraphOverview, user_id)
+            return None if overview is None else overview.version
+
+    def _store(self, user_id: str, version: int, overview: Dict[str, Any]) -> None:
+        body = {"user_id": user_id, "version": version, "computed_at": datetime.utcnow().isoformat(), **overview}
+        data = gzip.compress(json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+                             compresslevel=6, mtime=0)
+        with self._session_factory() as db:
+            db.merge(GraphOverview(user_id=user_id, version=version, data=data, computed_at=datetime.utcnow()))
+            db.commit()
+
+    async def analyzed_version(self, user_id: str) -> Optional[int]:
+        """Snapshot version of the user's stored overview, or None."""
+        return await asyncio.to_thread(self._version, user_id)
+
+    async def store(self, user_id: str, version: int, overview: Dict[str, Any]) -> None:
+        """Store an analyze_graph() result for a snapshot version."""
+        await asyncio.to_thread(self._store, user_id, version, overview)
+
+
+graph_analysis_service = GraphAnalysisService()
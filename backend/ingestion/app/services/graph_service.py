@@ -2,12 +2,32 @@
 Knowledge Graph extraction service.
 
 Uses Gemini to extract entities and relations from text chunks.
+
+Every chunk of a document is covered. Chunks are packed into numbered
+prompts of up to GRAPH_PROMPT_MAX_TOKENS (estimated) tokens, at most
+GRAPH_EXTRACTION_CONCURRENCY calls run at once per process, and Gemini
+answers in JSON mode against a response schema with one result per
+chunk. Per-chunk results are cached by chunk hash (see cache_service.py),
+so re-ingested or overlapping content is not sent again.
+
+GRAPH_EXTRACTION_BACKEND selects the extractor per deployment:
+
+- "llm" (default): Gemini extracts entities and typed relations.
+- "local": rule-based extraction on CPU, no network (see local_graph.py).
+- "hybrid": the local extractor finds entities in every chunk, and only
+  chunks with at least two entities (the ones that can hold a relation)
+  go to Gemini, which types their relations.
 """
 
+import asyncio
+import hashlib
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Tuple
 import google.generativeai as genai
 from ..core.config import get_settings
+from .cache_service import graph_cache
+from .chunker import estimate_tokens
+from .local_graph import local_graph_extractor
 
 settings = get_settings()
 
@@ -15,15 +35,9 @@ settings = get_settings()
 genai.configure(api_key=settings.GEMINI_API_KEY)
 
 
-EXTRACTION_PROMPT = """Extract entities and relations from this text.
+EXTRACTION_PROMPT = """Extract entities and relations from each numbered text below.
 
-Return ONLY valid JSON in this exact format:
-{{
-  "entities": ["entity1", "entity2", ...],
-  "relations": [
-    {{"source": "entity1", "target": "entity2", "type": "relation_type"}}
-  ]
-}}
+Return one result per text, with the text's number.
 
 Rules:
 - Entities should be nouns, concepts, people, places, organizations
@@ -31,119 +45,219 @@ Rules:
 - Keep entity names short and normalized (lowercase)
 - Common relation types: "is_a", "has", "relates_to", "part_of", "created_by", "located_in"
 
-Text to analyze:
-{text}
+Texts to analyze:
+{texts}"""
 
-JSON response:"""
+# Bump when the prompt or schema changes, so cached results are not reused
+PROMPT_VERSION = "2"
 
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "chunks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "chunk": {"type": "integer"},
+                    "entities": {"type": "array", "items": {"type": "string"}},
+                    "relations": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "source": {"type": "string"},
+                                "target": {"type": "string"},
+                                "type": {"type": "string"}
+                            },
+                            "required": ["source", "target", "type"]
+                        }
+                    }
+                },
+                "required": ["chunk", "entities", "relations"]
+            }
+        }
+    },
+    "required": ["chunks"]
+}
 
-class GraphExtractionService:
-    def __init__(self):
-        self.model = genai.GenerativeModel(settings.GEMINI_LLM_MODEL)
-    
-    async def extract_graph(self, text: str) -> Dict[str, Any]:
-        """
-        Extract entities and relations from text using Gemini.
-        
-        Args:
-            text: Text chunk to analyze
-            
-        Returns:
-            Dict with 'entities' list and 'relations' list
-        """
-        try:
-            prompt = EXTRACTION_PROMPT.format(text=text[:2000])  # Limit text length
 
-            print(f"🔍 Calling Gemini model: {settings.GEMINI_LLM_MODEL}")
+def merge_graphs(results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Union entities and deduplicate relations of several extraction results.
 
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.1,  # Low temperature for structured output
-                    max_output_tokens=1024,
-                )
-            )
+    Per-chunk entity lists ('chunk_entities') are concatenated in order, so
+    they stay aligned with the concatenated chunks of the results.
+    """
+    entities: Dict[str, None] = {}
+    relations: Dict[Tuple[str, str, str], Dict[str, str]] = {}
+    chunk_entities: List[List[str]] = []
+    for result in results:
+        entities.update(dict.fromkeys(result.get("entities", [])))
+        for rel in result.get("relations", []):
+            relations.setdefault((rel.get("source"), rel.get("target"), rel.get("type")), rel)
+        chunk_entities.extend(result.get("chunk_entities", []))
+    return {"entities": list(entities), "relations": list(relations.values()), "chunk_entities": chunk_entities}
 
-            print(f"📥 Got response from Gemini")
 
-            # Parse JSON response
-            response_text = response.text.strip()
+def mentioned_entities(result: Dict[str, Any]) -> List[str]:
+    """Entities of one chunk's result, including relation endpoints."""
+    names = dict.fromkeys(result.get("entities", []))
+    for rel in result.get("relations", []):
+        names.update(dict.fromkeys((rel["source"], rel["target"])))
+    return list(names)
 
-            print(f"📝 Raw response (first 300 chars): {response_text[:300]}")
 
-            # Handle markdown code blocks (```json ... ``` or ``` ... ```)
-            if response_text.startswith("```"):
-                # Remove first line (```json or ```)
-                lines = response_text.split("\n")
-                # Remove first and last line
-                response_text = "\n".join(lines[1:-1]).strip()
+class GraphExtractionService:
+    # Chunks per prompt, whatever their size; bounds the response length
+    MAX_CHUNKS_PER_PROMPT = 32
+
+    def __init__(self):
+        self.model = genai.GenerativeModel(settings.GEMINI_LLM_MODEL)
+        self._slots = asyncio.Semaphore(settings.GRAPH_EXTRACTION_CONCURRENCY)
+
+    @staticmethod
+    def _cache_key(chunk: str) -> str:
+        digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        return f"{settings.GEMINI_LLM_MODEL}:{PROMPT_VERSION}:{digest}"
 
-            # Remove any remaining backticks
-            response_text = response_text.replace("```", "").strip()
+    def _pack(self, chunks: List[str]) -> List[List[str]]:
+        """Group chunks into prompts of up to GRAPH_PROMPT_MAX_TOKENS tokens."""
+        packs: List[List[str]] = []
+        tokens = 0
+        for chunk in chunks:
+            chunk_tokens = estimate_tokens(chunk)
+            if (not packs or len(packs[-1]) >= self.MAX_CHUNKS_PER_PROMPT
+                    or tokens + chunk_tokens > settings.GRAPH_PROMPT_MAX_TOKENS):
+                packs.append([])
+                tokens = 0
+            packs[-1].append(chunk)
+            tokens += chunk_tokens
+        return packs
 
-            # Try to find JSON object in the response
-            start_idx = response_text.find("{")
-            end_idx = response_text.rfind("}") + 1
+    @staticmethod
+    def _clean(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Keep well-formed entities and relations of one chunk's result."""
+        entities = [e.strip().lower() for e in result.get("entities", []) if isinstance(e, str) and e.strip()]
+        relations = [
+            {
+                "source": rel["source"].strip().lower(),
+                "target": rel["target"].strip().lower(),
+                "type": (rel.get("type") or "relates_to").strip()
+            }
+            for rel in result.get("relations", [])
+            if isinstance(rel, dict) and isinstance(rel.get("source"), str) and isinstance(rel.get("target"), str)
+            and rel["source"].strip() and rel["target"].strip()
+        ]
+        return {"entities": entities, "relations": relations}
 
-            if start_idx != -1 and end_idx > start_idx:
-                response_text = response_text[start_idx:end_idx]
+    async def _extract_pack(self, pack: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Extract one packed prompt.
 
-            print(f"🔧 Cleaned response (first 300 chars): {response_text[:300]}")
+        Returns:
+            Chunk text -> result, for the chunks the model answered
+        """
+        texts = "\n\n".join(f"[{number}]\n{chunk}" for number, chunk in enumerate(pack, start=1))
+        try:
+            async with self._slots:
+                response = await asyncio.to_thread(
+                    self.model.generate_content,
+                    EXTRACTION_PROMPT.format(texts=texts),
+                    generation_config=genai.types.GenerationConfig(
+                        temperature=0.1,  # Low temperature for structured output
+                        max_output_tokens=8192,
+                        response_mime_type="application/json",
+                        response_schema=RESPONSE_SCHEMA
+                    )
+                )
+            answers = json.loads(response.text).get("chunks", [])
+        except (json.JSONDecodeError, ValueError) as e:
+            # Usually a response cut off at the output limit; smaller prompts fit
+            if len(pack) > 1:
+                middle = len(pack) // 2
+                first, second = await asyncio.gather(self._extract_pack(pack[:middle]), self._extract_pack(pack[middle:]))
+                return {**first, **second}
+            print(f"❌ Graph extraction returned invalid JSON: {e}")
+            return {}
+        except Exception as e:
+            print(f"❌ Graph extraction failed for {len(pack)} chunks: {type(e).__name__}: {e}")
+            return {}
 
-            result = json.loads(response_text)
+        results = {}
+        for answer in answers:
+            number = answer.get("chunk") if isinstance(answer, dict) else None
+            if isinstance(number, int) and 1 <= number <= len(pack):
+                results[pack[number - 1]] = self._clean(answer)
+        return results
 
-            entities = result.get("entities", [])
-            relations = result.get("relations", [])
+    async def _extract_llm(self, unique: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Per-chunk Gemini results for distinct chunks, from the cache or packed prompts."""
+        keys = {chunk: self._cache_key(chunk) for chunk in unique}
+        cached = await graph_cache.get_many(list(keys.values()))
+        results = {chunk: cached[key] for chunk, key in keys.items() if key in cached}
 
-            print(f"✅ Graph extraction success: {len(entities)} entities, {len(relations)} relations")
+        missing = [chunk for chunk in unique if chunk not in results]
+        packs = self._pack(missing)
+        if packs:
+            print(f"🔍 Extracting graph from {len(missing)} chunks in {len(packs)} prompts "
+                  f"({len(results)} cached)")
+        extracted: Dict[str, Dict[str, Any]] = {}
+        for pack_results in await asyncio.gather(*(self._extract_pack(pack) for pack in packs)):
+            extracted.update(pack_results)
+        await graph_cache.set_many({keys[chunk]: result for chunk, result in extracted.items()})
+        results.update(extracted)
+        return results
 
-            return {
-                "entities": entities,
-                "relations": relations
+    async def _extract_hybrid(self, unique: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Local entities for every chunk; Gemini relations where a chunk has two or more."""
+        results = await asyncio.to_thread(local_graph_extractor.extract, unique)
+        typed = await self._extract_llm([chunk for chunk in unique if len(results[chunk]["entities"]) >= 2])
+        for chunk, result in typed.items():
+            local = results[chunk]
+            results[chunk] = {
+                "entities": list(dict.fromkeys(local["entities"] + result["entities"])),
+                # Co-occurrence edges stay only where Gemini found no relation
+                "relations": result["relations"] or local["relations"]
             }
+        return results
 
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON PARSE ERROR: {e}")
-            print(f"❌ Response text that failed: {response_text if 'response_text' in locals() else 'N/A'}")
-            return {"entities": [], "relations": []}
-        except Exception as e:
-            print(f"❌ EXCEPTION TYPE: {type(e).__name__}")
-            print(f"❌ EXCEPTION MESSAGE: {str(e)}")
-            import traceback
-            print(f"❌ TRACEBACK: {traceback.format_exc()}")
-            return {"entities": [], "relations": []}
-    
     async def extract_from_chunks(self, chunks: List[str]) -> Dict[str, Any]:
         """
         Extract graph from multiple chunks and merge results.
-        
+
         Args:
             chunks: List of text chunks
-            
+
         Returns:
-            Merged entities and relations
+            Merged entities and relations, plus 'chunk_entities': the
+            entities each chunk mentions, aligned with chunks
         """
-        all_entities = set()
-        all_relations = []
-        
-        for chunk in chunks[:5]:  # Limit to first 5 chunks for performance
-            result = await self.extract_graph(chunk)
-            all_entities.update(result.get("entities", []))
-            all_relations.extend(result.get("relations", []))
-        
-        # Deduplicate relations
-        unique_relations = []
-        seen = set()
-        for rel in all_relations:
-            key = (rel.get("source"), rel.get("target"), rel.get("type"))
-            if key not in seen:
-                seen.add(key)
-                unique_relations.append(rel)
-        
-        return {
-            "entities": list(all_entities),
-            "relations": unique_relations
-        }
+        unique = list(dict.fromkeys(chunk for chunk in chunks if chunk.strip()))
+        backend = settings.GRAPH_EXTRACTION_BACKEND
+        if backend == "local":
+            results = await asyncio.to_thread(local_graph_extractor.extract, unique)
+        elif backend == "hybrid":
+            results = await self._extract_hybrid(unique)
+        else:
+            results = await self._extract_llm(unique)
+
+        graph = merge_graphs(results[chunk] for chunk in unique if chunk in results)
+        graph["chunk_entities"] = [mentioned_entities(results.get(chunk, {})) for chunk in chunks]
+        print(f"✅ Graph extraction ({backend}): {len(graph['entities'])} entities, {len(graph['relations'])} relations")
+        return graph
+
+    async def extract_graph(self, text: str) -> Dict[str, Any]:
+        """
+        Extract entities and relations from a single text.
+
+        Args:
+            text: Text chunk to analyze
+
+        Returns:
+            Dict with 'entities' list and 'relations' list
+        """
+        return await self.extract_from_chunks([text])
 
 
 graph_extraction_service = GraphExtractionService()
@@ -0,0 +1,244 @@
+"""
+Materialized per-user graph snapshots.
+
+Each user's whole knowledge graph (entities with mention counts, relations
+with weights) is kept as one gzip-compressed JSON row in `graph_snapshots`,
+already in the body format of rag_service's /graph/me/snapshot endpoint,
+which sends the stored bytes as they are. Reading a whole graph is then a
+single row fetch instead of thousands of Firestore documents.
+
+Updating the row means decompressing, merging and recompressing the whole
+graph, so documents don't do it themselves. store_graph() appends each
+document's counts to `graph_snapshot_deltas` right after writing them to
+Firestore, which costs the size of the document, and schedules a
+"graph_snapshot" job. The job folds every pending delta of the user into
+the snapshot in one rewrite, at most once per
+GRAPH_SNAPSHOT_COMPACT_INTERVAL seconds, so a bulk upload of N documents
+rewrites the graph about once per interval instead of N times, and
+concurrent documents never wait on the snapshot row. Served snapshots lag
+new documents by up to that interval; get() folds pending deltas first.
+
+A user's first snapshot is built from Firestore, which at that point
+already holds the document being stored. If an update fails the snapshot
+and its deltas are dropped, and the next write rebuilds it from
+Firestore, so a snapshot never silently drifts.
+"""
+
+import asyncio
+import gzip
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from ..core.config import get_settings
+from ..core.database import SessionLocal, GraphSnapshot, GraphSnapshotDelta
+from .firestore_service import firestore_service, entity_counts, relation_weights
+from .job_queue import job_queue
+
+settings = get_settings()
+
+NODE_FIELDS = ["id", "mentions"]
+EDGE_FIELDS = ["source", "target", "relation", "weight"]
+
+
+def encode_snapshot(user_id: str, version: int, nodes: Dict[str, int],
+                    edges: Dict[Tuple[str, str, str], int]) -> bytes:
+    """Snapshot body: compact rows, as JSON, gzip-compressed."""
+    body = {
+        "user_id": user_id,
+        "version": version,
+        "nodes": {"fields": NODE_FIELDS, "rows": [[name, count] for name, count in nodes.items()]},
+        "edges": {"fields": EDGE_FIELDS, "rows": [[*key, weight] for key, weight in edges.items()]},
+    }
+    raw = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    # mtime=0 keeps the bytes a pure function of the graph
+    return gzip.compress(raw, compresslevel=6, mtime=0)
+
+
+def decode_snapshot(data: bytes) -> Tuple[Dict[str, int], Dict[Tuple[str, str, str], int]]:
+    """Nodes (name -> mentions) and edges ((source, target, type) -> weight) of a snapshot body."""
+    body = json.loads(gzip.decompress(data))
+    nodes = {name: count for name, count in body["nodes"]["rows"]}
+    edges = {(source, target, relation): weight for source, target, relation, weight in body["edges"]["rows"]}
+    return nodes, edges
+
+
+class GraphSnapshotService:
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+
+    def _write(self, snapshot: GraphSnapshot, nodes: Dict[str, int],
+               edges: Dict[Tuple[str, str, str], int]) -> None:
+        snapshot.data = encode_snapshot(snapshot.user_id, snapshot.version, nodes, edges)
+        snapshot.node_count = len(nodes)
+        snapshot.edge_count = len(edges)
+        snapshot.updated_at = datetime.utcnow()
+
+    def _append(self, user_id: str, counts: Dict[str, int],
+                weights: Dict[Tuple[str, str, str], int]) -> bool:
+        """Queue counts for the user's snapshot; False if there is none yet."""
+        with self._session_factory() as db:
+            # Only the key: the snapshot body itself is not read here
+            if db.query(GraphSnapshot.user_id).filter(GraphSnapshot.user_id == user_id).first() is None:
+                return False
+            db.add(GraphSnapshotDelta(user_id=user_id, data={
+                "nodes": [[name, count] for name, count in counts.items()],
+                "edges": [[*key, weight] for key, weight in weights.items()],
+            }))
+            db.commit()
+            return True
+
+    def _compact(self, user_id: str) -> Optional[int]:
+        """Fold pending deltas into the snapshot; its new version, or None if there was nothing to do."""
+        with self._session_factory() as db:
+            # Row lock: a concurrent compaction waits, then finds no deltas left
+            snapshot = db.query(GraphSnapshot).filter(GraphSnapshot.user_id == user_id).with_for_update().first()
+            if snapshot is None:
+                return None
+            deltas = (db.query(GraphSnapshotDelta).filter(GraphSnapshotDelta.user_id == user_id)
+                      .order_by(GraphSnapshotDelta.id).all())
+            if not deltas:
+                return None
+            nodes, edges = decode_snapshot(snapshot.data)
+            for delta in deltas:
+                for name, count in delta.data["nodes"]:
+                    nodes[name] = nodes.get(name, 0) + count
+                for source, target, relation, weight in delta.data["edges"]:
+                    edges[(source, target, relation)] = edges.get((source, target, relation), 0) + weight
+            snapshot.version += 1
+            self._write(snapshot, nodes, edges)
+            # Deltas appended meanwhile have higher ids and wait for the next job
+            self._delete_deltas(db, user_id, deltas[-1].id)
+            db.commit()
+            return snapshot.version
+
+    def _delete_deltas(self, db, user_id: str, up_to: Optional[int]) -> None:
+        query = db.query(GraphSnapshotDelta).filter(GraphSnapshotDelta.user_id == user_id)
+        if up_to is not None:
+            query = query.filter(GraphSnapshotDelta.id <= up_to)
+        query.delete(synchronize_session=False)
+
+    def _last_delta(self, user_id: str) -> Optional[int]:
+        with self._session_factory() as db:
+            return (db.query(GraphSnapshotDelta.id).filter(GraphSnapshotDelta.user_id == user_id)
+                    .order_by(GraphSnapshotDelta.id.desc()).limit(1).scalar())
+
+    def _replace(self, user_id: str, graph: Dict[str, Any], folded_delta: Optional[int] = None) -> None:
+        """
+        Store a snapshot of a whole graph, replacing any existing one, and
+        drop the deltas up to folded_delta, which the graph already holds.
+        """
+        with self._session_factory() as db:
+            snapshot = db.query(GraphSnapshot).filter(GraphSnapshot.user_id == user_id).with_for_update().first()
+            if snapshot is None:
+                snapshot = GraphSnapshot(user_id=user_id, version=0)
+                db.add(snapshot)
+            snapshot.version += 1
+            self._write(snapshot, graph["nodes"], graph["edges"])
+            if folded_delta is not None:
+                self._delete_deltas(db, user_id, folded_delta)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Created concurrently; the caller rebuilds over it
+                db.rollback()
+                raise
+
+    def _drop(self, user_id: str) -> None:
+        with self._session_factory() as db:
+            db.query(GraphSnapshot).filter(GraphSnapshot.user_id == user_id).delete()
+            self._delete_deltas(db, user_id, None)
+            db.commit()
+
+    def _enqueue_compaction(self, user_id: str) -> Dict[str, Any]:
+        interval = max(settings.GRAPH_SNAPSHOT_COMPACT_INTERVAL, 1)
+        window = int(time.time() // interval)
+        return job_queue.enqueue(
+            user_id=user_id,
+            kind="graph_snapshot",
+            payload=b"{}",
+            # One job per user and interval; it runs once the interval is over
+            content_hash=f"graph_snapshot:{window}",
+            content_type="application/json",
+            run_after=datetime.utcfromtimestamp((window + 1) * interval)
+        )
+
+    def _get(self, user_id: str) -> Optional[bytes]:
+        with self._session_factory() as db:
+            snapshot = db.get(GraphSnapshot, user_id)
+            return None if snapshot is None else snapshot.data
+
+    async def rebuild(self, user_id: str) -> None:
+        """Replace the user's snapshot with their current Firestore graph."""
+        # Deltas queued before Firestore is read are already in what it returns
+        folded_delta = await asyncio.to_thread(self._last_delta, user_id)
+        graph = await firestore_service.load_graph(user_id)
+        try:
+            await asyncio.to_thread(self._replace, user_id, graph, folded_delta)
+        except IntegrityError:
+            # Another document created the first snapshot meanwhile; Firestore
+            # now holds both documents, so read it again
+            folded_delta = await asyncio.to_thread(self._last_delta, user_id)
+            graph = await firestore_service.load_graph(user_id)
+            await asyncio.to_thread(self._replace, user_id, graph, folded_delta)
+        print(f"🗺️ Built graph snapshot for {user_id}: {len(graph['nodes'])} nodes, {len(graph['edges'])} edges")
+
+    async def _drop_after_failure(self, user_id: str, error: Exception) -> None:
+        print(f"⚠️ Graph snapshot update failed for {user_id}, dropping it: {error}")
+        try:
+            await asyncio.to_thread(self._drop, user_id)
+        except Exception as drop_error:
+            print(f"⚠️ Could not drop graph snapshot for {user_id}: {drop_error}")
+
+    async def apply(self, user_id: str, entities: List[str], relations: List[Dict[str, str]]) -> None:
+        """
+        Queue graph data just saved to Firestore for the user's snapshot.
+
+        Failures are logged and never fail the caller; the snapshot is
+        dropped so it gets rebuilt instead of drifting.
+
+        Args:
+            user_id: Owner of the graph
+            entities: Entity names, as passed to save_graph
+            relations: Relation dicts, as passed to save_graph
+        """
+        counts, weights = entity_counts(entities), relation_weights(relations)
+        if not counts and not weights:
+            return
+        try:
+            if not await asyncio.to_thread(self._append, user_id, counts, weights):
+                await self.rebuild(user_id)
+                return
+        except Exception as e:
+            await self._drop_after_failure(user_id, e)
+            return
+        try:
+            await asyncio.to_thread(self._enqueue_compaction, user_id)
+        except Exception as e:
+            # The delta stays queued; the next write or read folds it in
+            print(f"⚠️ Could not schedule graph snapshot compaction for {user_id}: {e}")
+
+    async def compact(self, user_id: str) -> Optional[int]:
+        """
+        Fold the user's pending deltas into their snapshot.
+
+        Returns:
+            New snapshot version, or None if there was nothing to fold
+        """
+        try:
+            return await asyncio.to_thread(self._compact, user_id)
+        except Exception as e:
+            await self._drop_after_failure(user_id, e)
+            return None
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Decoded snapshot body of a user, with pending deltas folded in, or None."""
+        await self.compact(user_id)
+        data = await asyncio.to_thread(self._get, user_id)
+        return None if data is None else json.loads(gzip.decompress(data))
+
+
+graph_snapshot_service = GraphSnapshotService()
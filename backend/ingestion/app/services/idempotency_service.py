@@ -0,0 +1,231 @@
+"""
+Idempotency service for ingestion uploads.
+
+Deduplicates retried uploads by content hash and Idempotency-Key.
+Completed results are stored in Firestore; uploads still being processed
+are tracked in memory so a retry attaches to the running job.
+"""
+
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from firebase_admin import firestore
+from datetime import datetime
+
+
+class IdempotencyService:
+    def __init__(self):
+        self._db = None
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    @property
+    def db(self):
+        """Lazy initialization of Firestore client."""
+        if self._db is None:
+            self._db = firestore.client()
+        return self._db
+
+    @staticmethod
+    def hash_content(content: bytes) -> str:
+        """Return the SHA-256 hex digest of uploaded bytes."""
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def _record_ids(content_hash: Optional[str], idempotency_key: Optional[str] = None) -> List[str]:
+        """
+        Firestore document IDs an upload is recorded under.
+
+        Idempotency keys are client-supplied and may contain characters that
+        are not allowed in document IDs, so they are hashed as well.
+        """
+        ids = []
+        if idempotency_key:
+            ids.append(f"key_{hashlib.sha256(idempotency_key.encode()).hexdigest()}")
+        if content_hash:
+            ids.append(f"sha256_{content_hash}")
+        return ids
+
+    def _uploads_ref(self, user_id: str):
+        return self.db.collection("ingestions").document(user_id).collection("uploads")
+
+    def _get_result(self, user_id: str, content_hash: Optional[str],
+                    idempotency_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        uploads_ref = self._uploads_ref(user_id)
+
+        for record_id in self._record_ids(content_hash, idempotency_key):
+            doc = uploads_ref.document(record_id).get()
+            if doc.exists:
+                return doc.to_dict().get("result")
+
+        return None
+
+    def _save_result(self, user_id: str, content_hash: Optional[str], result: Dict[str, Any],
+                     idempotency_key: Optional[str]) -> None:
+        uploads_ref = self._uploads_ref(user_id)
+
+        for record_id in self._record_ids(content_hash, idempotency_key):
+            uploads_ref.document(record_id).set({
+                "content_hash": content_hash,
+                "result": result,
+                "user_id": user_id,
+                "created_at": datetime.utcnow()
+            })
+
+    async def get_result(self, user_id: str, content_hash: Optional[str],
+                         idempotency_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get the stored result of an already processed upload.
+
+        Args:
+            user_id: Owner of the upload
+            content_hash: SHA-256 of the uploaded bytes, or None to look up by key only
+            idempotency_key: Optional client-supplied Idempotency-Key
+
+        Returns:
+            Previous response dict, or None if the upload was never processed
+        """
+        # Firestore calls block, so they run off the event loop
+        return await asyncio.to_thread(self._get_result, user_id, content_hash, idempotency_key)
+
+    async def save_result(self, user_id: str, content_hash: Optional[str], result: Dict[str, Any],
+                          idempotency_key: Optional[str] = None) -> None:
+        """
+        Record the result of a processed upload under its hash and key.
+
+        Args:
+            user_id: Owner of the upload
+            content_hash: SHA-256 of the uploaded bytes, or None to record by key only
+            result: Response returned to the client
+            idempotency_key: Optional client-supplied Idempotency-Key
+        """
+        await asyncio.to_thread(self._save_result, user_id, content_hash, result, idempotency_key)
+
+    def _find_in_flight(self, keys: List[Tuple[str, str]]) -> Optional[asyncio.Future]:
+        for key in keys:
+            running = self._in_flight.get(key)
+            if running is not None:
+                return running
+        return None
+
+    async def _previous(self, user_id: str, in_flight_keys: List[Tuple[str, str]],
+                        content_hash: Optional[str], idempotency_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Result of an earlier run of the same upload, waiting for it if it is still in flight."""
+        running = self._find_in_flight(in_flight_keys)
+        if running is None:
+            previous = await self.get_result(user_id, content_hash, idempotency_key)
+            if previous is not None:
+                return {**previous, "deduplicated": True}
+            # Another request may have started while the lookup was awaited
+            running = self._find_in_flight(in_flight_keys)
+
+        if running is not None:
+            # Shield so a disconnecting retry doesn't cancel the original job
+            result = await asyncio.shield(running)
+            return {**result, "deduplicated": True}
+        return None
+
+    async def run_once(
+        self,
+        user_id: str,
+        content_hash: str,
+        process: Callable[[], Awaitable[Dict[str, Any]]],
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Run `process` for an upload unless it was already processed.
+
+        - Already processed for this user: return the previous result.
+        - Still in flight: wait for the running job and return its result.
+        - Otherwise: run `process`, store its result and return it.
+
+        Failed runs are not recorded, so the client can retry them.
+
+        Args:
+            user_id: Owner of the upload
+            content_hash: SHA-256 of the uploaded bytes
+            process: Coroutine factory that performs the ingestion
+            idempotency_key: Optional client-supplied Idempotency-Key
+
+        Returns:
+            Response dict, with "deduplicated": True when reused
+        """
+        in_flight_keys = [(user_id, record_id) for record_id in self._record_ids(content_hash, idempotency_key)]
+
+        previous = await self._previous(user_id, in_flight_keys, content_hash, idempotency_key)
+        if previous is not None:
+            return previous
+
+        task = asyncio.ensure_future(process())
+        for key in in_flight_keys:
+            self._in_flight[key] = task
+
+        try:
+            result = await asyncio.shield(task)
+            await self.save_result(user_id, content_hash, result, idempotency_key)
+            return result
+        finally:
+            for key in in_flight_keys:
+                if self._in_flight.get(key) is task:
+                    del self._in_flight[key]
+
+    async def run_once_streamed(
+        self,
+        user_id: str,
+        process: Callable[[Callable[[str], Awaitable[Optional[Dict[str, Any]]]]], Awaitable[Dict[str, Any]]],
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Like run_once, for uploads whose content hash is known only once read.
+
+        Retries are matched by Idempotency-Key up front. `process` is called
+        with a `check(content_hash)` coroutine, which it awaits once the hash
+        is known and before any writes that must not be repeated: it returns
+        the result of an earlier upload of the same content (waiting for it
+        if still in flight), or None after marking this one as in flight.
+        When check returns a result, `process` should stop and return it.
+
+        Args:
+            user_id: Owner of the upload
+            process: Coroutine function that performs the ingestion, given check
+            idempotency_key: Optional client-supplied Idempotency-Key
+
+        Returns:
+            Response dict, with "deduplicated": True when reused
+        """
+        in_flight_keys = [(user_id, record_id) for record_id in self._record_ids(None, idempotency_key)]
+
+        if idempotency_key:
+            previous = await self._previous(user_id, in_flight_keys, None, idempotency_key)
+            if previous is not None:
+                return previous
+
+        content_hash = None
+
+        async def check(upload_hash: str) -> Optional[Dict[str, Any]]:
+            nonlocal content_hash
+            content_hash = upload_hash
+            hash_keys = [(user_id, record_id) for record_id in self._record_ids(upload_hash)]
+            previous = await self._previous(user_id, hash_keys, upload_hash, None)
+            if previous is None:
+                for key in hash_keys:
+                    self._in_flight[key] = task
+                    in_flight_keys.append(key)
+            return previous
+
+        task = asyncio.ensure_future(process(check))
+        for key in in_flight_keys:
+            self._in_flight[key] = task
+
+        try:
+            result = await asyncio.shield(task)
+            # A duplicate's key still records the original result
+            stored = {name: value for name, value in result.items() if name != "deduplicated"}
+            await self.save_result(user_id, content_hash, stored, idempotency_key)
+            return result
+        finally:
+            for key in in_flight_keys:
+                if self._in_flight.get(key) is task:
+                    del self._in_flight[key]
+
+
+idempotency_service = IdempotencyService()
@@ -0,0 +1,102 @@
+"""
+Image preparation for Gemini Vision OCR and result thumbnails.
+
+Uploads are often full-resolution phone photos or screenshots. Before OCR
+they are auto-rotated, downscaled to OCR_MAX_DIMENSION on the long side and
+re-encoded as JPEG, which keeps text legible while cutting request size.
+A difference hash (dHash) identifies near-identical images for caching.
+
+Small WebP thumbnails are stored next to each image upload, so search
+results can show a preview without downloading the original.
+"""
+
+import io
+from typing import BinaryIO, Dict, Tuple, Union
+
+from PIL import Image, ImageOps
+
+from ..core.config import get_settings
+
+settings = get_settings()
+
+OCR_MIME_TYPE = "image/jpeg"
+
+# Thumbnail name -> longest side in pixels
+THUMBNAIL_SIZES = {"small": 128, "medium": 512}
+THUMBNAIL_MIME_TYPE = "image/webp"
+
+
+def perceptual_hash(image: Image.Image, hash_size: int = 8) -> str:
+    """
+    64-bit difference hash of an image as 16 hex characters.
+
+    Resizing, re-encoding and small edits leave the hash unchanged, so
+    re-uploads of the same screenshot map to the same key.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def prepare_for_ocr(source: Union[bytes, BinaryIO]) -> Tuple[bytes, str]:
+    """
+    Downscale and re-encode an image for OCR (blocking, CPU-bound).
+
+    Args:
+        source: Encoded image bytes or a binary file
+
+    Returns:
+        (JPEG bytes, perceptual hash of the original image)
+    """
+    image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    # Only decode what the target size needs (big win for large JPEGs)
+    image.draft("RGB", (settings.OCR_MAX_DIMENSION, settings.OCR_MAX_DIMENSION))
+    image = ImageOps.exif_transpose(image)
+
+    phash = perceptual_hash(image)
+
+    if image.mode not in ("RGB", "L"):
+        # Flatten transparency onto white so text stays readable
+        rgba = image.convert("RGBA")
+        image = Image.new("RGB", rgba.size, "white")
+        image.paste(rgba, mask=rgba.getchannel("A"))
+
+    image.thumbnail((settings.OCR_MAX_DIMENSION, settings.OCR_MAX_DIMENSION), Image.LANCZOS)
+
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=settings.OCR_JPEG_QUALITY, optimize=True)
+    return out.getvalue(), phash
+
+
+def make_thumbnails(source: Union[bytes, BinaryIO], sizes: Dict[str, int] = THUMBNAIL_SIZES) -> Dict[str, bytes]:
+    """
+    Render WebP thumbnails of an image (blocking, CPU-bound).
+
+    Args:
+        source: Encoded image bytes or a binary file
+        sizes: Thumbnail name -> longest side in pixels
+
+    Returns:
+        Thumbnail name -> WebP bytes; images are never upscaled
+    """
+    image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    largest = max(sizes.values())
+    image.draft("RGB", (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+    thumbnails = {}
+    # Largest first, so each smaller size resamples an already reduced image
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, format="WEBP", quality=settings.THUMBNAIL_QUALITY, method=4)
+        thumbnails[name] = out.getvalue()
+    return thumbnails
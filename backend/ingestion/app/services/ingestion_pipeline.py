@@ -0,0 +1,796 @@
+"""
+Ingestion pipelines for text, PDFs and images.
+
+Each pipeline stores the upload, extracts text, chunks and embeds it,
+indexes the chunks in rag_service and saves the knowledge graph.
+
+Pipelines are declared as stage DAGs (see pipeline.py), so independent
+work overlaps: storage upload runs alongside text extraction, and graph
+extraction runs alongside embedding. Within the index stage, chunks are
+embedded and inserted through a bounded worker pool (see chunk_pool.py).
+PDFs and streamed text don't wait for the whole document: each chunk is
+indexed and grouped for graph extraction as soon as it is cut (see
+_index_chunk_stream).
+Chunk ids are assigned before both, so the graph stage can link each
+extracted entity to the chunks that mention it (see entity_mentions.py).
+They are derived from the user, the content hash and the chunk index, so
+a retried job overwrites its chunks instead of duplicating them.
+Stage progress is reported through an optional `report` callback, which
+the job worker persists on the job row.
+
+Document summaries are enrichment, not part of the upload: the PDF
+pipeline queues a deferred "summary" job (see summary_service.py) once
+the document is indexed. Likewise, graph writes schedule deferred
+"graph_snapshot" (see graph_snapshot.py) and "graph_analysis" (see
+graph_analysis.py) jobs.
+
+File pipelines read the upload from a single spooled temp file (see
+core/uploads.py) rather than passing copies of its bytes around.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from ..core.config import get_settings
+from ..core.uploads import SpooledUpload
+from .pipeline import Pipeline, Stage, ProgressCallback, no_progress
+from .chunk_pool import chunk_pool
+from .embedding_service import embedding_service
+from .storage_service import storage_service
+from .processing_service import processing_service
+from .image_preprocessing import THUMBNAIL_MIME_TYPE, make_thumbnails
+from .pdf_worker import PdfCpuLimitError
+from .graph_service import graph_extraction_service, merge_graphs
+from .chunker import make_chunker, estimate_tokens
+from .firestore_service import firestore_service
+from .graph_snapshot import graph_snapshot_service
+from .entity_mentions import entity_mention_service
+from .graph_analysis import graph_analysis_service, analyze_graph
+from .rag_client import rag_client
+from .summary_service import summary_service
+from .job_queue import job_queue
+
+settings = get_settings()
+
+# Namespace for deterministic chunk ids (uuid5 of user, content hash and chunk index)
+CHUNK_ID_NAMESPACE = uuid.UUID("8fd073c2-89ab-4d08-8ccf-9489f02bb344")
+
+
+class IngestionError(Exception):
+    """Permanent ingestion failure (bad input) that must not be retried."""
+
+
+def _stage(name: str, run, depends_on=()) -> Stage:
+    return Stage(name, run, depends_on=depends_on, timeout=settings.INGEST_STAGE_TIMEOUT)
+
+
+def chunk_id(user_id: str, content_hash: str, index: Any) -> uuid.UUID:
+    return uuid.uuid5(CHUNK_ID_NAMESPACE, f"{user_id}:{content_hash}:{index}")
+
+
+def document_chunk_ids(user_id: str, content_hash: str, chunks: Sequence[str]) -> List[str]:
+    """Stable document_chunks ids for a document's chunks."""
+    return [str(chunk_id(user_id, content_hash, index)) for index in range(len(chunks))]
+
+
+class TextChunkIds:
+    """
+    Stable document_chunks ids for the chunks of a text, assigned in order.
+
+    A streamed text's hash is only known at its end, so each id is derived
+    from a running hash of the chunks up to it instead. /ingest/text and
+    /ingest/text/stream chunk a text identically, so both give it the same
+    ids whichever endpoint it is sent to.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self._hash = hashlib.sha256()
+        self._count = 0
+
+    def next(self, chunk: str) -> str:
+        """Id of the next chunk of the text."""
+        self._hash.update(chunk.encode("utf-8"))
+        chunk_uuid = chunk_id(self.user_id, self._hash.hexdigest(), self._count)
+        self._count += 1
+        return str(chunk_uuid)
+
+
+async def _embed_and_index(user_id: str, chunks: List[str], metadata: Dict[str, Any],
+                           report: ProgressCallback,
+                           chunk_metadata: Optional[List[Dict[str, Any]]] = None,
+                           chunk_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Embed each chunk and insert it into rag_service through the chunk pool.
+
+    Chunks are processed concurrently, so stored metadata carries
+    chunk_index/chunk_count to keep document order recoverable.
+    `chunk_metadata` optionally adds per-chunk fields (e.g. page numbers);
+    `chunk_ids` optionally sets the stored ids (default: random).
+    """
+    total = len(chunks)
+    await report("index", chunks_total=total, chunks_done=0)
+    # Report roughly every 5% so large documents don't flood the job row
+    report_every = max(1, total // 20)
+
+    async def process_chunk(index: int, chunk_text: str) -> Dict[str, Any]:
+        embedding = await embedding_service.generate_embedding(chunk_text)
+        return await rag_client.insert_chunk(
+            user_id=user_id,
+            text=chunk_text,
+            embedding=embedding,
+            chunk_id=chunk_ids[index] if chunk_ids else None,
+            metadata={
+                **metadata,
+                **(chunk_metadata[index] if chunk_metadata else {}),
+                "chunk_index": index,
+                "chunk_count": total
+            }
+        )
+
+    async def on_done(done: int):
+        if done % report_every == 0 or done == total:
+            await report("index", chunks_done=done)
+
+    return await chunk_pool.map(chunks, process_chunk, on_done=on_done)
+
+
+async def save_graph(user_id: str, chunks: List[str],
+                     chunk_ids: Optional[Sequence[str]] = None,
+                     content_hash: Optional[str] = None) -> Dict[str, Any]:
+    """Extract the knowledge graph from chunks and save it to Firestore."""
+    if not chunks:
+        return {"entities": [], "relations": []}
+
+    return await store_graph(user_id, await graph_extraction_service.extract_from_chunks(chunks),
+                             chunk_ids, content_hash)
+
+
+async def store_graph(user_id: str, graph_data: Dict[str, Any],
+                      chunk_ids: Optional[Sequence[str]] = None,
+                      content_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Save extracted entities and relations to Firestore, patch the user's
+    graph snapshot and, given the chunks' ids, record which chunks mention
+    each entity.
+
+    Given the document's content hash, a document whose graph was already
+    saved (a retried job, a resumed bulk run) doesn't add its counts again.
+    """
+    if not graph_data["entities"] and not graph_data["relations"]:
+        return graph_data
+    if await firestore_service.save_graph(user_id, graph_data["entities"], graph_data["relations"], content_hash):
+        await graph_snapshot_service.apply(user_id, graph_data["entities"], graph_data["relations"])
+    else:
+        print(f"♻️ Graph of {content_hash} already saved for {user_id}, not counting it again")
+    chunk_entities = graph_data.get("chunk_entities")
+    if chunk_ids and chunk_entities and len(chunk_entities) == len(chunk_ids):
+        await entity_mention_service.record(user_id, chunk_ids, chunk_entities)
+    await graph_analysis_service.schedule(user_id)
+
+    return graph_data
+
+
+async def store_thumbnails(user_id: str, spooled: SpooledUpload) -> Dict[str, str]:
+    """
+    Render and store WebP previews of an image, named after its hash.
+
+    Returns:
+        Thumbnail name -> URL, or {} if the image can't be rendered
+    """
+    try:
+        with spooled.open() as f:
+            rendered = await asyncio.to_thread(make_thumbnails, f)
+    except Exception as e:
+        # Previews are optional; the image is still stored and indexed
+        print(f"⚠️ Could not render thumbnails for {spooled.filename}: {e}")
+        return {}
+    return dict(zip(rendered, await asyncio.gather(*(
+        storage_service.upload_bytes(
+            data,
+            folder=f"thumbnails/{user_id}",
+            name=f"{spooled.sha256}_{name}.webp",
+            content_type=THUMBNAIL_MIME_TYPE
+        )
+        for name, data in rendered.items()
+    ))))
+
+
+async def process_text(user_id: str, text: str, metadata: Optional[dict] = None,
+                       report: ProgressCallback = no_progress) -> Dict[str, Any]:
+    """Chunk, embed and index raw text, then extract its knowledge graph."""
+    chunk_metadata = {
+        **(metadata or {}),
+        "type": "text",
+        "source": "text_input"
+    }
+
+    async def chunk(results):
+        return embedding_service.chunk_text(text)
+
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    async def chunk_ids(results):
+        ids = TextChunkIds(user_id)
+        return [ids.next(chunk) for chunk in results["chunk"]]
+
+    async def index(results):
+        return await _embed_and_index(user_id, results["chunk"], chunk_metadata, report,
+                                      chunk_ids=results["chunk_ids"])
+
+    async def graph(results):
+        return await save_graph(user_id, results["chunk"], results["chunk_ids"], content_hash)
+
+    outcome = await Pipeline([
+        _stage("chunk", chunk),
+        _stage("chunk_ids", chunk_ids, ["chunk"]),
+        _stage("index", index, ["chunk", "chunk_ids"]),
+        _stage("graph", graph, ["chunk", "chunk_ids"]),
+    ]).run(report)
+
+    return {
+        "status": "success",
+        "user_id": user_id,
+        "chunks_processed": len(outcome["index"]),
+        "entities_extracted": len(outcome["graph"]["entities"]),
+        "relations_extracted": len(outcome["graph"]["relations"]),
+        "timings_ms": outcome.timings_ms,
+        "message": "Text successfully ingested and indexed"
+    }
+
+
+async def _index_chunk_stream(user_id: str, chunks: AsyncIterator[Dict[str, Any]],
+                              next_chunk_id: Callable[[str], str],
+                              chunk_metadata: Callable[[], Awaitable[Dict[str, Any]]],
+                              content_hash: Callable[[], str],
+                              report: ProgressCallback,
+                              check_duplicate: Optional[Callable[[], Awaitable[Optional[Dict[str, Any]]]]] = None
+                              ) -> Dict[str, Any]:
+    """
+    Embed, index and extract the graph of chunks while they are still being cut.
+
+    Chunks go through the chunk pool as soon as they are complete, and are
+    only pulled when a worker is free, which bounds memory to the chunks in
+    flight. Knowledge graph extraction starts on each prompt-sized group of
+    chunks as soon as it is complete, and the merged graph is saved once at
+    the end. At most GRAPH_EXTRACTION_CONCURRENCY groups are extracted at a
+    time; the reader waits for one to finish before it starts the next, so
+    pending groups don't hold the rest of the document in memory.
+
+    Args:
+        user_id: Owner of the document
+        chunks: Async iterator of chunk dicts with 'text' and optionally
+            more per-chunk metadata fields (e.g. page_start/page_end)
+        next_chunk_id: Returns the stored id of the next chunk, given its text
+        chunk_metadata: Coroutine function giving the metadata stored with every chunk
+        content_hash: Returns the document's hash once the chunks are exhausted
+        check_duplicate: See process_text_stream
+
+    Returns:
+        Dict with 'chunks' (count), 'graph' and 'first_chunk_ms', or
+        {'duplicate': result} if check_duplicate found an earlier result
+    """
+    started = time.perf_counter()
+    first_chunk_ms = None
+    graph_group: List[str] = []
+    graph_group_tokens = 0
+    graph_tasks: List[asyncio.Task] = []
+    graph_slots = asyncio.Semaphore(max(1, settings.GRAPH_EXTRACTION_CONCURRENCY))
+    # Chunk ids in stream order; graph groups cover the chunks in the same order
+    chunk_ids: List[str] = []
+
+    async def extract_group(group: List[str]) -> Dict[str, Any]:
+        try:
+            return await graph_extraction_service.extract_from_chunks(group)
+        finally:
+            graph_slots.release()
+
+    async def extract_graph_group(final: bool = False):
+        nonlocal graph_group, graph_group_tokens
+        if graph_group and (final or graph_group_tokens >= settings.GRAPH_PROMPT_MAX_TOKENS):
+            # Backpressure: wait for a free slot before reading further
+            await graph_slots.acquire()
+            graph_tasks.append(asyncio.create_task(extract_group(graph_group)))
+            graph_group, graph_group_tokens = [], 0
+
+    async def grouped_chunks():
+        nonlocal graph_group_tokens
+        async for chunk in chunks:
+            chunk_ids.append(next_chunk_id(chunk["text"]))
+            graph_group.append(chunk["text"])
+            graph_group_tokens += estimate_tokens(chunk["text"])
+            await extract_graph_group()
+            yield chunk
+
+    async def process_chunk(index: int, chunk: Dict[str, Any]) -> None:
+        nonlocal first_chunk_ms
+        embedding = await embedding_service.generate_embedding(chunk["text"])
+        await rag_client.insert_chunk(
+            user_id=user_id,
+            text=chunk["text"],
+            embedding=embedding,
+            chunk_id=chunk_ids[index],
+            metadata={
+                **await chunk_metadata(),
+                **{key: value for key, value in chunk.items() if key != "text"},
+                "chunk_index": index
+            }
+        )
+        if first_chunk_ms is None:
+            first_chunk_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    async def on_done(done: int):
+        await report("index", chunks_done=done)
+
+    try:
+        chunk_count = await chunk_pool.map_stream(grouped_chunks(), process_chunk, on_done=on_done)
+        if check_duplicate is not None:
+            previous = await check_duplicate()
+            if previous is not None:
+                for task in graph_tasks:
+                    task.cancel()
+                return {"duplicate": previous}
+        await extract_graph_group(final=True)
+        graph_data = await store_graph(user_id, merge_graphs(await asyncio.gather(*graph_tasks)), chunk_ids,
+                                       content_hash())
+    except BaseException:
+        for task in graph_tasks:
+            task.cancel()
+        raise
+
+    return {"chunks": chunk_count, "graph": graph_data, "first_chunk_ms": first_chunk_ms}
+
+
+async def process_text_stream(user_id: str, stream, report: ProgressCallback = no_progress,
+                              check_duplicate: Optional[Callable[[], Awaitable[Optional[Dict[str, Any]]]]] = None
+                              ) -> Dict[str, Any]:
+    """
+    Chunk, embed and index text while it is still being received.
+
+    Chunks are cut incrementally and indexed as soon as they are complete
+    (see _index_chunk_stream), so the first chunk is searchable long before
+    the body ends. Pieces are only read when a worker is free, which bounds
+    memory to the chunker's tail plus the chunks in flight.
+
+    Args:
+        user_id: Owner of the text
+        stream: Async iterable of text pieces with a `metadata` dict
+            (see text_stream.TextStream)
+        check_duplicate: Optional coroutine function awaited once the whole
+            text is indexed, before the graph is saved. If it returns a
+            result (an earlier ingestion of the same text), graph extraction
+            is abandoned and that result is returned instead; the chunks
+            were re-indexed under the ids they already had (see
+            TextChunkIds), whichever endpoint ingested the text first.
+    """
+    started = time.perf_counter()
+    # Hash of the whole text, like process_text's, for the graph
+    text_hash = hashlib.sha256()
+
+    async def chunks():
+        chunker = make_chunker()
+        async for piece in stream:
+            text_hash.update(piece.encode("utf-8"))
+            for chunk in chunker.feed(piece):
+                yield {"text": chunk["text"]}
+        for chunk in chunker.finish():
+            yield {"text": chunk["text"]}
+
+    async def chunk_metadata():
+        return {**stream.metadata, "type": "text", "source": "text_stream"}
+
+    indexed = await _index_chunk_stream(
+        user_id,
+        chunks(),
+        # Chunk ids in stream order, the same as process_text gives the text
+        TextChunkIds(user_id).next,
+        chunk_metadata,
+        text_hash.hexdigest,
+        report,
+        check_duplicate
+    )
+    if "duplicate" in indexed:
+        return indexed["duplicate"]
+
+    return {
+        "status": "success",
+        "user_id": user_id,
+        "chunks_processed": indexed["chunks"],
+        "entities_extracted": len(indexed["graph"]["entities"]),
+        "relations_extracted": len(indexed["graph"]["relations"]),
+        "timings_ms": {
+            "first_chunk": indexed["first_chunk_ms"],
+            "total": round((time.perf_counter() - started) * 1000, 1)
+        },
+        "message": "Text stream successfully ingested and indexed"
+    }
+
+
+async def process_pdf(user_id: str, spooled: SpooledUpload,
+                      report: ProgressCallback = no_progress) -> Dict[str, Any]:
+    """
+    Store, extract, chunk, embed, index and summarize a PDF upload.
+
+    Pages are chunked as their ranges are parsed, and each chunk is indexed
+    and fed to graph extraction as soon as it is cut (see
+    _index_chunk_stream), so the document's chunks are never all held at
+    once. Parsing starts alongside the storage upload; chunks only wait for
+    the file URL they are stored with.
+    """
+    filename = spooled.filename
+    file_url: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    async def upload(results):
+        with spooled.as_upload_file() as file:
+            url = await storage_service.upload_file(file, folder=f"pdfs/{user_id}", content_hash=spooled.sha256)
+        file_url.set_result(url)
+        return url
+
+    async def chunk_metadata():
+        # Shielded: a cancelled chunk must not cancel the shared future
+        return {"type": "pdf", "source": filename, "file_url": await asyncio.shield(file_url)}
+
+    def check_text(pdf) -> None:
+        if len(pdf.preview.strip()) < 10:
+            raise IngestionError("Could not extract text from PDF")
+
+    async def index(results):
+        with spooled.as_upload_file() as file:
+            async with processing_service.stream_pdf(file) as pdf:
+
+                async def chunks():
+                    async for chunk in pdf:
+                        # A short document's only chunk is cut after its last page
+                        if pdf.complete:
+                            check_text(pdf)
+                        yield chunk
+                    check_text(pdf)
+
+                chunk_index = itertools.count()
+                try:
+                    indexed = await _index_chunk_stream(
+                        user_id,
+                        chunks(),
+                        lambda text: str(chunk_id(user_id, spooled.sha256, next(chunk_index))),
+                        chunk_metadata,
+                        lambda: spooled.sha256,
+                        report
+                    )
+                except PdfCpuLimitError as e:
+                    raise IngestionError(str(e))
+        return {**indexed, "pages": pdf.pages, "ocr_pages": pdf.ocr_pages}
+
+    async def metadata(results):
+        return await firestore_service.save_document_metadata(
+            user_id=user_id,
+            filename=filename,
+            file_url=results["upload"],
+            file_type="pdf",
+            chunks_count=results["index"]["chunks"],
+            content_hash=spooled.sha256
+        )
+
+    async def defer_summary(results):
+        return await asyncio.to_thread(
+            enqueue_summary,
+            user_id,
+            spooled.sha256,
+            filename,
+            results["upload"],
+            results["metadata"],
+            results["index"]["chunks"]
+        )
+
+    outcome = await Pipeline([
+        _stage("upload", upload),
+        _stage("index", index),
+        _stage("metadata", metadata, ["upload", "index"]),
+        _stage("defer_summary", defer_summary, ["metadata"]),
+    ]).run(report)
+
+    return {
+        "status": "success",
+        "user_id": user_id,
+        "file_url": outcome["upload"],
+        "pages": outcome["index"]["pages"],
+        "ocr_pages": outcome["index"]["ocr_pages"],
+        "chunks_processed": outcome["index"]["chunks"],
+        "entities_extracted": len(outcome["index"]["graph"]["entities"]),
+        "relations_extracted": len(outcome["index"]["graph"]["relations"]),
+        "summary_job_id": outcome["defer_summary"]["job_id"],
+        "timings_ms": outcome.timings_ms,
+        "message": "PDF processed and indexed"
+    }
+
+
+async def process_image(user_id: str, spooled: SpooledUpload,
+                        report: ProgressCallback = no_progress) -> Dict[str, Any]:
+    """Store, OCR, chunk, embed and index an image upload."""
+    filename = spooled.filename
+
+    async def upload(results):
+        with spooled.as_upload_file() as file:
+            return await storage_service.upload_file(file, folder=f"images/{user_id}", content_hash=spooled.sha256)
+
+    async def thumbnails(results):
+        return await store_thumbnails(user_id, spooled)
+
+    async def extract(results):
+        # Extract text using Gemini Vision OCR
+        with spooled.as_upload_file() as file:
+            return await processing_service.extract_text_from_image(file)
+
+    async def chunk(results):
+        text = results["extract"]
+        if not text or len(text.strip()) < 5:
+            # Image reference is still saved even without OCR text
+            return []
+        return embedding_service.chunk_text(text)
+
+    async def chunk_ids(results):
+        return document_chunk_ids(user_id, spooled.sha256, results["chunk"])
+
+    async def graph(results):
+        return await save_graph(user_id, results["chunk"], results["chunk_ids"], spooled.sha256)
+
+    async def index(results):
+        file_url = results["upload"]
+        # Image chunks have special metadata for UI display
+        return await _embed_and_index(
+            user_id,
+            results["chunk"],
+            {
+                "type": "image",
+                "source": filename,
+                "file_url": file_url,
+                "image_url": file_url,  # For RAG response
+                "thumbnail_urls": results["thumbnails"]
+            },
+            report,
+            chunk_ids=results["chunk_ids"]
+        )
+
+    async def metadata(results):
+        return await firestore_service.save_document_metadata(
+            user_id=user_id,
+            filename=filename,
+            file_url=results["upload"],
+            file_type="image",
+            chunks_count=len(results["chunk"]),
+            content_hash=spooled.sha256
+        )
+
+    outcome = await Pipeline([
+        _stage("upload", upload),
+        _stage("extract", extract),
+        _stage("chunk", chunk, ["extract"]),
+        _stage("chunk_ids", chunk_ids, ["chunk"]),
+        _stage("thumbnails", thumbnails),
+        _stage("index", index, ["upload", "thumbnails", "chunk", "chunk_ids"]),
+        _stage("graph", graph, ["chunk", "chunk_ids"]),
+        _stage("metadata", metadata, ["index"]),
+    ]).run(report)
+
+    result = {
+        "status": "success",
+        "user_id": user_id,
+        "file_url": outcome["upload"],
+        "thumbnail_urls": outcome["thumbnails"],
+        "chunks_processed": len(outcome["index"]),
+        "timings_ms": outcome.timings_ms,
+    }
+    if not outcome["chunk"]:
+        result["message"] = "Image uploaded but no text could be extracted"
+        return result
+
+    result.update({
+        "entities_extracted": len(outcome["graph"]["entities"]),
+        "relations_extracted": len(outcome["graph"]["relations"]),
+        "message": "Image processed with OCR and indexed"
+    })
+    return result
+
+
+def enqueue_summary(user_id: str, content_hash: str, filename: str, file_url: Optional[str],
+                    doc_id: Optional[str], chunk_count: int) -> Dict[str, Any]:
+    """
+    Queue a deferred "summary" job for an indexed document (blocking).
+
+    The payload only references the document: the job reads its chunks
+    back from rag_service by their ids, which are derived from the content
+    hash (see document_chunk_ids), so the text is neither copied into the
+    job row nor parsed again. One summary job is kept per document, like
+    uploads.
+
+    Args:
+        user_id: Owner of the document
+        content_hash: SHA-256 of the uploaded file
+        filename: Original filename
+        file_url: Storage URL of the file
+        doc_id: Firestore document metadata ID to attach the summary to
+        chunk_count: Number of chunks the document was indexed as
+
+    Returns:
+        Job dict (see job_queue.enqueue)
+    """
+    payload = json.dumps({
+        "filename": filename,
+        "file_url": file_url,
+        "doc_id": doc_id,
+        "content_hash": content_hash,
+        "chunk_count": chunk_count
+    }).encode("utf-8")
+    return job_queue.enqueue(
+        user_id=user_id,
+        kind="summary",
+        payload=payload,
+        content_hash=f"summary:{content_hash}",
+        filename=filename,
+        content_type="application/json"
+    )
+
+
+async def process_summary(user_id: str, request: Dict[str, Any],
+                          report: ProgressCallback = no_progress) -> Dict[str, Any]:
+    """Summarize an indexed document, index the summary and attach it to its metadata."""
+    filename = request["filename"]
+
+    async def load(results):
+        if "chunks" in request:
+            # Queued before summary jobs referenced their document
+            return request["chunks"]
+        ids = [str(chunk_id(user_id, request["content_hash"], index)) for index in range(request["chunk_count"])]
+        return [chunk["text"] for chunk in await rag_client.get_chunks(user_id, ids)]
+
+    async def summarize(results):
+        return await summary_service.summarize_document(results["load"], report=report)
+
+    async def index_summary(results):
+        summary = results["summarize"]["summary"]
+        if not summary:
+            return None
+        # Index summary as a special chunk for high-level retrieval
+        return await rag_client.insert_chunk(
+            user_id=user_id,
+            text=f"Document Summary for {filename}:\n{summary}",
+            embedding=await embedding_service.generate_embedding(f"Summary of {filename}: {summary}"),
+            metadata={
+                "type": "summary",
+                "source": filename,
+                "file_url": request["file_url"],
+                "is_summary": True
+            }
+        )
+
+    async def metadata(results):
+        summary = results["summarize"]["summary"]
+        if summary and request.get("doc_id"):
+            await firestore_service.update_document_summary(user_id, request["doc_id"], summary)
+
+    outcome = await Pipeline([
+        _stage("load", load),
+        _stage("summarize", summarize, ["load"]),
+        _stage("index_summary", index_summary, ["summarize"]),
+        _stage("metadata", metadata, ["summarize"]),
+    ]).run(report)
+
+    return {
+        "status": "success",
+        "user_id": user_id,
+        "summary": outcome["summarize"]["summary"],
+        "sections": outcome["summarize"]["sections"],
+        "levels": outcome["summarize"]["levels"],
+        "timings_ms": outcome.timings_ms,
+        "message": "Document summarized"
+    }
+
+
+async def process_graph_snapshot(user_id: str, request: Dict[str, Any],
+                                 report: ProgressCallback = no_progress) -> Dict[str, Any]:
+    """Fold the documents saved since the last run into the user's graph snapshot."""
+
+    async def compact(results):
+        return await graph_snapshot_service.compact(user_id)
+
+    outcome = await Pipeline([
+        _stage("compact", compact),
+    ]).run(report)
+
+    return {
+        "status": "success",
+        "user_id": user_id,
+        "version": outcome["compact"],
+        "timings_ms": outcome.timings_ms,
+        "message": "Graph snapshot updated" if outcome["compact"] else "Graph snapshot is up to date"
+    }
+
+
+async def process_graph_analysis(user_id: str, request: Dict[str, Any],
+                                 report: ProgressCallback = no_progress) -> Dict[str, Any]:
+    """Compute communities and PageRank of the user's graph snapshot and store the overview."""
+
+    async def load(results):
+        return await graph_snapshot_service.get(user_id)
+
+    async def analyze(results):
+        snapshot = results["load"]
+        # Already analyzed at this version (e.g. a retried job)
+        if snapshot is None or snapshot["version"] == await graph_analysis_service.analyzed_version(user_id):
+            return None
+        nodes = {name: mentions for name, mentions in snapshot["nodes"]["rows"]}
+        edges = {(source, target, relation): weight for source, target, relation, weight in snapshot["edges"]["rows"]}
+        return await asyncio.to_thread(analyze_graph, nodes, edges)
+
+    async def store(results):
+        if results["analyze"] is not None:
+            await graph_analysis_service.store(user_id, results["load"]["version"], results["analyze"])
+
+    outcome = await Pipeline([
+        _stage("load", load),
+        _stage("analyze", analyze, ["load"]),
+        _stage("store", store, ["analyze"]),
+    ]).run(report)
+
+    overview = outcome["analyze"]
+    return {
+        "status": "success",
+        "user_id": user_id,
+        "version": outcome["load"]["version"] if outcome["load"] else None,
+        "clusters": len(overview["clusters"]) if overview else None,
+        "nodes": len(overview["nodes"]) if overview else None,
+        "timings_ms": outcome.timings_ms,
+        "message": "Graph analyzed" if overview else "Graph analysis is up to date"
+    }
+
+
+FILE_PIPELINES = {
+    "pdf": process_pdf,
+    "image": process_image,
+}
+
+# Jobs whose payload is a JSON request rather than an uploaded file
+DEFERRED_PIPELINES = {
+    "summary": process_summary,
+    "graph_snapshot": process_graph_snapshot,
+    "graph_analysis": process_graph_analysis,
+}
+
+
+async def run_job(job: Dict[str, Any], report: ProgressCallback = no_progress) -> Dict[str, Any]:
+    """Run the pipeline for a claimed ingestion job."""
+    deferred = DEFERRED_PIPELINES.get(job["kind"])
+    if deferred is not None:
+        request = json.loads(bytes(job.pop("payload")))
+        return await deferred(job["user_id"], request, report=report)
+
+    pipeline = FILE_PIPELINES.get(job["kind"])
+    if pipeline is None:
+        raise IngestionError(f"Unknown job kind: {job['kind']}")
+
+    payload_path = job.get("payload_path")
+    if payload_path is not None:
+        # Stages read the queued file in place; the queue removes it when the job finishes
+        try:
+            size = os.path.getsize(payload_path)
+        except FileNotFoundError:
+            raise IngestionError("Queued upload file is missing")
+        spooled = SpooledUpload(payload_path, size, job["content_hash"], job["filename"], job["content_type"])
+        return await pipeline(job["user_id"], spooled, report=report)
+
+    # Jobs queued with the upload inline: spool the payload to disk once,
+    # so stages read the file and the in-memory payload is released
+    spooled = await asyncio.to_thread(
+        SpooledUpload.from_bytes,
+        job.pop("payload"),
+        job["filename"],
+        job["content_type"],
+        job["content_hash"]
+    )
+    with spooled:
+        return await pipeline(job["user_id"], spooled, report=report)
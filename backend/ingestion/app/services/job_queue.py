@@ -0,0 +1,322 @@
+"""
+Durable ingestion job queue.
+
+Jobs live in the Postgres `ingestion_jobs` table. Workers claim them with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers can poll the
+same table without handing out a job twice. Failed jobs are retried with
+exponential backoff up to `max_attempts`.
+
+Uploaded files are not stored in the row: the spooled file is linked into
+INGEST_QUEUE_DIR and the row keeps its path, so queueing a file never
+copies it into memory. The file is removed once the job finishes.
+Succeeded housekeeping jobs (PRUNED_KINDS) are deleted rather than kept.
+"""
+
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Union
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
+
+from ..core.config import get_settings
+from ..core.database import SessionLocal, IngestionJob
+from ..core.uploads import SpooledUpload
+
+settings = get_settings()
+
+# Housekeeping jobs, queued per user and time window rather than per upload.
+# Nobody polls them, so their rows are deleted once they succeed instead of
+# piling up.
+PRUNED_KINDS = {"graph_snapshot", "graph_analysis"}
+
+
+class JobQueue:
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+
+    @staticmethod
+    def _to_dict(job: IngestionJob, include_payload: bool = False) -> Dict[str, Any]:
+        data = {
+            "job_id": job.id,
+            "user_id": job.user_id,
+            "kind": job.kind,
+            "status": job.status,
+            "filename": job.filename,
+            "content_type": job.content_type,
+            "content_hash": job.content_hash,
+            "stage": job.stage,
+            "progress": job.progress or {},
+            "attempts": job.attempts,
+            "max_attempts": job.max_attempts,
+            "result": job.result,
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        }
+        if include_payload:
+            data["payload"] = job.payload
+            data["payload_path"] = job.payload_path
+        return data
+
+    @staticmethod
+    def _keep_upload(upload: SpooledUpload, job_id: str) -> str:
+        """Link (or, across filesystems, copy) a spooled upload into the queue directory."""
+        os.makedirs(settings.INGEST_QUEUE_DIR, exist_ok=True)
+        path = os.path.join(settings.INGEST_QUEUE_DIR, job_id + os.path.splitext(upload.path)[1])
+        try:
+            os.link(upload.path, path)
+        except OSError:
+            shutil.copyfile(upload.path, path)
+        return path
+
+    @staticmethod
+    def _drop_upload(path: Optional[str]) -> None:
+        if path is None:
+            return
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _find_live(self, db, user_id: str, content_hash: str,
+                   idempotency_key: Optional[str] = None) -> Optional[IngestionJob]:
+        """Find a job that is queued, running or succeeded for this upload."""
+        matches = [IngestionJob.content_hash == content_hash]
+        if idempotency_key:
+            matches.append(IngestionJob.idempotency_key == idempotency_key)
+
+        return (
+            db.query(IngestionJob)
+            .filter(
+                IngestionJob.user_id == user_id,
+                IngestionJob.status != "failed",
+                or_(*matches)
+            )
+            .order_by(IngestionJob.created_at.desc())
+            .first()
+        )
+
+    def enqueue(
+        self,
+        user_id: str,
+        kind: str,
+        payload: Optional[Union[bytes, memoryview]],
+        content_hash: str,
+        filename: Optional[str] = None,
+        content_type: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        run_after: Optional[datetime] = None,
+        upload: Optional[SpooledUpload] = None
+    ) -> Dict[str, Any]:
+        """
+        Add an ingestion job, or return the existing one for the same upload.
+
+        Args:
+            user_id: Owner of the upload
+            kind: Pipeline to run ("pdf", "image", "summary", "graph_snapshot"
+                or "graph_analysis")
+            payload: JSON request for deferred jobs (None for uploads)
+            content_hash: SHA-256 of the upload or payload
+            filename: Original filename
+            content_type: Upload MIME type
+            idempotency_key: Optional client-supplied Idempotency-Key
+            run_after: Earliest time to run the job (default now)
+            upload: Spooled upload file for file jobs; the queue keeps its own link to it
+
+        Returns:
+            Job dict, with "deduplicated": True if an existing job was reused
+        """
+        with self._session_factory() as db:
+            existing = self._find_live(db, user_id, content_hash, idempotency_key)
+            if existing is not None:
+                return {**self._to_dict(existing), "deduplicated": True}
+
+            job_id = str(uuid.uuid4())
+            payload_path = self._keep_upload(upload, job_id) if upload is not None else None
+
+            now = datetime.utcnow()
+            job = IngestionJob(
+                id=job_id,
+                user_id=user_id,
+                kind=kind,
+                status="queued",
+                filename=filename,
+                content_type=content_type,
+                content_hash=content_hash,
+                idempotency_key=idempotency_key,
+                payload=payload,
+                payload_path=payload_path,
+                stage="queued",
+                progress={"stages": {}},
+                attempts=0,
+                max_attempts=settings.INGEST_JOB_MAX_ATTEMPTS,
+                run_after=run_after or now,
+                created_at=now,
+                updated_at=now
+            )
+            db.add(job)
+            try:
+                db.commit()
+            except IntegrityError:
+                # A concurrent retry of the same upload won the insert
+                db.rollback()
+                self._drop_upload(payload_path)
+                existing = self._find_live(db, user_id, content_hash, idempotency_key)
+                if existing is None:
+                    raise
+                return {**self._to_dict(existing), "deduplicated": True}
+            except BaseException:
+                self._drop_upload(payload_path)
+                raise
+
+            return self._to_dict(job)
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Claim the next runnable job for a worker.
+
+        Picks queued jobs whose backoff has elapsed, plus running jobs whose
+        worker stopped reporting progress (crashed or restarted).
+
+        Returns:
+            Job dict including payload and payload_path, or None if the queue is empty
+        """
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=settings.INGEST_JOB_LOCK_TIMEOUT)
+
+        with self._session_factory() as db:
+            job = (
+                db.query(IngestionJob)
+                .options(undefer(IngestionJob.payload))
+                .filter(or_(
+                    and_(IngestionJob.status == "queued", IngestionJob.run_after <= now),
+                    and_(IngestionJob.status == "running", IngestionJob.locked_at < stale_before)
+                ))
+                .order_by(IngestionJob.created_at)
+                .with_for_update(skip_locked=True)
+                .first()
+            )
+            if job is None:
+                return None
+
+            job.status = "running"
+            job.attempts += 1
+            job.locked_at = now
+            job.updated_at = now
+            data = self._to_dict(job, include_payload=True)
+            db.commit()
+            return data
+
+    def update_progress(self, job_id: str, stage: str, status: str = "running", **details: Any) -> None:
+        """
+        Record per-stage progress of a running job.
+
+        Also refreshes the job lock, so long jobs aren't re-claimed as stale.
+        """
+        with self._session_factory() as db:
+            job = db.get(IngestionJob, job_id)
+            if job is None:
+                return
+
+            progress = dict(job.progress or {})
+            stages = dict(progress.get("stages", {}))
+            stages[stage] = status
+            progress["stages"] = stages
+            progress.update(details)
+
+            now = datetime.utcnow()
+            job.stage = stage
+            job.progress = progress  # Reassign so SQLAlchemy sees the JSON change
+            job.locked_at = now
+            job.updated_at = now
+            db.commit()
+
+    def complete(self, job_id: str, result: Dict[str, Any]) -> None:
+        """Mark a job as succeeded (or delete it, for PRUNED_KINDS) and drop its payload."""
+        with self._session_factory() as db:
+            job = db.get(IngestionJob, job_id)
+            if job is None:
+                return
+
+            payload_path = job.payload_path
+            if job.kind in PRUNED_KINDS:
+                db.delete(job)
+                db.commit()
+                self._drop_upload(payload_path)
+                return
+
+            job.status = "succeeded"
+            job.stage = "done"
+            job.result = result
+            job.error = None
+            job.payload = None
+            job.payload_path = None
+            job.locked_at = None
+            job.updated_at = datetime.utcnow()
+            db.commit()
+        self._drop_upload(payload_path)
+
+    def fail(self, job_id: str, error: str, retry: bool = True) -> None:
+        """
+        Record a job failure.
+
+        Re-queues the job with exponential backoff while attempts remain,
+        otherwise marks it failed and drops its payload.
+        """
+        with self._session_factory() as db:
+            job = db.get(IngestionJob, job_id)
+            if job is None:
+                return
+
+            now = datetime.utcnow()
+            job.error = error
+            job.locked_at = None
+            job.updated_at = now
+
+            payload_path = None
+            if retry and job.attempts < job.max_attempts:
+                job.status = "queued"
+                job.run_after = now + timedelta(
+                    seconds=settings.INGEST_JOB_RETRY_BACKOFF * (2 ** (job.attempts - 1))
+                )
+            else:
+                payload_path = job.payload_path
+                job.status = "failed"
+                job.payload = None
+                job.payload_path = None
+            db.commit()
+        self._drop_upload(payload_path)
+
+    def release(self, job_id: str) -> None:
+        """Put an interrupted job back in the queue without counting the attempt."""
+        with self._session_factory() as db:
+            job = db.get(IngestionJob, job_id)
+            if job is None or job.status != "running":
+                return
+
+            now = datetime.utcnow()
+            job.status = "queued"
+            job.attempts = max(job.attempts - 1, 0)
+            job.run_after = now
+            job.locked_at = None
+            job.updated_at = now
+            db.commit()
+
+    def get(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job owned by the user.
+
+        Returns:
+            Job dict, or None if it doesn't exist or belongs to another user
+        """
+        with self._session_factory() as db:
+            job = db.get(IngestionJob, job_id)
+            if job is None or job.user_id != user_id:
+                return None
+            return self._to_dict(job)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,95 @@
+"""
+Background workers for the ingestion job queue.
+
+Workers run as asyncio tasks inside the ingestion service. Each one polls
+the queue, runs the claimed job's pipeline and records progress, results
+and failures on the job row.
+"""
+
+import asyncio
+import traceback
+from typing import List
+
+from ..core.config import get_settings
+from .job_queue import job_queue
+from .ingestion_pipeline import run_job, IngestionError
+
+settings = get_settings()
+
+
+async def process_job(job: dict) -> None:
+    """Run one claimed job and record its outcome."""
+    job_id = job["job_id"]
+
+    # Stages run concurrently, so progress updates go through one writer task:
+    # the read-modify-write of job progress stays serialized, stages don't wait
+    # on the database, and cancelled stages can't leave a write in flight.
+    updates: asyncio.Queue = asyncio.Queue()
+
+    async def write_progress():
+        while True:
+            update = await updates.get()
+            if update is None:
+                return
+            stage, status, details = update
+            try:
+                await asyncio.to_thread(job_queue.update_progress, job_id, stage, status, **details)
+            except Exception as e:
+                print(f"⚠️ Could not record progress for job {job_id}: {e}")
+
+    async def report(stage: str, status: str = "running", **details):
+        updates.put_nowait((stage, status, details))
+
+    writer = asyncio.create_task(write_progress())
+
+    async def flush_progress():
+        updates.put_nowait(None)
+        await writer
+
+    try:
+        try:
+            result = await run_job(job, report=report)
+        finally:
+            await asyncio.shield(flush_progress())
+        await asyncio.to_thread(job_queue.complete, job_id, result)
+        print(f"✅ Ingestion job {job_id} succeeded")
+    except asyncio.CancelledError:
+        # Service is shutting down; let another worker pick the job up
+        await asyncio.to_thread(job_queue.release, job_id)
+        raise
+    except IngestionError as e:
+        await asyncio.to_thread(job_queue.fail, job_id, str(e), False)
+        print(f"❌ Ingestion job {job_id} failed: {e}")
+    except Exception as e:
+        print(f"❌ Ingestion job {job_id} attempt {job['attempts']} failed: {e}")
+        print(traceback.format_exc())
+        await asyncio.to_thread(job_queue.fail, job_id, str(e), True)
+
+
+async def worker_loop(worker_id: int) -> None:
+    """Poll the queue forever, processing one job at a time."""
+    while True:
+        try:
+            job = await asyncio.to_thread(job_queue.claim)
+        except Exception as e:
+            print(f"❌ Worker {worker_id} could not claim a job: {e}")
+            job = None
+
+        if job is None:
+            await asyncio.sleep(settings.INGEST_JOB_POLL_INTERVAL)
+            continue
+
+        await process_job(job)
+
+
+def start_workers(count: int = None) -> List[asyncio.Task]:
+    """Start background workers on the running event loop."""
+    count = settings.INGEST_WORKERS if count is None else count
+    return [asyncio.create_task(worker_loop(i)) for i in range(count)]
+
+
+async def stop_workers(tasks: List[asyncio.Task]) -> None:
+    """Cancel workers; their interrupted jobs are released back to the queue right away."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
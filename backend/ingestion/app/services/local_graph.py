@@ -0,0 +1,133 @@
+"""
+Local, rule-based knowledge graph extraction.
+
+A CPU-only alternative to the Gemini extractor (see graph_service.py),
+with no network access:
+
+- Entities are capitalized phrases (Latin or Cyrillic, up to four words,
+  with connectors like "of" or "de" inside), acronyms (NASA, ҚазҰУ) and
+  CamelCase names (PostgreSQL).
+- A single capitalized word at the start of a sentence is ambiguous
+  ("Then", "Today"); it is kept only if the document also capitalizes
+  it mid-sentence, which is the statistical part of the rules.
+- Relations are co-occurrences: entities in the same sentence are linked
+  with a "relates_to" edge.
+
+It is a fraction of a millisecond per chunk, so it can cover every chunk
+of every document; the LLM can then be reserved for typing relations.
+"""
+
+import re
+from typing import Any, Dict, List, Set, Tuple
+
+_UPPER = "A-ZА-ЯЁӘҒҚҢӨҰҮҺІЄЇЎ"
+_LOWER = "a-zа-яёәғқңөұүһіієїў"
+_WORD = f"[{_UPPER}][{_UPPER}{_LOWER}0-9'’-]*"
+_CONNECTOR = r"(?:of|the|de|la|du|van|von|der|for)"
+
+CANDIDATE = re.compile(
+    rf"(?<![\w-]){_WORD}(?:(?:\s+{_CONNECTOR})?\s+{_WORD}){{0,3}}(?![\w-])"
+)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?…。！？])\s+|\n\s*\n")
+POSSESSIVE = re.compile(r"['’]s$")
+
+# Capitalized words that are never entities on their own
+STOPWORDS = frozenset("""
+a an the this that these those there here it its he she they we you i my our your their his her
+in on at by for from with without to of and or but if then than so as also however therefore
+when where while what which who whom whose why how after before during since until about above
+below between into through over under again further once all any both each few more most other
+some such no nor not only own same too very can will just should now yes is are was were be been
+mr mrs ms dr prof monday tuesday wednesday thursday friday saturday sunday today yesterday tomorrow
+january february march april may june july august september october november december
+figure table chapter section page note example see fig
+в на с по из за к от до о об у и а но или что это этот эта эти как так же для при если когда
+где который которая которые его ее их мы вы они он она оно я мой наш ваш тот та те все всё
+бұл сол осы мен бен пен және үшін туралы да де ол олар біз сіз мен
+""".split())
+
+# Entities linked per sentence; caps the quadratic pair count on dense lists
+MAX_SENTENCE_ENTITIES = 8
+
+
+def _normalize(phrase: str) -> str:
+    return POSSESSIVE.sub("", " ".join(phrase.split())).strip("'’-").lower()
+
+
+def _is_acronym(word: str) -> bool:
+    return len(word) >= 2 and word.isupper()
+
+
+def _is_camel(word: str) -> bool:
+    return any(c.isupper() for c in word[1:]) and any(c.islower() for c in word)
+
+
+def _candidates(sentence: str) -> List[Tuple[str, bool]]:
+    """(entity name, ambiguous) pairs of one sentence, in order."""
+    found = []
+    for match in CANDIDATE.finditer(sentence):
+        words = match.group().split()
+        # Trim stopwords off either end ("The Ministry of Health" -> "Ministry of Health")
+        while words and words[0].lower() in STOPWORDS and not _is_acronym(words[0]):
+            words.pop(0)
+        while words and words[-1].lower() in STOPWORDS and not _is_acronym(words[-1]):
+            words.pop()
+        if not words:
+            continue
+        name = _normalize(" ".join(words))
+        if len(name) < 2 or name.isdigit():
+            continue
+        single = len(words) == 1 and not _is_acronym(words[0]) and not _is_camel(words[0])
+        # A lone capitalized word is ambiguous only at the start of the sentence
+        at_start = not sentence[:match.start()].strip(" \t\"'«“(-–—")
+        found.append((name, single and at_start))
+    return found
+
+
+class LocalGraphExtractor:
+    """Rule-based per-chunk entity and co-occurrence relation extraction."""
+
+    def extract(self, chunks: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Extract entities and relations from each chunk.
+
+        Args:
+            chunks: Text chunks of one document
+
+        Returns:
+            Chunk text -> dict with 'entities' and 'relations'
+        """
+        parsed: Dict[str, List[List[Tuple[str, bool]]]] = {}
+        confirmed: Set[str] = set()
+        for chunk in chunks:
+            if chunk in parsed:
+                continue
+            sentences = [_candidates(sentence) for sentence in SENTENCE_SPLIT.split(chunk)]
+            parsed[chunk] = sentences
+            for candidates in sentences:
+                confirmed.update(name for name, ambiguous in candidates if not ambiguous)
+
+        results = {}
+        for chunk, sentences in parsed.items():
+            entities: Dict[str, None] = {}
+            relations: Dict[Tuple[str, str], None] = {}
+            for candidates in sentences:
+                names = list(dict.fromkeys(
+                    name for name, ambiguous in candidates if not ambiguous or name in confirmed
+                ))
+                entities.update(dict.fromkeys(names))
+                linked = names[:MAX_SENTENCE_ENTITIES]
+                for i, source in enumerate(linked):
+                    for target in linked[i + 1:]:
+                        relations[(source, target)] = None
+            results[chunk] = {
+                "entities": list(entities),
+                "relations": [
+                    {"source": source, "target": target, "type": "relates_to"}
+                    for source, target in relations
+                ]
+            }
+        return results
+
+
+local_graph_extractor = LocalGraphExtractor()
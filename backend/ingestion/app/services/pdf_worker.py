@@ -0,0 +1,112 @@
+"""
+PDF page-range parsing for the ingestion process pool.
+
+Runs inside pool worker processes, so it only depends on pypdf and can be
+imported cheaply by spawned workers.
+
+In a worker process, a range's CPU budget is enforced by the kernel: the
+RLIMIT_CPU soft limit is set just past the budget, and the SIGXCPU it
+sends interrupts parsing even in the middle of a pathological page. When
+parsing runs in a thread instead (PDF_PARSE_WORKERS=0), signals are not
+available and the budget is only checked between pages.
+"""
+
+import math
+import resource
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+# (page_number, text, images needing OCR)
+PageText = Tuple[int, str, List[bytes]]
+
+
+class PdfCpuLimitError(Exception):
+    """Raised when parsing a document uses more CPU time than allowed."""
+
+    def __init__(self, cpu_seconds: float, limit: float):
+        super().__init__(cpu_seconds, limit)
+        self.cpu_seconds = cpu_seconds
+        self.limit = limit
+
+    def __str__(self) -> str:
+        return f"PDF parsing used {self.cpu_seconds:.1f}s of CPU, limit is {self.limit:g}s"
+
+
+def count_pages(path: str) -> int:
+    """Return the number of pages in a PDF."""
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def _page_images(page) -> List[bytes]:
+    """Encoded images embedded in a page (what a scanner puts on a page)."""
+    try:
+        return [image.data for image in page.images]
+    except Exception:
+        # Unsupported image filters shouldn't fail the whole document
+        return []
+
+
+@contextmanager
+def _cpu_limit(limit: float) -> Iterator[None]:
+    """Raise PdfCpuLimitError in the block once it uses `limit` CPU seconds (main thread only)."""
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    started = time.process_time()
+
+    def over_limit(signum, frame):
+        raise PdfCpuLimitError(time.process_time() - started, limit)
+
+    previous_limit = resource.getrlimit(resource.RLIMIT_CPU)
+    hard = previous_limit[1]
+    # RLIMIT_CPU counts the whole process's CPU seconds, so it is set relative to now
+    soft = max(math.ceil(started + limit), 1)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    previous_handler = signal.signal(signal.SIGXCPU, over_limit)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, previous_limit)
+        signal.signal(signal.SIGXCPU, previous_handler)
+
+
+def extract_page_range(path: str, start: int, stop: int, cpu_limit: float,
+                       collect_images: bool = False) -> Tuple[List[PageText], float]:
+    """
+    Extract text from pages [start, stop) of a PDF.
+
+    Args:
+        path: Path to the PDF on local disk
+        start: First page index (0-based)
+        stop: Page index to stop before
+        cpu_limit: CPU seconds this range may use (see the module docstring)
+        collect_images: Also return embedded images of pages without a text layer
+
+    Returns:
+        ([(page_number, text, images), ...], cpu_seconds_used) with 1-based
+        page numbers; images is empty unless the page needs OCR
+    """
+    from pypdf import PdfReader
+
+    started = time.process_time()
+    pages = []
+    with _cpu_limit(cpu_limit):
+        reader = PdfReader(path)
+        for index in range(start, stop):
+            page = reader.pages[index]
+            text = page.extract_text() or ""
+            images = _page_images(page) if collect_images and not text.strip() else []
+            pages.append((index + 1, text, images))
+            used = time.process_time() - started
+            if used > cpu_limit:
+                raise PdfCpuLimitError(used, cpu_limit)
+
+    return pages, time.process_time() - started
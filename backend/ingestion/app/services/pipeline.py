@@ -0,0 +1,138 @@
+"""
+Stage-level DAG executor for ingestion pipelines.
+
+A pipeline is a set of named stages with declared dependencies. Every
+stage starts as soon as all of its dependencies have finished, so
+independent stages (e.g. storage upload and text extraction) run
+concurrently. Each stage gets an optional timeout and is timed.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+
+StageFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+ProgressCallback = Callable[..., Awaitable[None]]
+
+
+async def no_progress(stage: str, status: str = "running", **details: Any) -> None:
+    pass
+
+
+class StageTimeoutError(TimeoutError):
+    """Raised when a stage exceeds its timeout."""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"Stage '{stage}' timed out after {timeout:g}s")
+        self.stage = stage
+        self.timeout = timeout
+
+
+@dataclass
+class Stage:
+    """
+    A pipeline stage.
+
+    Attributes:
+        name: Unique stage name, also used for progress reporting
+        run: Coroutine function called with the results of completed stages
+        depends_on: Names of stages that must finish first
+        timeout: Seconds the stage may run, or None for no limit
+    """
+    name: str
+    run: StageFunc
+    depends_on: Sequence[str] = ()
+    timeout: Optional[float] = None
+
+
+@dataclass
+class PipelineResult:
+    """Stage outputs keyed by stage name, plus per-stage wall time in ms."""
+    results: Dict[str, Any] = field(default_factory=dict)
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+    def __getitem__(self, stage: str) -> Any:
+        return self.results[stage]
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Duplicate stage names in pipeline")
+        self._validate()
+
+    def _validate(self) -> None:
+        """Reject unknown dependencies and cycles."""
+        for stage in self.stages.values():
+            for dep in stage.depends_on:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+
+        visiting, done = set(), set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].depends_on:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    async def run(self, report: ProgressCallback = no_progress) -> PipelineResult:
+        """
+        Run all stages, each as soon as its dependencies are done.
+
+        If any stage fails or times out, the remaining stages are cancelled
+        and the original exception is raised.
+
+        Args:
+            report: Optional progress callback called as report(stage, status)
+
+        Returns:
+            PipelineResult with every stage's output and timing
+        """
+        outcome = PipelineResult()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: Stage) -> Any:
+            if stage.depends_on:
+                await asyncio.gather(*(tasks[dep] for dep in stage.depends_on))
+
+            await report(stage.name)
+            started = time.perf_counter()
+            try:
+                if stage.timeout is None:
+                    result = await stage.run(outcome.results)
+                else:
+                    try:
+                        result = await asyncio.wait_for(stage.run(outcome.results), stage.timeout)
+                    except asyncio.TimeoutError:
+                        raise StageTimeoutError(stage.name, stage.timeout)
+            finally:
+                outcome.timings_ms[stage.name] = round((time.perf_counter() - started) * 1000, 1)
+
+            outcome.results[stage.name] = result
+            await report(stage.name, "done", timings_ms=dict(outcome.timings_ms))
+            return result
+
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.create_task(run_stage(stage))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        return outcome
@@ -1,9 +1,24 @@
-import io
+import asyncio
+import hashlib
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 from pypdf import PdfReader
 from fastapi import UploadFile
 import google.generativeai as genai
-from PIL import Image
 from ..core.config import get_settings
+from .embedding_service import embedding_service
+from .chunker import make_chunker
+from .pdf_worker import PdfCpuLimitError, count_pages, extract_page_range
+from .image_preprocessing import OCR_MIME_TYPE, prepare_for_ocr
+from .cache_service import ocr_cache
 
 settings = get_settings()
 
@@ -11,66 +26,315 @@ settings = get_settings()
 genai.configure(api_key=settings.GEMINI_API_KEY)
 
 
+class PdfChunkStream:
+    """
+    Page-tagged chunks of a PDF, cut as its pages are parsed (see ProcessingService.stream_pdf).
+
+    Iterate it once for the chunk dicts ('text', 'page_start', 'page_end').
+    `pages` is known from the start; `preview` (the leading
+    PREVIEW_MAX_CHARS characters) and `ocr_pages` fill in as pages arrive,
+    and `complete` is set once every page has been read.
+    """
+
+    def __init__(self):
+        self.pages = 0
+        self.ocr_pages = 0
+        self.complete = False
+        self._preview: List[str] = []
+        self._preview_chars = 0
+        self._chunks: Optional[AsyncIterator[Dict[str, Any]]] = None
+
+    @property
+    def preview(self) -> str:
+        return "\n".join(self._preview)
+
+    def add_preview(self, page_text: str) -> None:
+        if page_text and self._preview_chars < ProcessingService.PREVIEW_MAX_CHARS:
+            self._preview.append(page_text[:ProcessingService.PREVIEW_MAX_CHARS - self._preview_chars])
+            self._preview_chars += len(self._preview[-1]) + 1
+
+    def __aiter__(self) -> AsyncIterator[Dict[str, Any]]:
+        return self._chunks
+
+
 class ProcessingService:
+    # Leading characters of a document kept as its preview (to detect text-less PDFs)
+    PREVIEW_MAX_CHARS = 30000
+
+    # Use gemini-2.5-flash for vision (gemini-pro-vision is deprecated)
+    VISION_MODEL = "gemini-2.5-flash"
+    IMAGE_PROMPT = "Extract all text from this image. If there is no text, describe what you see in detail."
+    SCANNED_PAGE_PROMPT = "Extract all text from this scanned document page. Return only the text."
+
     def __init__(self):
-        # Use gemini-2.5-flash for vision (gemini-pro-vision is deprecated)
-        self.vision_model = genai.GenerativeModel('gemini-2.5-flash')
-
-    async def extract_text_from_pdf(self, file: UploadFile) -> str:
-        """Extract text from uploaded PDF file."""
-        content = await file.read()
-        pdf_file = io.BytesIO(content)
-        reader = PdfReader(pdf_file)
-        
-        text = ""
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-            
-        # Reset file cursor for subsequent operations if needed
-        await file.seek(0)
-        return text
+        self.vision_model = genai.GenerativeModel(self.VISION_MODEL)
+        self._pdf_pool: Optional[ProcessPoolExecutor] = None
+        # OCR of scanned PDF pages: bounded parallelism, LRU cache by image hash
+        self._ocr_slots = asyncio.Semaphore(settings.PDF_OCR_CONCURRENCY)
+        self._ocr_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._ocr_in_flight: Dict[str, asyncio.Task] = {}
 
-    async def extract_text_from_image(self, file: UploadFile) -> str:
-        """Extract text from image using Gemini Vision."""
-        content = await file.read()
-        image = Image.open(io.BytesIO(content))
-        
-        response = self.vision_model.generate_content(
-            [
-                "Extract all text from this image. If there is no text, describe what you see in detail.",
-                image
-            ]
-        )
-        
-        # Reset file cursor
-        await file.seek(0)
-        return response.text if response.text else ""
+    def _get_pdf_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Lazily start the PDF parsing process pool (None when disabled)."""
+        if settings.PDF_PARSE_WORKERS <= 0:
+            return None
+        if self._pdf_pool is None:
+            # Spawn, not fork: the service process runs threads and an event loop
+            self._pdf_pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pdf_pool
 
-    async def summarize_text(self, text: str) -> str:
+    def shutdown(self) -> None:
+        """Stop the PDF parsing process pool."""
+        if self._pdf_pool is not None:
+            self._pdf_pool.shutdown(wait=False, cancel_futures=True)
+            self._pdf_pool = None
+
+    def _recycle_pdf_pool(self, pool: ProcessPoolExecutor) -> None:
         """
-        Generate a brief summary of the text using Gemini.
-        
+        Kill a pool's workers and start a fresh pool for later documents.
+
+        Used when a document goes over its CPU budget: ranges of it that were
+        already handed to workers would otherwise keep parsing after we gave up.
+        Other documents' ranges on the old pool are retried by _run_parser.
+        """
+        if self._pdf_pool is pool:
+            self._pdf_pool = None
+        processes = list((pool._processes or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        print(f"♻️ Recycled {len(processes)} PDF parsing workers after a document went over its CPU budget")
+
+    def iter_pdf_pages(self, source: Union[str, BinaryIO]) -> Iterator[Tuple[int, str]]:
+        """
+        Lazily yield (page_number, text) for each page of a PDF.
+
+        Pages are parsed one at a time from a path or seekable binary file
+        (e.g. a spooled upload), so only the current page's text is held.
+        """
+        reader = PdfReader(source)
+        for index, page in enumerate(reader.pages):
+            yield index + 1, page.extract_text() or ""
+
+    def extract_pdf_chunks(self, source: Union[str, BinaryIO]) -> Dict[str, Any]:
+        """
+        Stream a PDF page by page into page-tagged chunks.
+
+        Blocking and CPU-bound; run it off the event loop. The full document
+        text is never built: chunks are cut as pages arrive and only the
+        leading PREVIEW_MAX_CHARS characters are kept as a preview.
+
         Args:
-            text: Input text to summarize
-            
+            source: Path or seekable binary file with the PDF
+
         Returns:
-            Summary string
+            Dict with 'chunks' (text, page_start, page_end), 'preview' and 'pages'
         """
+        pdf = PdfChunkStream()
+
+        def pages():
+            for page_number, page_text in self.iter_pdf_pages(source):
+                pdf.pages = page_number
+                pdf.add_preview(page_text)
+                yield page_number, page_text
+
+        chunks = list(embedding_service.chunk_pages(pages()))
+        return {"chunks": chunks, "preview": pdf.preview, "pages": pdf.pages}
+
+    @asynccontextmanager
+    async def _pdf_on_disk(self, file: UploadFile) -> AsyncIterator[str]:
+        """Yield a filesystem path for the upload, copying it to a temp file if needed."""
+        path = getattr(file.file, "name", None)
+        if isinstance(path, str) and os.path.isfile(path):
+            yield path
+            return
+
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+            await file.seek(0)
+            await asyncio.to_thread(shutil.copyfileobj, file.file, tmp)
+            tmp.flush()
+            yield tmp.name
+
+    async def chunk_pdf(self, file: UploadFile) -> Dict[str, Any]:
+        """
+        Extract all page-tagged chunks of an uploaded PDF (see stream_pdf).
+
+        Returns:
+            Dict with 'chunks' (text, page_start, page_end), 'preview', 'pages' and 'ocr_pages'
+        """
+        async with self.stream_pdf(file) as pdf:
+            chunks = [chunk async for chunk in pdf]
+        return {"chunks": chunks, "preview": pdf.preview, "pages": pdf.pages, "ocr_pages": pdf.ocr_pages}
+
+    @asynccontextmanager
+    async def stream_pdf(self, file: UploadFile) -> AsyncIterator["PdfChunkStream"]:
+        """
+        Stream page-tagged chunks of an uploaded PDF without blocking the event loop.
+
+        pypdf text extraction is pure-Python and CPU-bound, so pages are split
+        into ranges parsed in parallel by the process pool. Pages without a
+        text layer (scans) fall back to Gemini Vision OCR of their embedded
+        images. Pages are chunked in page order as their range finishes, and
+        each chunk is yielded as soon as it is cut, so a consumer can index
+        the document without ever holding all of its chunks.
+
+        Raises (while iterating):
+            PdfCpuLimitError: If parsing exceeds PDF_PARSE_CPU_LIMIT seconds of CPU
+        """
+        async with self._pdf_on_disk(file) as path:
+            pdf = PdfChunkStream()
+            chunks = self._stream_pdf_ranges(path, pdf)
+            pdf._chunks = chunks
+            try:
+                yield pdf
+            finally:
+                # Stops parsing if the consumer gave up early
+                await chunks.aclose()
+
+    async def _run_parser(self, func, *args):
+        """Run a pdf_worker function in the process pool, or a thread if it's disabled."""
+        pool = self._get_pdf_pool()
+        if pool is None:
+            return await asyncio.to_thread(func, *args)
         try:
-            # Truncate text if too long to avoid token limits (approx 10k chars is safe for flash)
-            truncated_text = text[:30000]
-            
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            response = model.generate_content(
-                f"Please provide a concise 2-3 sentence summary of the following document:\n\n{truncated_text}"
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+        except (BrokenProcessPool, RuntimeError):
+            if self._pdf_pool is pool:
+                # The pool died on its own (e.g. a worker was OOM-killed); start over next time
+                self._pdf_pool = None
+                raise
+        # Another document recycled the pool under this call
+        return await self._run_parser(func, *args)
+
+    async def _stream_pdf_ranges(self, path: str, pdf: "PdfChunkStream") -> AsyncIterator[Dict[str, Any]]:
+        cpu_limit = settings.PDF_PARSE_CPU_LIMIT
+        pool = self._get_pdf_pool()
+        pdf.pages = await self._run_parser(count_pages, path)
+        if pdf.pages == 0:
+            pdf.complete = True
+            return
+
+        pages_per_task = max(
+            settings.PDF_PARSE_MIN_PAGES_PER_TASK,
+            math.ceil(pdf.pages / max(settings.PDF_PARSE_WORKERS, 1))
+        )
+
+        async def parse_range(start: int) -> Tuple[List[Tuple[int, str]], float]:
+            range_pages, cpu = await self._run_parser(
+                extract_page_range, path, start, min(start + pages_per_task, pdf.pages),
+                cpu_limit, settings.PDF_OCR_ENABLED
             )
-            
-            return response.text if response.text else "No summary available."
-        except Exception as e:
-            print(f"Error generating summary: {e}")
-            return "Summary generation failed."
+            # Only pages without a text layer pay for OCR
+            needs_ocr = [(number, images) for number, _, images in range_pages if images]
+            ocr_texts = await asyncio.gather(*(self._ocr_page_images(images) for _, images in needs_ocr))
+            pdf.ocr_pages += len(needs_ocr)
+
+            texts = {number: text for number, text, _ in range_pages}
+            texts.update((number, text) for (number, _), text in zip(needs_ocr, ocr_texts))
+            return sorted(texts.items()), cpu
+
+        # Ranges parse (and OCR) concurrently; results are consumed in page order
+        ranges = [asyncio.create_task(parse_range(start)) for start in range(0, pdf.pages, pages_per_task)]
+        chunker = make_chunker()
+
+        try:
+            cpu_used = 0.0
+            for page_range in ranges:
+                range_pages, range_cpu = await page_range
+                cpu_used += range_cpu
+                if cpu_used > cpu_limit:
+                    raise PdfCpuLimitError(cpu_used, cpu_limit)
+                for page_number, page_text in range_pages:
+                    pdf.add_preview(page_text)
+                    if page_text:
+                        # Same page joining as embedding_service.chunk_pages
+                        for chunk in await asyncio.to_thread(
+                            lambda: list(chunker.feed(page_text + "\n", page=page_number))
+                        ):
+                            yield chunk
+            pdf.complete = True
+            for chunk in chunker.finish():
+                yield chunk
+        except BaseException as e:
+            if isinstance(e, PdfCpuLimitError) and pool is not None:
+                self._recycle_pdf_pool(pool)
+            for page_range in ranges:
+                page_range.cancel()
+            await asyncio.gather(*ranges, return_exceptions=True)
+            raise
+
+    async def _ocr_page_images(self, images: List[bytes]) -> str:
+        """OCR the embedded images of a scanned page, in page order."""
+        texts = await asyncio.gather(*(self._ocr_cached(data) for data in images))
+        return "\n".join(text for text in texts if text)
+
+    async def _ocr_cached(self, data: bytes) -> str:
+        """
+        OCR one encoded image, with bounded parallelism and a cache by image hash.
+
+        Identical images (e.g. the same scanned page twice) are OCR'd once,
+        including when they are requested concurrently. Images that could
+        not be OCR'd give "" and are not cached, so a later run retries them.
+        """
+        key = hashlib.sha256(data).hexdigest()
+        if key in self._ocr_cache:
+            self._ocr_cache.move_to_end(key)
+            return self._ocr_cache[key]
+
+        task = self._ocr_in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._ocr_bytes(data))
+            self._ocr_in_flight[key] = task
+            task.add_done_callback(lambda _: self._ocr_in_flight.pop(key, None))
+
+        text = await asyncio.shield(task)
+        if text is None:
+            return ""
+        self._ocr_cache[key] = text
+        while len(self._ocr_cache) > settings.PDF_OCR_CACHE_SIZE:
+            self._ocr_cache.popitem(last=False)
+        return text
+
+    async def _ocr_bytes(self, data: bytes) -> Optional[str]:
+        """OCR one embedded image, or None if it can't be decoded or Gemini fails on it."""
+        async with self._ocr_slots:
+            try:
+                prepared, _ = await asyncio.to_thread(prepare_for_ocr, data)
+                return await asyncio.to_thread(self._ocr_image, prepared, self.SCANNED_PAGE_PROMPT)
+            except Exception as e:
+                # One unreadable or blocked image shouldn't fail the whole document
+                print(f"⚠️ OCR of an embedded PDF image failed: {e}")
+                return None
+
+    def _ocr_image(self, data: bytes, prompt: str) -> str:
+        """Run Gemini Vision on an encoded, OCR-prepared image (blocking)."""
+        response = self.vision_model.generate_content([prompt, {"mime_type": OCR_MIME_TYPE, "data": data}])
+        return response.text if response.text else ""
+
+    async def extract_text_from_image(self, file: UploadFile) -> str:
+        """
+        Extract text from image using Gemini Vision.
+
+        The image is downscaled and re-encoded before the call, and results
+        are cached persistently by perceptual hash, so re-uploads of the
+        same (or a re-encoded) image skip OCR.
+        """
+        await file.seek(0)
+        prepared, phash = await asyncio.to_thread(prepare_for_ocr, file.file)
+        await file.seek(0)
+
+        cache_key = f"{self.VISION_MODEL}:{phash}"
+        cached = await ocr_cache.get(cache_key)
+        if cached is not None:
+            print(f"♻️ OCR cache hit for image {phash}")
+            return cached["text"]
+
+        text = await asyncio.to_thread(self._ocr_image, prepared, self.IMAGE_PROMPT)
+        await ocr_cache.set(cache_key, {"text": text})
+        return text
 
 processing_service = ProcessingService()
 
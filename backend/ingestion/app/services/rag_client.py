@@ -1,7 +1,8 @@
 """
 RAG Service client for cross-service communication.
 
-Sends processed chunks to rag_service for vector storage.
+Sends processed chunks to rag_service for vector storage, and reads
+stored chunks back for deferred jobs.
 """
 
 import httpx
@@ -13,6 +14,9 @@ settings = get_settings()
 
 
 class RAGServiceClient:
+    # Ids per /vector/chunks request (rag_service accepts up to 1000)
+    GET_CHUNKS_BATCH = 500
+
     def __init__(self):
         self.base_url = settings.RAG_SERVICE_URL
         self.timeout = 30.0
@@ -22,7 +26,8 @@ class RAGServiceClient:
         user_id: str,
         text: str,
         embedding: List[float],
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        chunk_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Insert a single chunk into rag_service vector store.
@@ -32,11 +37,12 @@ class RAGServiceClient:
             text: Text content
             embedding: Vector embedding
             metadata: Optional metadata dict
+            chunk_id: Id to store the chunk under (default: a new UUID)
             
         Returns:
             Response from rag_service
         """
-        chunk_id = str(uuid.uuid4())
+        chunk_id = chunk_id or str(uuid.uuid4())
         
         payload = {
             "id": chunk_id,
@@ -86,5 +92,32 @@ class RAGServiceClient:
         
         return results
 
+    
+    async def get_chunks(self, user_id: str, chunk_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Read a user's stored chunks back from rag_service, in the order of the ids.
+        
+        Args:
+            user_id: Owner of the chunks
+            chunk_ids: Chunk ids; requested GET_CHUNKS_BATCH at a time
+            
+        Returns:
+            Dicts with 'id', 'text' and 'metadata'; missing chunks are left out
+        """
+        chunks = []
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            for start in range(0, len(chunk_ids), self.GET_CHUNKS_BATCH):
+                try:
+                    response = await client.post(
+                        f"{self.base_url}/vector/chunks",
+                        json={"user_id": user_id, "ids": chunk_ids[start:start + self.GET_CHUNKS_BATCH]}
+                    )
+                    response.raise_for_status()
+                except httpx.HTTPError as e:
+                    print(f"Error reading chunks from rag_service: {e}")
+                    raise
+                chunks.extend(response.json()["chunks"])
+        return chunks
+
 
 rag_client = RAGServiceClient()
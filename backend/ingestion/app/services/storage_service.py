@@ -1,14 +1,41 @@
-from firebase_admin import storage
+"""
+File storage for uploaded documents and images.
+
+Uploads are content-addressed ({folder}/{sha256}.{ext}), so storing the same
+file twice is a no-op, and run off the event loop. Two backends exist:
+
+- "firebase": Firebase Storage / GCS. Large files use resumable uploads in
+  STORAGE_CHUNK_SIZE parts, each retried on transient errors. Setting
+  STORAGE_EMULATOR_HOST points the client at a local GCS emulator.
+- "local": files under STORAGE_LOCAL_ROOT, for development and tests.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Optional
+
 from fastapi import UploadFile
-import uuid
+from firebase_admin import storage
+from google.api_core.exceptions import PreconditionFailed
+from google.cloud.storage.retry import DEFAULT_RETRY
+
 from ..core.config import get_settings
 
 settings = get_settings()
 
-class StorageService:
-    def __init__(self):
+# GCS requires resumable upload chunks to be multiples of 256 KiB
+CHUNK_ALIGNMENT = 256 * 1024
+
+
+class FirebaseStorageBackend:
+    def __init__(self, chunk_size: int = settings.STORAGE_CHUNK_SIZE):
         self._bucket = None
-    
+        self.chunk_size = max(CHUNK_ALIGNMENT, chunk_size - chunk_size % CHUNK_ALIGNMENT)
+
     @property
     def bucket(self):
         """Lazy initialization of Firebase Storage bucket."""
@@ -16,31 +43,132 @@ class StorageService:
             self._bucket = storage.bucket()
         return self._bucket
 
-    async def upload_file(self, file: UploadFile, folder: str = "uploads") -> str:
+    def exists(self, path: str) -> bool:
+        return self.bucket.blob(path).exists()
+
+    def url(self, path: str) -> str:
+        return self.bucket.blob(path).public_url
+
+    def upload(self, file: BinaryIO, path: str, size: Optional[int], content_type: Optional[str]) -> None:
+        """Stream a file to GCS as a chunked, resumable upload (blocking)."""
+        blob = self.bucket.blob(path, chunk_size=self.chunk_size)
+        try:
+            blob.upload_from_file(
+                file,
+                rewind=True,
+                size=size,
+                content_type=content_type,
+                # Create-only: makes part retries safe and loses races gracefully
+                if_generation_match=0,
+                retry=DEFAULT_RETRY
+            )
+        except PreconditionFailed:
+            # Someone else stored the same content first
+            pass
+
+
+class LocalStorageBackend:
+    def __init__(self, root: str = settings.STORAGE_LOCAL_ROOT,
+                 base_url: str = settings.STORAGE_LOCAL_BASE_URL):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def _full_path(self, path: str) -> str:
+        return os.path.join(self.root, *path.split("/"))
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(self._full_path(path))
+
+    def url(self, path: str) -> str:
+        if self.base_url:
+            return f"{self.base_url}/{path}"
+        return f"file://{os.path.abspath(self._full_path(path))}"
+
+    def upload(self, file: BinaryIO, path: str, size: Optional[int], content_type: Optional[str]) -> None:
+        """Copy a file under the root, atomically via rename (blocking)."""
+        full_path = self._full_path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                file.seek(0)
+                shutil.copyfileobj(file, out)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+STORAGE_BACKENDS = {
+    "firebase": FirebaseStorageBackend,
+    "local": LocalStorageBackend,
+}
+
+
+def _hash_file(file: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(1024 * 1024), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class StorageService:
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        """Lazy initialization of the configured storage backend."""
+        if self._backend is None:
+            backend_class = STORAGE_BACKENDS.get(settings.STORAGE_BACKEND)
+            if backend_class is None:
+                raise ValueError(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND}")
+            self._backend = backend_class()
+        return self._backend
+
+    async def upload_file(self, file: UploadFile, folder: str = "uploads",
+                          content_hash: Optional[str] = None) -> str:
         """
-        Upload a file to Firebase Storage.
-        Returns the public URL or path.
+        Upload a file to storage, unless identical content is already there.
+
+        Args:
+            file: Upload to store; read from its handle, never fully into memory
+            folder: Destination folder
+            content_hash: SHA-256 of the content, if already known
+
+        Returns:
+            The public URL or path
         """
-        # Generate unique filename
-        extension = file.filename.split(".")[-1]
-        filename = f"{folder}/{uuid.uuid4()}.{extension}"
+        if content_hash is None:
+            content_hash = await asyncio.to_thread(_hash_file, file.file)
 
-        blob = self.bucket.blob(filename)
+        extension = file.filename.split(".")[-1] if file.filename and "." in file.filename else "bin"
+        path = f"{folder}/{content_hash}.{extension}"
 
-        # Upload file content
-        content = await file.read()
-        blob.upload_from_string(
-            content,
-            content_type=file.content_type
-        )
+        if await asyncio.to_thread(self.backend.exists, path):
+            print(f"♻️ {path} already stored, skipping upload")
+        else:
+            await asyncio.to_thread(self.backend.upload, file.file, path, file.size, file.content_type)
 
-        # Reset file pointer for subsequent reads
-        await file.seek(0)
+        return self.backend.url(path)
 
-        # Make public (optional, depending on requirements)
-        # blob.make_public()
+    async def upload_bytes(self, data: bytes, folder: str, name: str,
+                           content_type: Optional[str] = None) -> str:
+        """
+        Store small generated content (e.g. thumbnails) under a fixed name.
 
-        return blob.public_url
+        Names should be derived from the source content, so regenerating
+        the same artifact skips the upload like upload_file() does.
 
-storage_service = StorageService()
+        Returns:
+            The public URL or path
+        """
+        path = f"{folder}/{name}"
+        if not await asyncio.to_thread(self.backend.exists, path):
+            await asyncio.to_thread(self.backend.upload, io.BytesIO(data), path, len(data), content_type)
+        return self.backend.url(path)
 
+storage_service = StorageService()
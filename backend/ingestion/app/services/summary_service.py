@@ -0,0 +1,150 @@
+"""
+Hierarchical document summarization.
+
+Long documents are summarized map-reduce style: chunks are packed into
+sections of up to SUMMARY_SECTION_CHARS characters, each section is
+summarized concurrently (at most SUMMARY_CONCURRENCY calls in flight per
+process), and the section summaries are reduced, level by level, until
+they fit a single call that writes the document summary. Short documents
+take one call, as before.
+
+Every call's output is cached by the SHA-256 of its input (see
+cache_service.py), so a retried job or a re-uploaded document only pays
+for the sections that were not summarized yet.
+
+Summaries run in deferred "summary" jobs (see ingestion_pipeline.py), so
+they never add to upload latency.
+"""
+
+import asyncio
+import hashlib
+from typing import Any, Dict, List
+
+import google.generativeai as genai
+
+from ..core.config import get_settings
+from .cache_service import summary_cache
+from .pipeline import ProgressCallback, no_progress
+
+settings = get_settings()
+
+# Configure Gemini
+genai.configure(api_key=settings.GEMINI_API_KEY)
+
+
+DOCUMENT_PROMPT = "Please provide a concise 2-3 sentence summary of the following document:\n\n{text}"
+
+SECTION_PROMPT = (
+    "Summarize this section of a longer document in one paragraph. "
+    "Keep the key facts, names, numbers and conclusions:\n\n{text}"
+)
+
+MERGE_PROMPT = (
+    "The following are summaries of consecutive sections of one document. "
+    "Merge them into one paragraph that keeps the key facts, names, numbers and conclusions:\n\n{text}"
+)
+
+FINAL_PROMPT = (
+    "The following are summaries of consecutive sections of one document. "
+    "Please provide a concise 2-3 sentence summary of the whole document:\n\n{text}"
+)
+
+
+def pack_sections(texts: List[str], max_chars: int) -> List[str]:
+    """
+    Join consecutive texts into sections of at most max_chars characters.
+
+    A single text longer than max_chars is cut into max_chars pieces.
+    """
+    sections: List[str] = []
+    current: List[str] = []
+    size = 0
+    for text in texts:
+        text = text.strip()
+        if not text:
+            continue
+        for start in range(0, len(text), max_chars):
+            piece = text[start:start + max_chars]
+            if current and size + len(piece) + 2 > max_chars:
+                sections.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 2
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+
+class SummaryService:
+    def __init__(self):
+        self.model = genai.GenerativeModel(settings.GEMINI_LLM_MODEL)
+        self._slots = asyncio.Semaphore(settings.SUMMARY_CONCURRENCY)
+
+    async def _summarize(self, prompt: str, text: str) -> str:
+        """One summarization call, cached by model, prompt and input hash."""
+        digest = hashlib.sha256(f"{prompt}\0{text}".encode("utf-8")).hexdigest()
+        cache_key = f"{settings.GEMINI_LLM_MODEL}:{digest}"
+        cached = await summary_cache.get(cache_key)
+        if cached is not None:
+            return cached["summary"]
+
+        async with self._slots:
+            response = await asyncio.to_thread(self.model.generate_content, prompt.format(text=text))
+        try:
+            summary = (response.text or "").strip()
+        except ValueError:
+            # Blocked or empty candidate; the rest of the document still gets summarized
+            print("⚠️ Summarization returned no text for a section")
+            return ""
+
+        await summary_cache.set(cache_key, {"summary": summary})
+        return summary
+
+    async def summarize_document(self, chunks: List[str],
+                                 report: ProgressCallback = no_progress) -> Dict[str, Any]:
+        """
+        Summarize a whole document from its chunks.
+
+        Args:
+            chunks: Document text chunks, in order
+            report: Progress callback; receives sections_total/sections_done
+
+        Returns:
+            Dict with 'summary', 'sections' (first-level sections) and
+            'levels' (summarization rounds, 1 for short documents)
+        """
+        max_chars = settings.SUMMARY_SECTION_CHARS
+        sections = pack_sections(chunks, max_chars)
+        if not sections:
+            return {"summary": "", "sections": 0, "levels": 0}
+        if len(sections) == 1:
+            return {"summary": await self._summarize(DOCUMENT_PROMPT, sections[0]), "sections": 1, "levels": 1}
+
+        first_level = len(sections)
+        levels = 0
+        prompt = SECTION_PROMPT
+        while len(sections) > 1:
+            levels += 1
+            done = 0
+            await report("summarize", sections_total=len(sections), sections_done=0, level=levels)
+
+            async def summarize_section(section: str) -> str:
+                nonlocal done
+                summary = await self._summarize(prompt, section)
+                done += 1
+                await report("summarize", sections_done=done)
+                return summary
+
+            summaries = await asyncio.gather(*(summarize_section(section) for section in sections))
+            packed = pack_sections(summaries, max_chars)
+            if len(packed) >= len(sections):
+                # Summaries came back as long as their input; don't reduce forever
+                packed = ["\n\n".join(packed)[:max_chars]]
+            sections = packed
+            prompt = MERGE_PROMPT
+
+        summary = await self._summarize(FINAL_PROMPT, sections[0]) if sections else ""
+        return {"summary": summary, "sections": first_level, "levels": levels + 1}
+
+
+summary_service = SummaryService()
@@ -0,0 +1,122 @@
+"""
+Streamed request bodies for POST /ingest/text/stream.
+
+Large documents (e.g. long transcripts) are sent as the request body
+rather than one JSON string, and decoded into text pieces as bytes
+arrive. Two body formats are accepted:
+
+- text/plain: raw UTF-8 text, usually with chunked transfer encoding.
+- application/x-ndjson: one JSON object per line. Lines are
+  {"text": "..."} pieces of the document, in order; an optional first
+  line {"metadata": {...}} sets metadata stored with every chunk.
+
+The decoded text is hashed as it is read, so the result can be recorded
+for idempotent retries without buffering the document. The hash is that
+of the text alone (UTF-8), the same key POST /ingest/text uses, so
+resending a document in either form, or in another body format, is
+recognized as a duplicate.
+"""
+
+import codecs
+import hashlib
+import json
+from typing import Any, AsyncIterator, Dict, Optional
+
+from ..core.config import get_settings
+from .ingestion_pipeline import IngestionError
+
+settings = get_settings()
+
+TEXT_CONTENT_TYPE = "text/plain"
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+
+
+class StreamFormatError(IngestionError):
+    """The streamed body is malformed or over its size limits."""
+
+
+def media_type(content_type: Optional[str]) -> str:
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+class TextStream:
+    """Async iterator of text pieces decoded from a streamed request body."""
+
+    def __init__(self, body: AsyncIterator[bytes], content_type: Optional[str]):
+        self._body = body
+        self.ndjson = media_type(content_type) in NDJSON_CONTENT_TYPES
+        self.metadata: Dict[str, Any] = {}
+        self.bytes_received = 0
+        self._digest = hashlib.sha256()
+
+    @staticmethod
+    def supports(content_type: Optional[str]) -> bool:
+        return media_type(content_type) in NDJSON_CONTENT_TYPES | {TEXT_CONTENT_TYPE}
+
+    @property
+    def sha256(self) -> str:
+        """SHA-256 of the text read so far (of the whole text once iteration ends)."""
+        return self._digest.hexdigest()
+
+    def _piece(self, text: str) -> str:
+        self._digest.update(text.encode("utf-8"))
+        return text
+
+    async def _blocks(self) -> AsyncIterator[bytes]:
+        async for block in self._body:
+            self.bytes_received += len(block)
+            if self.bytes_received > settings.INGEST_STREAM_MAX_BYTES:
+                raise StreamFormatError(f"Stream is larger than {settings.INGEST_STREAM_MAX_BYTES} bytes")
+            yield block
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._ndjson_pieces() if self.ndjson else self._text_pieces()
+
+    async def _text_pieces(self) -> AsyncIterator[str]:
+        # Incremental decoding, so multi-byte characters split across reads survive
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        async for block in self._blocks():
+            text = decoder.decode(block)
+            if text:
+                yield self._piece(text)
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield self._piece(tail)
+
+    async def _ndjson_pieces(self) -> AsyncIterator[str]:
+        pending = b""
+        line_number = 0
+        async for block in self._blocks():
+            *lines, pending = (pending + block).split(b"\n")
+            if len(pending) > settings.INGEST_STREAM_MAX_LINE_BYTES:
+                raise StreamFormatError(f"NDJSON line is longer than {settings.INGEST_STREAM_MAX_LINE_BYTES} bytes")
+            for line in lines:
+                line_number += 1
+                text = self._parse_line(line, line_number)
+                if text:
+                    yield self._piece(text)
+
+        text = self._parse_line(pending, line_number + 1)
+        if text:
+            yield self._piece(text)
+
+    def _parse_line(self, line: bytes, line_number: int) -> Optional[str]:
+        """Apply a metadata line, or return the text of a text line."""
+        if not line.strip():
+            return None
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise StreamFormatError(f"Line {line_number} is not valid JSON: {e}")
+        if not isinstance(record, dict):
+            raise StreamFormatError(f"Line {line_number} must be a JSON object")
+
+        if "metadata" in record:
+            if line_number != 1 or not isinstance(record["metadata"], dict):
+                raise StreamFormatError("Metadata must be an object on the first line")
+            self.metadata = record["metadata"]
+
+        text = record.get("text")
+        if text is not None and not isinstance(text, str):
+            raise StreamFormatError(f"Line {line_number}: 'text' must be a string")
+        return text
@@ -0,0 +1,116 @@
+"""
+Chunker micro-benchmark.
+
+Compares the chunkers in services/chunker.py (the token-aware TextChunker
+and the push-based CharacterChunker) with the previous plain character
+chunker on synthetic English, Russian, Kazakh, Chinese and unpunctuated
+text, and prints throughput (MB/s of UTF-8 input) and chunk size statistics.
+
+    cd backend/ingestion && python -m benchmarks.chunker_benchmark [--size-mb 4]
+"""
+
+import argparse
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from app.services.chunker import CharacterChunker, TextChunker, estimate_tokens
+
+WORDS = {
+    "english": "the system stores every document chunk with its embedding and metadata for fast retrieval".split(),
+    "russian": "система хранит каждый фрагмент документа вместе с его векторным представлением и метаданными".split(),
+    "kazakh": "жүйе әрбір құжат үзіндісін оның векторлық көрінісімен және метадеректерімен бірге сақтайды".split(),
+}
+CHINESE = "系统将每个文档片段及其向量表示和元数据一起存储以便快速检索"
+
+
+def legacy_chunk_text(text: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
+    """The previous EmbeddingService.chunk_text, kept here as the baseline."""
+    if not text or len(text) < chunk_size:
+        return [text] if text else []
+
+    chunks = []
+    start = 0
+    text_length = len(text)
+    while start < text_length:
+        end = start + chunk_size
+        if end >= text_length:
+            chunks.append(text[start:].strip())
+            break
+
+        best_break = end
+        for boundary in ['. ', '.\n', '! ', '? ', '\n\n', '\n']:
+            pos = text.rfind(boundary, start + chunk_size // 2, end)
+            if pos != -1:
+                best_break = pos + len(boundary)
+                break
+
+        chunk = text[start:best_break].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = best_break - overlap if best_break > overlap else best_break
+    return chunks
+
+
+def run_chunker(chunker: TextChunker, text: str) -> List[str]:
+    chunks = chunker.feed(text) + chunker.finish()
+    return [chunk["text"] for chunk in chunks]
+
+
+def make_corpus(kind: str, size_bytes: int, rng: random.Random) -> str:
+    parts, size = [], 0
+    while size < size_bytes:
+        if kind == "chinese":
+            sentence = "".join(rng.sample(CHINESE, rng.randint(8, len(CHINESE)))) + "。"
+        elif kind == "unpunctuated":
+            sentence = " ".join(rng.choices(WORDS["english"], k=rng.randint(5, 25))) + " "
+        else:
+            words = rng.choices(WORDS[kind], k=rng.randint(5, 25))
+            sentence = " ".join(words).capitalize() + rng.choice([". ", ". ", "! ", "? ", ".\n\n"])
+        parts.append(sentence)
+        size += len(sentence.encode("utf-8"))
+    return "".join(parts)
+
+
+def measure(chunker: Callable[[str], List[str]], text: str, repeat: int) -> Dict[str, float]:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = chunker(text)
+        best = min(best, time.perf_counter() - started)
+
+    tokens = [estimate_tokens(chunk) for chunk in chunks]
+    return {
+        "mb_per_s": len(text.encode("utf-8")) / best / 1e6,
+        "chunks": len(chunks),
+        "mean_tokens": statistics.mean(tokens),
+        "max_tokens": max(tokens),
+        "tiny": sum(1 for t in tokens if t < 16),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=4.0, help="Corpus size per language")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'corpus':<13} {'chunker':<8} {'MB/s':>7} {'chunks':>8} {'mean tok':>9} {'max tok':>8} {'<16 tok':>8}")
+    for kind in ["english", "russian", "kazakh", "chinese", "unpunctuated"]:
+        text = make_corpus(kind, int(args.size_mb * 1e6), rng)
+        for name, chunker in [
+            ("legacy", legacy_chunk_text),
+            ("chars", lambda text: run_chunker(CharacterChunker(500, 100), text)),
+            ("token", lambda text: run_chunker(TextChunker(), text)),
+        ]:
+            stats = measure(chunker, text, args.repeat)
+            print(
+                f"{kind:<13} {name:<8} {stats['mb_per_s']:>7.1f} {stats['chunks']:>8} "
+                f"{stats['mean_tokens']:>9.1f} {stats['max_tokens']:>8} {stats['tiny']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -7,19 +7,57 @@ Returns entity nodes and edges for visualization (Obsidian-like graph).
 All endpoints require Firebase authentication via Bearer token.
 """
 
-from fastapi import APIRouter, Query, HTTPException, Depends
+from fastapi import APIRouter, Query, Header, HTTPException, Depends, Response
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import List, Dict, Any
+from sqlalchemy import select as sql_select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Any, Optional, Tuple
 import firebase_admin
 from firebase_admin import firestore, credentials, auth
+import asyncio
+import base64
+import gzip
+import hashlib
 import os
 
+from ..core.db import get_db
+from ..models.graph_snapshot import graph_snapshots
 from ..models.query import GraphQueryResponse, GraphNode, GraphEdge
+from ..services.graph_index import graph_index_cache
+from ..services.graph_overview import graph_overview_cache
 
 
 router = APIRouter(prefix="/graph", tags=["Knowledge Graph"])
 security = HTTPBearer()
 
+# Traversal limits of /graph/entity
+MAX_DEPTH = 5
+MAX_NODES = 2000
+MAX_EDGES = 5000
+
+# Page sizes of /graph/me (nodes plus edges)
+DEFAULT_PAGE = 1000
+MAX_PAGE = 5000
+
+# Search limits of /graph/path
+MAX_PATH_DEPTH = 8
+MAX_PATHS = 10
+MAX_FANOUT = 1000
+
+# Levels of /graph/overview, and the top-ranked nodes each level adds
+MAX_LEVEL = 20
+OVERVIEW_LEVEL_NODES = 250
+
+# /graph/me fields and the Firestore fields they are read from
+NODE_FIELDS = {"id": "name", "label": "name", "type": None, "mentions": "mention_count"}
+EDGE_FIELDS = {"source": "source", "target": "target", "relation": "type", "weight": "weight"}
+
+
+def _stored_fields(fields: List[str], mapping: Dict[str, Optional[str]]) -> List[str]:
+    """Firestore fields to project for the requested API fields."""
+    return list(dict.fromkeys(mapping[field] for field in fields if mapping[field]))
+
 
 # Initialize Firebase
 if not firebase_admin._apps:
@@ -59,61 +97,150 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         )
 
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names the given ETag."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _encode_cursor(phase: str, doc_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{phase}:{doc_id}".encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, Optional[str]]:
+    """
+    (phase, last document id) of a /graph/me cursor.
+
+    Phase is 'n' (nodes) or 'e' (edges); an edge cursor without a document
+    id starts at the first edge.
+    """
+    try:
+        phase, doc_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8").split(":", 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if phase not in ("n", "e") or (phase == "n" and not doc_id):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return phase, doc_id or None
+
+
+def _read_page(collection_ref, fields: List[str], after: Optional[str], limit: int) -> list:
+    """Up to limit documents after the given ID, in document ID order, with only the given fields."""
+    query = collection_ref.order_by("__name__")
+    if after:
+        query = query.start_after({"__name__": after})
+    # An empty projection would return every field; "__name__" returns none
+    return list(query.select(fields or ["__name__"]).limit(limit).stream())
+
+
 @router.get(
     "/me",
     summary="Get my knowledge graph",
-    description="Returns all entities and relations for the authenticated user's documents"
+    description="Returns entities and relations of the authenticated user's documents, a page at a time"
 )
 async def get_my_graph(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(DEFAULT_PAGE, ge=1, le=MAX_PAGE, description="Maximum nodes plus edges per page"),
+    select: Optional[str] = Query(None, description="Comma-separated node and edge fields to return"),
+    format: str = Query("json", pattern="^(json|compact)$", description="'json' objects or 'compact' rows"),
+    if_none_match: Optional[str] = Header(None),
     current_user: str = Depends(get_current_user)
 ):
     """
-    Get the complete knowledge graph for the authenticated user.
+    Get the knowledge graph for the authenticated user, page by page.
 
-    Returns all entities and their relationships across all user's documents.
-    Perfect for Obsidian-style graph visualization.
+    Pages hold up to `limit` elements: all nodes first, then all edges,
+    each in document ID order. Follow next_cursor until it is null.
+    The ETag changes whenever the user's graph changes, so a client that
+    sends it back in If-None-Match gets 304 Not Modified, without any
+    Firestore reads while the graph version is cached.
 
     Args:
+        response: Outgoing response, for the ETag header
+        cursor: Position to continue from (next_cursor of the previous page)
+        limit: Maximum nodes plus edges in the page
+        select: Node fields (id, label, type, mentions) and edge fields
+            (source, target, relation, weight) to return; default all
+        format: 'json' (list of objects) or 'compact' (field names once,
+            then one row of values per node or edge)
+        if_none_match: ETag of a page the client already has
         current_user: Authenticated user from token
 
     Returns:
-        Dict with nodes and edges for visualization
+        Dict with nodes, edges and next_cursor
     """
+    fields = [field.strip() for field in (select or "").split(",") if field.strip()]
+    unknown = [field for field in fields if field not in NODE_FIELDS and field not in EDGE_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    node_fields = [field for field in fields if field in NODE_FIELDS] if fields else list(NODE_FIELDS)
+    edge_fields = [field for field in fields if field in EDGE_FIELDS] if fields else list(EDGE_FIELDS)
+    phase, after = _decode_cursor(cursor) if cursor else ("n" if node_fields else "e", None)
+
     try:
         db = get_firestore_db()
 
-        # Get all entities for user
-        entities_ref = db.collection("graph").document("entities").collection(current_user)
-        entities_docs = entities_ref.get()
-
-        # Get all relations for user
-        relations_ref = db.collection("graph").document("relations").collection(current_user)
-        relations_docs = relations_ref.get()
-
-        # Build nodes
-        nodes = []
-        for doc in entities_docs:
-            data = doc.to_dict()
-            nodes.append({
-                "id": data.get("name"),
-                "label": data.get("name"),
-                "type": "entity",
-                "mentions": len(data.get("mentions", []))
-            })
-
-        # Build edges
-        edges = []
-        for doc in relations_docs:
-            data = doc.to_dict()
-            edges.append({
-                "source": data.get("source"),
-                "target": data.get("target"),
-                "relation": data.get("type", "relates_to")
-            })
-
+        version = await graph_index_cache.version(db, current_user)
+        request_key = f"{cursor}|{limit}|{','.join(fields)}|{format}"
+        etag = f'"{version}-{hashlib.sha256(request_key.encode("utf-8")).hexdigest()[:16]}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+
+        nodes, edges, next_cursor = [], [], None
+        if phase == "n":
+            entities_ref = db.collection("graph").document("entities").collection(current_user)
+            # One extra document tells whether another page of nodes follows
+            docs = await asyncio.to_thread(
+                _read_page, entities_ref, _stored_fields(node_fields, NODE_FIELDS), after, limit + 1
+            )
+            more, docs = len(docs) > limit, docs[:limit]
+            for doc in docs:
+                data = doc.to_dict()
+                name = data.get("name")
+                # Entities saved before mention_count existed were mentioned at least once
+                values = {"id": name, "label": name, "type": "entity", "mentions": data.get("mention_count", 1)}
+                nodes.append([values[field] for field in node_fields])
+            if more:
+                next_cursor = _encode_cursor("n", docs[-1].id)
+            elif edge_fields and len(docs) == limit:
+                next_cursor = _encode_cursor("e", "")
+            elif edge_fields:
+                phase, after = "e", None
+
+        if phase == "e" and next_cursor is None and edge_fields:
+            relations_ref = db.collection("graph").document("relations").collection(current_user)
+            remaining = limit - len(nodes)
+            docs = await asyncio.to_thread(
+                _read_page, relations_ref, _stored_fields(edge_fields, EDGE_FIELDS), after, remaining + 1
+            )
+            more, docs = len(docs) > remaining, docs[:remaining]
+            for doc in docs:
+                data = doc.to_dict()
+                values = {
+                    "source": data.get("source"),
+                    "target": data.get("target"),
+                    "relation": data.get("type", "relates_to"),
+                    "weight": data.get("weight", 1)
+                }
+                edges.append([values[field] for field in edge_fields])
+            if more:
+                next_cursor = _encode_cursor("e", docs[-1].id)
+
+        if format == "compact":
+            return {
+                "nodes": {"fields": node_fields, "rows": nodes},
+                "edges": {"fields": edge_fields, "rows": edges},
+                "next_cursor": next_cursor,
+                "user_id": current_user
+            }
         return {
-            "nodes": nodes,
-            "edges": edges,
+            "nodes": [dict(zip(node_fields, row)) for row in nodes],
+            "edges": [dict(zip(edge_fields, row)) for row in edges],
+            "next_cursor": next_cursor,
             "user_id": current_user
         }
 
@@ -121,6 +248,131 @@ async def get_my_graph(
         raise HTTPException(status_code=500, detail=f"Failed to fetch graph: {str(e)}")
 
 
+@router.get(
+    "/me/snapshot",
+    summary="Get my whole knowledge graph at once",
+    description="Returns the authenticated user's materialized graph snapshot in one response"
+)
+async def get_my_graph_snapshot(
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    current_user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get the authenticated user's whole graph from its snapshot.
+
+    The ingestion service keeps each user's graph as one gzip-compressed
+    JSON row, in /graph/me's compact format, updated within seconds of
+    every write (GRAPH_SNAPSHOT_COMPACT_INTERVAL). It is sent as stored
+    when the client accepts gzip, so the whole graph costs one row fetch
+    and no re-encoding.
+
+    Args:
+        if_none_match: ETag of the snapshot the client already has
+        accept_encoding: Client's accepted content encodings
+        current_user: Authenticated user from token
+        db: Database session
+
+    Returns:
+        Snapshot body with user_id, version, nodes and edges (compact rows)
+
+    Raises:
+        HTTPException: 404 if the user has no snapshot yet (use /graph/me)
+    """
+    try:
+        if if_none_match:
+            version = await db.scalar(
+                sql_select(graph_snapshots.c.version).where(graph_snapshots.c.user_id == current_user)
+            )
+            if version is not None and _etag_matches(if_none_match, f'"s{version}"'):
+                return Response(status_code=304, headers={"ETag": f'"s{version}"'})
+        row = (await db.execute(
+            sql_select(graph_snapshots.c.version, graph_snapshots.c.data)
+            .where(graph_snapshots.c.user_id == current_user)
+        )).first()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch graph snapshot: {str(e)}")
+
+    if row is None:
+        raise HTTPException(status_code=404, detail="No graph snapshot yet")
+
+    headers = {"ETag": f'"s{row.version}"', "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if "gzip" in (accept_encoding or ""):
+        # Already gzip; GZipMiddleware leaves responses with a Content-Encoding alone
+        return Response(row.data, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(gzip.decompress(row.data), media_type="application/json", headers=headers)
+
+
+@router.get(
+    "/overview",
+    summary="Get an overview of my knowledge graph",
+    description="Returns graph communities and the most central entities, at increasing levels of detail"
+)
+async def get_my_graph_overview(
+    level: int = Query(0, ge=0, le=MAX_LEVEL, description=f"Detail level; each adds the next {OVERVIEW_LEVEL_NODES} nodes by rank"),
+    cluster: Optional[int] = Query(None, ge=0, description="Cluster to drill into instead of a level"),
+    max_clusters: int = Query(100, ge=1, le=1000, description="Maximum clusters to return"),
+    limit: int = Query(500, ge=1, le=MAX_PAGE, description="Maximum cluster members to return"),
+    if_none_match: Optional[str] = Header(None),
+    current_user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get the authenticated user's graph at a level of detail.
+
+    Communities (label propagation) and PageRank are precomputed by the
+    ingestion service a few minutes after the graph changes (see
+    ingestion/app/services/graph_analysis.py). Level 0 returns only the
+    clusters as super-nodes with the weight of the relations between them;
+    level N adds the N * 250 highest-ranked entities and the relations
+    among them. With `cluster`, returns that cluster's top entities, their
+    relations and the adjacent clusters instead.
+
+    Args:
+        level: Detail level (0 = clusters only)
+        cluster: Cluster id to drill into
+        max_clusters: Cluster cap of a level response
+        limit: Member cap of a cluster response
+        if_none_match: ETag of a response the client already has
+        current_user: Authenticated user from token
+        db: Database session
+
+    Returns:
+        Clusters, cluster edges, nodes and edges of the level, or the cluster drill-down
+
+    Raises:
+        HTTPException: 404 if no overview was computed yet or the cluster does not exist
+    """
+    try:
+        version = await graph_overview_cache.version(db, current_user)
+        if version is None:
+            raise HTTPException(status_code=404, detail="No graph overview yet")
+        request_key = f"{level}|{cluster}|{max_clusters}|{limit}"
+        etag = f'"o{version}-{hashlib.sha256(request_key.encode("utf-8")).hexdigest()[:16]}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        overview = await graph_overview_cache.get(db, current_user, version)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch graph overview: {str(e)}")
+
+    if overview is None:
+        raise HTTPException(status_code=404, detail="No graph overview yet")
+    if cluster is not None:
+        body = overview.cluster(cluster, limit)
+        if body is None:
+            raise HTTPException(status_code=404, detail=f"No cluster {cluster}")
+    else:
+        body = {"level": level, **overview.level(level, max_clusters, OVERVIEW_LEVEL_NODES)}
+    return JSONResponse(
+        {"version": overview.version, "computed_at": overview.computed_at, **body},
+        headers=headers
+    )
+
+
 @router.get(
     "/entity/{entity_name}",
     summary="Query specific entity in my graph",
@@ -128,59 +380,107 @@ async def get_my_graph(
 )
 async def query_my_entity(
     entity_name: str,
-    depth: int = Query(1, description="How many hops to traverse from entity"),
+    depth: int = Query(1, ge=1, le=MAX_DEPTH, description="How many hops to traverse from entity"),
+    max_nodes: int = Query(200, ge=1, le=MAX_NODES, description="Maximum nodes to return"),
+    max_edges: int = Query(500, ge=1, le=MAX_EDGES, description="Maximum edges to return"),
     current_user: str = Depends(get_current_user)
 ):
     """
     Query the knowledge graph for a specific entity.
 
-    Returns the entity and its immediate connections up to specified depth.
+    Runs a breadth-first traversal up to the requested depth over the
+    user's cached adjacency index (see services/graph_index.py), so no
+    Firestore query is made per hop. Strongest edges are followed first
+    when a cap cuts the neighbourhood short.
 
     Args:
         entity_name: Name of entity to query
         depth: Number of relationship hops to include (default 1)
+        max_nodes: Node cap, including the entity itself
+        max_edges: Edge cap
         current_user: Authenticated user from token
 
     Returns:
-        Sub-graph with nodes and edges
+        Sub-graph with nodes (with their hop distance) and edges
     """
     try:
         db = get_firestore_db()
-        entity_name = entity_name.lower()
-
-        # Get relations where entity is source or target
-        relations_ref = db.collection("graph").document("relations").collection(current_user)
-
-        source_relations = relations_ref.where("source", "==", entity_name).get()
-        target_relations = relations_ref.where("target", "==", entity_name).get()
-
-        nodes = set([entity_name])
-        edges = []
-
-        for doc in source_relations:
-            data = doc.to_dict()
-            nodes.add(data.get("target"))
-            edges.append({
-                "source": data.get("source"),
-                "target": data.get("target"),
-                "relation": data.get("type", "relates_to")
-            })
-
-        for doc in target_relations:
-            data = doc.to_dict()
-            nodes.add(data.get("source"))
-            edges.append({
-                "source": data.get("source"),
-                "target": data.get("target"),
-                "relation": data.get("type", "relates_to")
-            })
+        entity_name = " ".join(entity_name.split()).lower()
+
+        index = await graph_index_cache.get(db, current_user)
+        subgraph = index.neighborhood(entity_name, depth, max_nodes, max_edges)
 
         return {
             "entity": entity_name,
-            "nodes": [{"id": n, "label": n, "type": "entity"} for n in nodes],
-            "edges": edges,
-            "depth": depth
+            "nodes": [
+                {"id": name, "label": name, "type": "entity", "depth": hops}
+                for name, hops in subgraph["nodes"].items()
+            ],
+            "edges": [index.edge(edge) for edge in subgraph["edges"]],
+            "depth": depth,
+            "truncated": subgraph["truncated"]
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to query entity: {str(e)}")
+
+
+@router.get(
+    "/path",
+    summary="Find how two entities in my graph are connected",
+    description="Returns the shortest paths between two entities and only the sub-graph they span"
+)
+async def find_my_path(
+    source: str = Query(..., min_length=1, description="Entity to start from"),
+    target: str = Query(..., min_length=1, description="Entity to reach"),
+    k: int = Query(1, ge=1, le=MAX_PATHS, description="Number of shortest paths to return"),
+    max_depth: int = Query(6, ge=1, le=MAX_PATH_DEPTH, description="Maximum hops per path"),
+    max_fanout: int = Query(100, ge=1, le=MAX_FANOUT, description="Strongest relations followed per entity"),
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Find the k shortest paths between two entities.
+
+    Runs a bidirectional breadth-first search over the user's cached
+    adjacency index (see services/graph_index.py), and Yen's algorithm on
+    top of it for k > 1. Relations are followed in either direction,
+    strongest first, up to max_fanout per entity.
+
+    Args:
+        source: Name of the entity to start from
+        target: Name of the entity to reach
+        k: Number of paths (fewest hops first)
+        max_depth: Maximum hops per path
+        max_fanout: Relations followed per entity
+        current_user: Authenticated user from token
+
+    Returns:
+        Paths (entity name lists) with the nodes and edges they span
+
+    Raises:
+        HTTPException: 404 if either entity is not in the graph
+    """
+    source = " ".join(source.split()).lower()
+    target = " ".join(target.split()).lower()
+    try:
+        db = get_firestore_db()
+        index = await graph_index_cache.get(db, current_user)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to find path: {str(e)}")
+
+    missing = [name for name in (source, target) if name not in index.ids]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Unknown entities: {', '.join(missing)}")
+
+    # CPU-bound on large graphs; keep the event loop free
+    result = await asyncio.to_thread(index.paths, source, target, k, max_depth, max_fanout)
+    nodes = dict.fromkeys(name for path in result["paths"] for name in path)
+    return {
+        "source": source,
+        "target": target,
+        "paths": [{"nodes": path, "length": len(path) - 1} for path in result["paths"]],
+        "nodes": [{"id": name, "label": name, "type": "entity"} for name in nodes],
+        "edges": [index.edge(edge) for edge in result["edges"]],
+        "found": bool(result["paths"]),
+        "truncated": result["truncated"]
+    }
@@ -47,6 +47,9 @@ async def rag_query(
     3. Assemble context from top-K relevant chunks
     4. Generate answer using Gemini LLM with anti-hallucination prompt
     
+    With entity_mode "filter" or "boost", step 2 is scoped to chunks that
+    mention the query's knowledge graph entities.
+    
     The answer will ONLY contain information from the knowledge base.
     If no relevant data is found, returns "Information not found in the knowledge base."
     """
@@ -55,7 +58,9 @@ async def rag_query(
             db=db,
             query=request.query,
             user_id=request.user_id,
-            top_k=request.top_k or 5
+            top_k=request.top_k or 5,
+            entity_mode=request.entity_mode,
+            entities=request.entities
         )
         
         # Convert to response model with image support
@@ -66,7 +71,8 @@ async def rag_query(
                 metadata=c["metadata"],
                 score=c["score"],
                 type=c.get("type", "text"),
-                image_url=c.get("image_url")
+                image_url=c.get("image_url"),
+                thumbnail_urls=c.get("thumbnail_urls")
             )
             for c in result["chunks"]
         ]
@@ -75,7 +81,8 @@ async def rag_query(
             answer=result["answer"],
             chunks=chunks,
             context_used=result["context_used"],
-            scores=result["scores"]
+            scores=result["scores"],
+            entities=result.get("entities", [])
         )
         
     except Exception as e:
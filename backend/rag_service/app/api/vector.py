@@ -1,8 +1,8 @@
 """
 Vector API Router.
 
-Provides endpoint for inserting document chunks with embeddings.
-Used by ingestion service after processing documents.
+Provides endpoints for inserting document chunks with embeddings and
+reading them back. Used by ingestion service after processing documents.
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -12,9 +12,13 @@ from ..core.db import get_db
 from ..models.query import (
     VectorInsertRequest,
     VectorInsertResponse,
+    VectorChunksRequest,
+    VectorChunksResponse,
+    StoredChunk,
     ErrorResponse
 )
 from ..services import vector_service
+from ..services.vector_service import ChunkOwnershipError
 
 
 router = APIRouter(prefix="/vector", tags=["Vector Operations"])
@@ -25,6 +29,7 @@ router = APIRouter(prefix="/vector", tags=["Vector Operations"])
     response_model=VectorInsertResponse,
     responses={
         400: {"model": ErrorResponse},
+        409: {"model": ErrorResponse},
         500: {"model": ErrorResponse}
     },
     summary="Insert a document chunk",
@@ -43,6 +48,8 @@ async def insert_vector(
     3. Embedding generation
     
     The chunk is stored in PostgreSQL with pgvector for efficient similarity search.
+    Re-inserting an id overwrites the chunk if it belongs to the same user,
+    and fails with 409 Conflict otherwise.
     """
     try:
         chunk = await vector_service.insert_chunk(
@@ -59,6 +66,14 @@ async def insert_vector(
             id=str(chunk.id)
         )
         
+    except ChunkOwnershipError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "error": "ChunkConflict",
+                "message": str(e)
+            }
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -67,3 +82,38 @@ async def insert_vector(
                 "message": str(e)
             }
         )
+
+
+@router.post(
+    "/chunks",
+    response_model=VectorChunksResponse,
+    responses={500: {"model": ErrorResponse}},
+    summary="Read stored chunks by id",
+    description="Return a user's stored chunks (without embeddings) in the order of the requested ids"
+)
+async def get_chunks(
+    request: VectorChunksRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Read stored chunks back by id.
+    
+    Used by deferred ingestion jobs (e.g. document summaries) that need a
+    document's text after it was indexed: chunk ids are derived from the
+    document, so the job only has to know the document, not its text.
+    """
+    try:
+        chunks = await vector_service.get_chunks(db=db, user_id=request.user_id, chunk_ids=request.ids)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={
+                "error": "ReadError",
+                "message": str(e)
+            }
+        )
+    
+    return VectorChunksResponse(chunks=[
+        StoredChunk(id=str(chunk.id), text=chunk.text, metadata=chunk.chunk_metadata)
+        for chunk in chunks
+    ])
@@ -4,6 +4,7 @@ Configuration module for RAG Service.
 This module loads all environment variables needed for:
 - PostgreSQL connection (with pgvector)
 - Google Gemini API
+- Knowledge graph index cache
 - CORS settings
 """
 
@@ -54,6 +55,14 @@ class Settings(BaseSettings):
     top_k: int = 5
     # Maximum distance threshold for relevance (lower = more similar)
     max_distance: float = 1.0
+    # Distance subtracted from chunks mentioning a query entity (entity_mode="boost")
+    entity_boost: float = 0.1
+    
+    # ===== Knowledge Graph Configuration =====
+    # Memory budget of the in-memory adjacency indexes of users' graphs
+    graph_cache_max_mb: int = 256
+    # Seconds a cached graph index is served before its version is re-checked
+    graph_version_check_seconds: float = 5.0
     
     # ===== CORS Configuration =====
     cors_origins: str = "http://localhost:3000"
@@ -10,6 +10,7 @@ FastAPI application for Retrieval-Augmented Generation with:
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 
 from .core.config import get_settings
@@ -64,6 +65,8 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Graph pages and RAG answers are large, repetitive JSON
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 
 # Include routers
@@ -0,0 +1,24 @@
+"""
+SQLAlchemy table of entity -> chunk mentions.
+
+The ingestion service records which chunks mention each knowledge graph
+entity (see ingestion/app/services/entity_mentions.py). Entity-scoped
+RAG queries use it to restrict or boost vector search to those chunks.
+
+Declared on its own MetaData because the ingestion service owns the
+schema: init_db() never creates it.
+"""
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, Uuid
+
+
+mention_metadata = MetaData()
+
+entity_mentions = Table(
+    "entity_mentions",
+    mention_metadata,
+    Column("user_id", String, primary_key=True),
+    Column("entity", String, primary_key=True),
+    Column("chunk_id", Uuid(as_uuid=False), primary_key=True),  # document_chunks.id
+    Column("created_at", DateTime),
+)
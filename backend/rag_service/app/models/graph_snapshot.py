@@ -0,0 +1,38 @@
+"""
+SQLAlchemy tables of materialized knowledge graph snapshots and overviews.
+
+The ingestion service keeps one row per user holding the user's whole
+graph as gzip-compressed JSON, updated shortly after it saves entities
+and relations (see ingestion/app/services/graph_snapshot.py), and one row
+with the graph's communities and PageRank, computed from the snapshot
+(see ingestion/app/services/graph_analysis.py). The graph router serves
+both with single row fetches.
+
+Declared on their own MetaData because the ingestion service owns the
+schema: init_db() never creates them.
+"""
+
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, MetaData, String, Table
+
+
+snapshot_metadata = MetaData()
+
+graph_snapshots = Table(
+    "graph_snapshots",
+    snapshot_metadata,
+    Column("user_id", String, primary_key=True),
+    Column("version", Integer, nullable=False),
+    Column("node_count", Integer, nullable=False),
+    Column("edge_count", Integer, nullable=False),
+    Column("data", LargeBinary, nullable=False),  # gzip-compressed JSON response body
+    Column("updated_at", DateTime),
+)
+
+graph_overviews = Table(
+    "graph_overviews",
+    snapshot_metadata,
+    Column("user_id", String, primary_key=True),
+    Column("version", Integer, nullable=False),  # Snapshot version analyzed
+    Column("data", LargeBinary, nullable=False),  # gzip-compressed JSON
+    Column("computed_at", DateTime),
+)
@@ -8,7 +8,7 @@ These schemas define the contract for:
 """
 
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
 from uuid import UUID
 
 
@@ -53,6 +53,24 @@ class VectorInsertResponse(BaseModel):
     id: str
 
 
+class VectorChunksRequest(BaseModel):
+    """Request schema for reading stored chunks back by id."""
+    user_id: str = Field(..., description="Owner of the chunks")
+    ids: List[UUID] = Field(..., max_length=1000, description="Chunk ids, in the order to return them")
+
+
+class StoredChunk(BaseModel):
+    """A stored chunk, without its embedding."""
+    id: str
+    text: str
+    metadata: Optional[Dict[str, Any]] = None
+
+
+class VectorChunksResponse(BaseModel):
+    """Response schema for reading stored chunks; missing ids are left out."""
+    chunks: List[StoredChunk]
+
+
 # ========================================
 # RAG Query Schemas
 # ========================================
@@ -74,6 +92,14 @@ class RAGQueryRequest(BaseModel):
         le=20,
         description="Number of chunks to retrieve"
     )
+    entity_mode: Literal["off", "filter", "boost"] = Field(
+        default="off",
+        description="Scope the search to chunks mentioning the query's entities: 'filter' only searches them, 'boost' ranks them first"
+    )
+    entities: Optional[List[str]] = Field(
+        default=None,
+        description="Entities to scope the search to (default: entities named in the query)"
+    )
     
     class Config:
         json_schema_extra = {
@@ -91,7 +117,7 @@ class ChunkResult(BaseModel):
     
     Supports both text and image chunks:
     - type="text": regular text chunk
-    - type="image": image chunk with image_url
+    - type="image": image chunk with image_url and thumbnail_urls
     """
     id: str
     text: str
@@ -100,6 +126,10 @@ class ChunkResult(BaseModel):
     # Image support fields
     type: str = Field(default="text", description="Chunk type: 'text' or 'image'")
     image_url: Optional[str] = Field(default=None, description="Image URL if type='image'")
+    thumbnail_urls: Optional[Dict[str, str]] = Field(
+        default=None,
+        description="WebP thumbnail URLs by size ('small': 128px, 'medium': 512px) if type='image'"
+    )
 
 
 class RAGQueryResponse(BaseModel):
@@ -115,6 +145,7 @@ class RAGQueryResponse(BaseModel):
     chunks: List[ChunkResult] = Field(..., description="Retrieved relevant chunks")
     context_used: str = Field(..., description="Full context sent to LLM")
     scores: List[float] = Field(..., description="Similarity scores for each chunk")
+    entities: List[str] = Field(default_factory=list, description="Entities the search was scoped to")
 
 
 # ========================================
@@ -0,0 +1,389 @@
+"""
+In-memory adjacency index of users' knowledge graphs.
+
+Graph traversals (multi-hop /graph/entity queries, /graph/path searches)
+run against a compact CSR (compressed sparse row) copy of a user's
+relations instead of issuing Firestore queries per hop:
+
+- Entity names are numbered 0..n-1; offsets[i]:offsets[i + 1] is the
+  slice of neighbors/edge_ids holding node i's incident edges, strongest
+  (highest weight) first. Edges are undirected for traversal.
+- Indexes are loaded lazily on first use, one Firestore read of the
+  relation collection per load.
+- The ingestion service bumps graph/meta/{user_id}/state.version whenever
+  it saves entities or relations. A user's version is trusted for
+  GRAPH_VERSION_CHECK_SECONDS, then the version document is read again
+  (one small read); the index is reloaded only if the version changed.
+  The same cached version backs /graph/me ETags.
+- Indexes are kept in an LRU bounded by GRAPH_CACHE_MAX_MB of estimated
+  memory.
+"""
+
+import asyncio
+import heapq
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..core.config import get_settings
+
+settings = get_settings()
+
+RELATION_FIELDS = ["source", "target", "type", "weight"]
+
+# Users whose graph version is remembered
+MAX_VERSIONS = 100_000
+
+# Nodes a /graph/path query may visit, over all of its searches
+MAX_PATH_VISITS = 200_000
+
+
+class GraphIndex:
+    """Immutable CSR adjacency of one user's relations."""
+
+    def __init__(self, relations: Iterable[Dict[str, Any]]):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.type_names: List[str] = []
+        type_ids: Dict[str, int] = {}
+        sources, targets, types, weights = array("I"), array("I"), array("I"), array("d")
+
+        for rel in relations:
+            source, target = rel.get("source"), rel.get("target")
+            if not source or not target:
+                continue
+            relation_type = rel.get("type") or "relates_to"
+            sources.append(self._node(source))
+            targets.append(self._node(target))
+            types.append(type_ids.setdefault(relation_type, len(type_ids)))
+            weights.append(rel.get("weight") or 1)
+        self.type_names = list(type_ids)
+        self.sources, self.targets, self.types, self.weights = sources, targets, types, weights
+
+        # Counting sort of edge endpoints into CSR rows, strongest edges first
+        node_count = len(self.names)
+        degree = [0] * (node_count + 1)
+        for node in sources:
+            degree[node + 1] += 1
+        for node in targets:
+            degree[node + 1] += 1
+        for node in range(node_count):
+            degree[node + 1] += degree[node]
+        self.offsets = array("I", degree)
+        fill = degree[:-1]
+        self.neighbors = array("I", bytes(4 * len(sources) * 2))
+        self.edge_ids = array("I", bytes(4 * len(sources) * 2))
+        for edge in sorted(range(len(sources)), key=weights.__getitem__, reverse=True):
+            for node, other in ((sources[edge], targets[edge]), (targets[edge], sources[edge])):
+                self.neighbors[fill[node]] = other
+                self.edge_ids[fill[node]] = edge
+                fill[node] += 1
+
+    def _node(self, name: str) -> int:
+        node = self.ids.get(name)
+        if node is None:
+            node = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return node
+
+    @property
+    def nbytes(self) -> int:
+        """Estimated memory footprint, for the LRU limit."""
+        arrays = (self.sources, self.targets, self.types, self.weights,
+                  self.offsets, self.neighbors, self.edge_ids)
+        names = sum(sys.getsizeof(name) for name in self.names)
+        # Name list and id dict slots, roughly 100 bytes per node
+        return sum(a.itemsize * len(a) for a in arrays) + names + 100 * len(self.names)
+
+    def edge(self, edge: int) -> Dict[str, Any]:
+        """Edge in the API's format."""
+        weight = self.weights[edge]
+        return {
+            "source": self.names[self.sources[edge]],
+            "target": self.names[self.targets[edge]],
+            "relation": self.type_names[self.types[edge]],
+            "weight": int(weight) if weight.is_integer() else weight
+        }
+
+    def neighborhood(self, name: str, depth: int, max_nodes: int, max_edges: int) -> Dict[str, Any]:
+        """
+        Breadth-first sub-graph around an entity.
+
+        Args:
+            name: Normalized entity name
+            depth: Number of hops to traverse
+            max_nodes: Node cap, including the entity itself
+            max_edges: Edge cap
+
+        Returns:
+            Dict with 'nodes' (name -> hop count), 'edges' (edge ids, in
+            discovery order) and 'truncated' (a cap was hit)
+        """
+        start = self.ids.get(name)
+        if start is None:
+            return {"nodes": {name: 0}, "edges": [], "truncated": False}
+
+        offsets, neighbors, edge_ids = self.offsets, self.neighbors, self.edge_ids
+        hops = {start: 0}
+        edges: Dict[int, None] = {}
+        truncated = False
+        frontier = [start]
+        for level in range(1, depth + 1):
+            next_frontier = []
+            for node in frontier:
+                for slot in range(offsets[node], offsets[node + 1]):
+                    other = neighbors[slot]
+                    if other not in hops:
+                        if len(hops) >= max_nodes:
+                            truncated = True
+                            continue
+                        hops[other] = level
+                        next_frontier.append(other)
+                    edge = edge_ids[slot]
+                    if edge not in edges:
+                        if len(edges) >= max_edges:
+                            truncated = True
+                            continue
+                        edges[edge] = None
+            frontier = next_frontier
+            if not frontier:
+                break
+
+        return {
+            "nodes": {self.names[node]: level for node, level in hops.items()},
+            "edges": list(edges),
+            "truncated": truncated
+        }
+
+    def _edge_between(self, node: int, other: int) -> int:
+        """Strongest edge joining two adjacent nodes."""
+        for slot in range(self.offsets[node], self.offsets[node + 1]):
+            if self.neighbors[slot] == other:
+                return self.edge_ids[slot]
+        raise KeyError((node, other))
+
+    def _shortest_path(self, start: int, goal: int, max_depth: int, max_fanout: int,
+                       blocked_nodes: set, blocked_pairs: set, budget: List[int]) -> Optional[List[int]]:
+        """
+        Fewest-hops path by bidirectional BFS, expanding the smaller frontier.
+
+        Only the max_fanout strongest edges of each node are followed.
+        budget[0] is the number of node visits left; the search gives up
+        when it runs out.
+        """
+        if start == goal:
+            return [start]
+        offsets, neighbors = self.offsets, self.neighbors
+        # node -> (parent, hops) on each side
+        seen = ({start: (-1, 0)}, {goal: (-1, 0)})
+        frontiers = ([start], [goal])
+        depths = [0, 0]
+        while frontiers[0] and frontiers[1] and depths[0] + depths[1] < max_depth:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            own, other_side = seen[side], seen[1 - side]
+            depths[side] += 1
+            next_frontier, meetings = [], []
+            for node in frontiers[side]:
+                for slot in range(offsets[node], min(offsets[node] + max_fanout, offsets[node + 1])):
+                    other = neighbors[slot]
+                    if other in own or other in blocked_nodes or (min(node, other), max(node, other)) in blocked_pairs:
+                        continue
+                    own[other] = (node, depths[side])
+                    if other in other_side:
+                        meetings.append(other)
+                    next_frontier.append(other)
+                    budget[0] -= 1
+                    if budget[0] <= 0:
+                        return None
+            if meetings:
+                meet = min(meetings, key=lambda node: own[node][1] + other_side[node][1])
+                forward, backward = (own, other_side) if side == 0 else (other_side, own)
+                path, node = [], meet
+                while node != -1:
+                    path.append(node)
+                    node = forward[node][0]
+                path.reverse()
+                node = backward[meet][0]
+                while node != -1:
+                    path.append(node)
+                    node = backward[node][0]
+                return path
+            frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+        return None
+
+    def paths(self, source: str, target: str, k: int, max_depth: int, max_fanout: int,
+              max_visits: int = MAX_PATH_VISITS) -> Dict[str, Any]:
+        """
+        Up to k shortest loopless paths between two entities (Yen's algorithm).
+
+        Args:
+            source: Normalized name of the first entity
+            target: Normalized name of the second entity
+            k: Number of paths to find
+            max_depth: Maximum hops per path
+            max_fanout: Strongest edges followed per node
+            max_visits: Node visits allowed over all searches
+
+        Returns:
+            Dict with 'paths' (node name lists, fewest hops first), 'edges'
+            (edge ids of the paths' hops, each once) and 'truncated' (the
+            visit budget ran out before k paths were found)
+        """
+        start, goal = self.ids.get(source), self.ids.get(target)
+        if start is None or goal is None:
+            return {"paths": [], "edges": [], "truncated": False}
+
+        budget = [max_visits]
+        first = self._shortest_path(start, goal, max_depth, max_fanout, set(), set(), budget)
+        found = [first] if first else []
+        candidates: List[Tuple[int, int, List[int]]] = []
+        queued = set()
+        while found and len(found) < k and budget[0] > 0:
+            previous = found[-1]
+            # Deviate from the previous path at each of its nodes in turn
+            for i in range(len(previous) - 1):
+                root = previous[:i + 1]
+                blocked_pairs = {
+                    (min(path[i], path[i + 1]), max(path[i], path[i + 1]))
+                    for path in found if path[:i + 1] == root
+                }
+                spur = self._shortest_path(previous[i], goal, max_depth - i, max_fanout,
+                                           set(root[:-1]), blocked_pairs, budget)
+                if spur is not None:
+                    path = root[:-1] + spur
+                    if tuple(path) not in queued:
+                        queued.add(tuple(path))
+                        heapq.heappush(candidates, (len(path), len(queued), path))
+                if budget[0] <= 0:
+                    break
+            if not candidates:
+                break
+            found.append(heapq.heappop(candidates)[2])
+
+        edges: Dict[int, None] = {}
+        for path in found:
+            for node, other in zip(path, path[1:]):
+                edges[self._edge_between(node, other)] = None
+        return {
+            "paths": [[self.names[node] for node in path] for path in found],
+            "edges": list(edges),
+            "truncated": budget[0] <= 0 and len(found) < k
+        }
+
+
+class GraphIndexCache:
+    """Per-user GraphIndex LRU, revalidated against the graph version."""
+
+    def __init__(self, max_bytes: int, version_ttl: float):
+        self.max_bytes = max_bytes
+        self.version_ttl = version_ttl
+        # user_id -> (index, version it was loaded at)
+        self._entries: "OrderedDict[str, Tuple[GraphIndex, Any]]" = OrderedDict()
+        self._bytes = 0
+        # user_id -> [lock, requests holding or waiting for it]
+        self._locks: Dict[str, List[Any]] = {}
+        # user_id -> (version, monotonic time it was read)
+        self._versions: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+
+    @staticmethod
+    def _read_version(db, user_id: str) -> Any:
+        snapshot = db.collection("graph").document("meta").collection(user_id).document("state").get()
+        data = snapshot.to_dict() if snapshot.exists else None
+        return (data or {}).get("version", 0)
+
+    @staticmethod
+    def _load(db, user_id: str) -> GraphIndex:
+        relations_ref = db.collection("graph").document("relations").collection(user_id)
+        return GraphIndex(doc.to_dict() for doc in relations_ref.select(RELATION_FIELDS).stream())
+
+    def _current(self, user_id: str, version: Any) -> Optional[GraphIndex]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] != version:
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[0]
+
+    def _store(self, user_id: str, index: GraphIndex, version: Any) -> None:
+        self.invalidate(user_id)
+        if index.nbytes > self.max_bytes:
+            return
+        self._entries[user_id] = (index, version)
+        self._bytes += index.nbytes
+        while self._bytes > self.max_bytes:
+            evicted, (old, _) = self._entries.popitem(last=False)
+            self._bytes -= old.nbytes
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user's index; the next get() reloads it."""
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry[0].nbytes
+
+    async def version(self, db, user_id: str) -> Any:
+        """
+        Return the user's graph version, read at most every version_ttl seconds.
+
+        Args:
+            db: Firestore client
+            user_id: Owner of the graph
+
+        Returns:
+            Version counter (0 for a user without a graph yet)
+        """
+        cached = self._versions.get(user_id)
+        if cached is not None and time.monotonic() - cached[1] < self.version_ttl:
+            self._versions.move_to_end(user_id)
+            return cached[0]
+
+        version = await asyncio.to_thread(self._read_version, db, user_id)
+        self._versions[user_id] = (version, time.monotonic())
+        self._versions.move_to_end(user_id)
+        if len(self._versions) > MAX_VERSIONS:
+            self._versions.popitem(last=False)
+        return version
+
+    async def get(self, db, user_id: str) -> GraphIndex:
+        """
+        Return the user's index, loading or revalidating it if needed.
+
+        Args:
+            db: Firestore client
+            user_id: Owner of the graph
+
+        Returns:
+            GraphIndex of the user's relations
+        """
+        # Read the version first: edges written during a load bump it again
+        version = await self.version(db, user_id)
+        index = self._current(user_id, version)
+        if index is not None:
+            return index
+
+        # One load per user at a time; concurrent requests wait for it. The
+        # lock is dropped with its last user so idle users don't keep one.
+        entry = self._locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                index = self._current(user_id, version)
+                if index is not None:
+                    return index
+
+                started = time.perf_counter()
+                index = await asyncio.to_thread(self._load, db, user_id)
+                print(f"🕸️ Loaded graph index for {user_id}: {len(index.names)} nodes, "
+                      f"{len(index.sources)} edges in {time.perf_counter() - started:.2f}s")
+                self._store(user_id, index, version)
+                return index
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user_id]
+
+
+graph_index_cache = GraphIndexCache(
+    max_bytes=settings.graph_cache_max_mb * 1024 * 1024,
+    version_ttl=settings.graph_version_check_seconds
+)
@@ -0,0 +1,166 @@
+"""
+Level-of-detail views of users' knowledge graphs.
+
+The ingestion service stores each user's communities and PageRank in
+`graph_overviews` (see ingestion/app/services/graph_analysis.py). This
+module reads them, keeps the parsed overviews of recently viewed users in
+memory (keyed by the analyzed snapshot version, so they are never stale),
+and cuts them into what /graph/overview returns: cluster super-nodes,
+the top-ranked nodes for a zoom level, or one cluster's members.
+"""
+
+import asyncio
+import gzip
+import json
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.graph_snapshot import graph_overviews
+
+# Parsed overviews kept in memory
+MAX_CACHED_OVERVIEWS = 32
+
+
+class Overview:
+    """A parsed overview, with its nodes and edges grouped by cluster."""
+
+    def __init__(self, body: Dict[str, Any]):
+        self.version = body["version"]
+        self.computed_at = body.get("computed_at")
+        self.clusters: List[Dict[str, Any]] = body["clusters"]
+        self.cluster_edges: List[List[Any]] = body["cluster_edges"]
+        # [name, cluster, rank, degree, mentions], by rank
+        self.nodes: List[List[Any]] = body["nodes"]
+        # [node, node, relation, weight], ordered by the lower-ranked endpoint
+        self.edges: List[List[Any]] = body["edges"]
+
+        self.members: Dict[int, List[int]] = {}
+        for position, node in enumerate(self.nodes):
+            self.members.setdefault(node[1], []).append(position)
+        self.internal_edges: Dict[int, List[int]] = {}
+        for index, edge in enumerate(self.edges):
+            cluster = self.nodes[edge[0]][1]
+            if self.nodes[edge[1]][1] == cluster:
+                self.internal_edges.setdefault(cluster, []).append(index)
+
+    def _node(self, position: int) -> Dict[str, Any]:
+        name, cluster, rank, degree, mentions = self.nodes[position]
+        return {"id": name, "label": name, "cluster": cluster, "rank": rank, "degree": degree, "mentions": mentions}
+
+    def _edge(self, edge: List[Any]) -> Dict[str, Any]:
+        return {"source": self.nodes[edge[0]][0], "target": self.nodes[edge[1]][0], "relation": edge[2], "weight": edge[3]}
+
+    def level(self, level: int, max_clusters: int, nodes_per_level: int) -> Dict[str, Any]:
+        """
+        Cluster super-nodes plus the top level * nodes_per_level nodes by rank.
+
+        Args:
+            level: Zoom level; 0 is clusters only
+            max_clusters: Highest-ranked clusters to return
+            nodes_per_level: Nodes added per level
+
+        Returns:
+            Dict with clusters, cluster_edges, nodes and edges among them
+        """
+        clusters = self.clusters[:max_clusters]
+        shown = {cluster["id"] for cluster in clusters}
+        count = min(level * nodes_per_level, len(self.nodes))
+        edges = []
+        for edge in self.edges:
+            if max(edge[0], edge[1]) >= count:
+                break
+            edges.append(self._edge(edge))
+        return {
+            "clusters": clusters,
+            "cluster_edges": [
+                {"source": a, "target": b, "weight": weight}
+                for a, b, weight in self.cluster_edges if a in shown and b in shown
+            ],
+            "nodes": [self._node(position) for position in range(count)],
+            "edges": edges,
+            "clusters_total": len(self.clusters),
+            "nodes_total": len(self.nodes),
+        }
+
+    def cluster(self, cluster_id: int, limit: int) -> Optional[Dict[str, Any]]:
+        """
+        One cluster's top members by rank, their edges and adjacent clusters.
+
+        Args:
+            cluster_id: Cluster to drill into
+            limit: Maximum members to return
+
+        Returns:
+            Drill-down dict, or None if there is no such cluster
+        """
+        if not 0 <= cluster_id < len(self.clusters):
+            return None
+        members = self.members.get(cluster_id, [])
+        shown = set(members[:limit])
+        neighbours: List[Tuple[int, float]] = [
+            (b if a == cluster_id else a, weight)
+            for a, b, weight in self.cluster_edges if cluster_id in (a, b)
+        ]
+        neighbours.sort(key=lambda item: -item[1])
+        return {
+            "cluster": self.clusters[cluster_id],
+            "nodes": [self._node(position) for position in members[:limit]],
+            "edges": [
+                self._edge(self.edges[index]) for index in self.internal_edges.get(cluster_id, [])
+                if self.edges[index][0] in shown and self.edges[index][1] in shown
+            ],
+            "neighbors": [
+                {"cluster": other, "label": self.clusters[other]["label"], "weight": weight}
+                for other, weight in neighbours
+            ],
+            "truncated": len(members) > limit,
+        }
+
+
+class GraphOverviewCache:
+    """LRU of parsed overviews, revalidated against the stored version."""
+
+    def __init__(self, max_entries: int = MAX_CACHED_OVERVIEWS):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Overview]" = OrderedDict()
+
+    async def version(self, db: AsyncSession, user_id: str) -> Optional[int]:
+        """Stored overview version of a user, or None if not computed yet."""
+        return await db.scalar(select(graph_overviews.c.version).where(graph_overviews.c.user_id == user_id))
+
+    async def get(self, db: AsyncSession, user_id: str, version: Optional[int] = None) -> Optional[Overview]:
+        """
+        Return the user's overview, parsing it only when its version changed.
+
+        Args:
+            db: Database session
+            user_id: Owner of the graph
+            version: Stored version, if already read
+
+        Returns:
+            Overview, or None if it has not been computed yet
+        """
+        if version is None:
+            version = await self.version(db, user_id)
+            if version is None:
+                return None
+        cached = self._entries.get(user_id)
+        if cached is not None and cached.version == version:
+            self._entries.move_to_end(user_id)
+            return cached
+
+        data = await db.scalar(select(graph_overviews.c.data).where(graph_overviews.c.user_id == user_id))
+        if data is None:
+            return None
+        overview = await asyncio.to_thread(lambda: Overview(json.loads(gzip.decompress(data))))
+        self._entries[user_id] = overview
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return overview
+
+
+graph_overview_cache = GraphOverviewCache()
@@ -8,27 +8,77 @@ This is the main service that orchestrates the RAG pipeline:
 4. Generate answer using Gemini LLM
 
 The pipeline ensures answers are grounded in the knowledge base.
+
+Entity-scoped queries match the question against the user's knowledge
+graph entities and use the entity -> chunk mention index (see
+models/entity_mention.py) to restrict the search to chunks mentioning
+them ("filter") or to rank those chunks first ("boost").
 """
 
-from typing import List, Dict, Any, Tuple
+import re
+from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
+from sqlalchemy import bindparam, select, text
 from sqlalchemy.dialects.postgresql import JSONB
 
 from ..core.config import get_settings
 from ..models.chunk import DocumentChunk
+from ..models.entity_mention import entity_mentions
 from . import gemini_client
 
 
 settings = get_settings()
 
+# Longest entity name, in words, looked for in a question
+MAX_ENTITY_WORDS = 4
+
+
+def query_phrases(query: str) -> List[str]:
+    """
+    Word n-grams of a question that could name an entity.
+
+    Entities are stored lowercased with single spaces (see the ingestion
+    service's graph extraction), so phrases are normalized the same way.
+    """
+    words = re.findall(r"\w[\w'+.-]*", query.lower())
+    words = [word.rstrip(".") for word in words]
+    return list(dict.fromkeys(
+        " ".join(words[start:start + size])
+        for size in range(1, MAX_ENTITY_WORDS + 1)
+        for start in range(len(words) - size + 1)
+    ))
+
+
+async def match_entities(db: AsyncSession, user_id: str, query: str) -> List[str]:
+    """
+    Entities of the user's graph named in a question.
+
+    Args:
+        db: Database session
+        user_id: Owner of the graph
+        query: User's question
+
+    Returns:
+        Matched entity names (those with at least one indexed chunk)
+    """
+    phrases = query_phrases(query)
+    if not phrases:
+        return []
+    result = await db.execute(
+        select(entity_mentions.c.entity)
+        .where(entity_mentions.c.user_id == user_id, entity_mentions.c.entity.in_(phrases))
+        .distinct()
+    )
+    return sorted(result.scalars().all())
+
 
 async def similarity_search(
     db: AsyncSession,
     query_embedding: List[float],
     user_id: str,
     top_k: int = 5,
-    max_distance: float = 1.0
+    max_distance: float = 1.0,
+    entities: Optional[List[str]] = None
 ) -> List[Tuple[DocumentChunk, float]]:
     """
     Perform similarity search using pgvector.
@@ -42,6 +92,7 @@ async def similarity_search(
         user_id: Filter chunks by user
         top_k: Number of results to return
         max_distance: Maximum distance threshold
+        entities: Only search chunks mentioning one of these entities
         
     Returns:
         List of (DocumentChunk, distance) tuples
@@ -52,7 +103,13 @@ async def similarity_search(
     # SQL query with pgvector similarity search
     # Using <-> operator for cosine distance
     # IMPORTANT: .columns(metadata=JSONB) ensures JSONB is properly deserialized
-    query = text("""
+    # Entity-scoped searches only rank chunks from the mention index
+    entity_filter = """
+        AND id IN (
+            SELECT chunk_id FROM entity_mentions
+            WHERE user_id = :user_id AND entity IN :entities
+        )""" if entities else ""
+    query = text(f"""
         SELECT
             id,
             user_id,
@@ -62,20 +119,21 @@ async def similarity_search(
             embedding <-> :query_embedding AS distance
         FROM document_chunks
         WHERE user_id = :user_id
-        AND embedding <-> :query_embedding < :max_distance
+        AND embedding <-> :query_embedding < :max_distance{entity_filter}
         ORDER BY embedding <-> :query_embedding
         LIMIT :top_k
     """).columns(metadata=JSONB)
+    params = {
+        "query_embedding": embedding_str,
+        "user_id": user_id,
+        "max_distance": max_distance,
+        "top_k": top_k
+    }
+    if entities:
+        query = query.bindparams(bindparam("entities", expanding=True))
+        params["entities"] = entities
     
-    result = await db.execute(
-        query,
-        {
-            "query_embedding": embedding_str,
-            "user_id": user_id,
-            "max_distance": max_distance,
-            "top_k": top_k
-        }
-    )
+    result = await db.execute(query, params)
     
     rows = result.fetchall()
     
@@ -154,27 +212,91 @@ import logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+async def entity_scoped_search(
+    db: AsyncSession,
+    query_embedding: List[float],
+    user_id: str,
+    top_k: int,
+    entities: List[str],
+    mode: str
+) -> List[Tuple[DocumentChunk, float]]:
+    """
+    Similarity search scoped to chunks mentioning the given entities.
+
+    Args:
+        db: Database session
+        query_embedding: Query vector
+        user_id: Filter chunks by user
+        top_k: Number of results to return
+        entities: Entities of the question
+        mode: "filter" (only chunks mentioning an entity, falling back to
+            the whole knowledge base when none are relevant) or "boost"
+            (those chunks rank as if entity_boost closer)
+
+    Returns:
+        List of (DocumentChunk, distance) tuples, distances unchanged
+    """
+    scoped = await similarity_search(
+        db=db, query_embedding=query_embedding, user_id=user_id, top_k=top_k, entities=entities
+    )
+    if mode == "filter" and scoped:
+        return scoped
+
+    everywhere = await similarity_search(db=db, query_embedding=query_embedding, user_id=user_id, top_k=top_k)
+    if mode == "filter":
+        return everywhere
+
+    # The scoped results are the nearest mentioning chunks, so every chunk
+    # that could rank in the top_k after boosting is among the two lists
+    boosted = {chunk.id for chunk, _ in scoped}
+    merged = {chunk.id: (chunk, distance) for chunk, distance in everywhere + scoped}
+    ranked = sorted(
+        merged.values(),
+        key=lambda item: item[1] - (settings.entity_boost if item[0].id in boosted else 0.0)
+    )
+    return ranked[:top_k]
+
+
 async def rag_query(
     db: AsyncSession,
     query: str,
     user_id: str,
     top_k: int = 10,
+    entity_mode: str = "off",
+    entities: Optional[List[str]] = None,
 ) -> Dict[str, Any]:
     """
     Execute full RAG pipeline.
+
+    With entity_mode "filter" or "boost", the search is scoped to chunks
+    mentioning the given entities, or the entities named in the query
+    when none are given (see entity_scoped_search).
     """
     # Step 1: Generate query embedding
     logger.info(f"Generating embedding for query: {query}")
     query_embedding = await gemini_client.generate_query_embedding(query)
     
+    matched: List[str] = []
+    if entity_mode != "off":
+        if entities:
+            matched = list(dict.fromkeys(" ".join(name.split()).lower() for name in entities if name.strip()))
+        else:
+            matched = await match_entities(db, user_id, query)
+        logger.info(f"Entity-scoped search ({entity_mode}) over entities: {matched}")
+    
     # Step 2: Similarity search
     logger.info(f"Performing similarity search with top_k={top_k}")
-    chunks_with_scores = await similarity_search(
-        db=db,
-        query_embedding=query_embedding,
-        user_id=user_id,
-        top_k=top_k
-    )
+    if matched:
+        chunks_with_scores = await entity_scoped_search(
+            db, query_embedding, user_id, top_k, matched, entity_mode
+        )
+    else:
+        chunks_with_scores = await similarity_search(
+            db=db,
+            query_embedding=query_embedding,
+            user_id=user_id,
+            top_k=top_k
+        )
     
     # Extract chunks and scores
     chunks = [c for c, _ in chunks_with_scores]
@@ -189,7 +311,8 @@ async def rag_query(
             "answer": "No relevant data found in the knowledge base.",
             "chunks": [],
             "context_used": "",
-            "scores": []
+            "scores": [],
+            "entities": matched
         }
     
     # Step 4: Assemble context
@@ -207,6 +330,7 @@ async def rag_query(
         metadata = chunk.chunk_metadata or {}
         chunk_type = metadata.get("type", "text")
         image_url = metadata.get("image_url") if chunk_type == "image" else None
+        thumbnail_urls = metadata.get("thumbnail_urls") if chunk_type == "image" else None
         
         chunk_results.append({
             "id": str(chunk.id),
@@ -214,14 +338,16 @@ async def rag_query(
             "metadata": metadata,
             "score": score,
             "type": chunk_type,
-            "image_url": image_url
+            "image_url": image_url,
+            "thumbnail_urls": thumbnail_urls
         })
     
     return {
         "answer": answer,
         "chunks": chunk_results,
         "context_used": context,
-        "scores": scores
+        "scores": scores,
+        "entities": matched
     }
 
 
@@ -282,6 +408,7 @@ async def rag_query_with_threshold(
         
         chunk_type = metadata.get("type", "text")
         image_url = metadata.get("image_url") if chunk_type == "image" else None
+        thumbnail_urls = metadata.get("thumbnail_urls") if chunk_type == "image" else None
         
         chunk_results.append({
             "id": str(chunk.id),
@@ -289,7 +416,8 @@ async def rag_query_with_threshold(
             "metadata": metadata,
             "score": score,
             "type": chunk_type,
-            "image_url": image_url
+            "image_url": image_url,
+            "thumbnail_urls": thumbnail_urls
         })
     
     return {
@@ -4,15 +4,22 @@ Vector Service for RAG.
 This service handles vector storage operations:
 - Inserting chunks with embeddings into PostgreSQL/pgvector
 - Bulk insert operations
+- Reading a user's chunks back by id
 """
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from uuid import UUID
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..models.chunk import DocumentChunk
 
 
+class ChunkOwnershipError(Exception):
+    """A chunk id is already taken by another user's chunk."""
+
+
 async def insert_chunk(
     db: AsyncSession,
     chunk_id: UUID,
@@ -24,6 +31,11 @@ async def insert_chunk(
     """
     Insert a single chunk with its embedding into the database.
     
+    Chunk ids are deterministic per document, so a retried ingestion
+    overwrites the chunk instead of failing on the existing id. Only the
+    owner's chunks are overwritten: the upsert's WHERE clause leaves a row
+    of another user untouched, and that is reported as an error.
+    
     Args:
         db: Database session
         chunk_id: Unique identifier for the chunk
@@ -33,21 +45,35 @@ async def insert_chunk(
         metadata: Optional metadata dict
         
     Returns:
-        Created DocumentChunk instance
+        Created or updated DocumentChunk instance
+        
+    Raises:
+        ChunkOwnershipError: If chunk_id belongs to another user's chunk
     """
-    chunk = DocumentChunk(
+    statement = insert(DocumentChunk).values(
         id=chunk_id,
         user_id=user_id,
         text=text,
         embedding=embedding,
         chunk_metadata=metadata or {}
     )
+    statement = statement.on_conflict_do_update(
+        index_elements=[DocumentChunk.id],
+        set_={
+            "text": statement.excluded["text"],
+            "embedding": statement.excluded["embedding"],
+            "metadata": statement.excluded["metadata"],
+        },
+        where=DocumentChunk.user_id == user_id
+    ).returning(DocumentChunk.id)
     
-    db.add(chunk)
-    await db.flush()  # Get the ID without committing
-    await db.refresh(chunk)
+    if (await db.execute(statement)).scalar_one_or_none() is None:
+        raise ChunkOwnershipError(f"Chunk {chunk_id} belongs to another user")
     
-    return chunk
+    # Load the row as stored (e.g. created_at of an overwritten chunk)
+    return (await db.execute(
+        select(DocumentChunk).where(DocumentChunk.id == chunk_id).execution_options(populate_existing=True)
+    )).scalar_one()
 
 
 async def insert_chunks_bulk(
@@ -100,6 +126,34 @@ async def get_chunk_by_id(
     return await db.get(DocumentChunk, chunk_id)
 
 
+async def get_chunks(
+    db: AsyncSession,
+    user_id: str,
+    chunk_ids: List[UUID]
+) -> List[DocumentChunk]:
+    """
+    Retrieve a user's chunks by id, in the order of the ids.
+    
+    Args:
+        db: Database session
+        user_id: Owner of the chunks; other users' chunks are not returned
+        chunk_ids: UUIDs of the chunks
+        
+    Returns:
+        Found chunks; ids that don't exist (or belong to another user) are skipped
+    """
+    if not chunk_ids:
+        return []
+    result = await db.execute(
+        select(DocumentChunk).where(
+            DocumentChunk.id.in_(chunk_ids),
+            DocumentChunk.user_id == user_id
+        )
+    )
+    found = {chunk.id: chunk for chunk in result.scalars()}
+    return [found[chunk_id] for chunk_id in chunk_ids if chunk_id in found]
+
+
 async def delete_chunk(
     db: AsyncSession,
     chunk_id: UUID
@@ -51,6 +51,8 @@ def mock_firebase(mocker):
     
     # Mock verify_id_token
     mock_auth.verify_id_token.return_value = {"uid": "28fjZnSqwENHdUy0HrLEZVTvgvF2"}
+    # The ingestion auth module binds `auth` at import time, so patch it there too
+    mocker.patch("ingestion.app.core.auth.auth", mock_auth)
     
     # Mock storage bucket
     mock_bucket = MagicMock()
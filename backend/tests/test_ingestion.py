@@ -1,47 +1,212 @@
 import pytest
+from fastapi import UploadFile
+from PIL import Image
 from fastapi.testclient import TestClient
+import asyncio
+import gzip
+import io
+import json
+import os
+import re
+import resource
+import threading
+import uuid
+import zipfile
+from contextlib import asynccontextmanager
+from datetime import datetime
 from unittest.mock import MagicMock, AsyncMock
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
 from ingestion.app.main import app
+from ingestion.app.core.config import get_settings
+from ingestion.app.core.database import IngestionJob, CacheEntry
+from ingestion.app.services.idempotency_service import idempotency_service
+from ingestion.app.services.job_queue import JobQueue
+from ingestion.app.services.job_worker import process_job
+from ingestion.app.services.pipeline import Pipeline, Stage, StageTimeoutError
+from ingestion.app.services.chunk_pool import ChunkPool
+from ingestion.app.services.embedding_service import embedding_service, EmbeddingService
+from ingestion.app.services.chunker import CharacterChunker, TextChunker, chunk_text, estimate_tokens, make_chunker
+from ingestion.app.services.processing_service import PdfChunkStream, ProcessingService, processing_service
+from ingestion.app.services.pdf_worker import PdfCpuLimitError, _cpu_limit
+from ingestion.app.core.uploads import SpooledUpload
+from ingestion.app.services.cache_service import PersistentCache
+from ingestion.app.services.image_preprocessing import prepare_for_ocr
+from ingestion.app.services.storage_service import StorageService, LocalStorageBackend, FirebaseStorageBackend
 
 client = TestClient(app)
 
 @pytest.fixture
 def mock_services(mocker):
-    # Mock all services used in ingest.py
-    mock_embedding = mocker.patch("ingestion.app.routers.ingest.embedding_service")
-    mock_storage = mocker.patch("ingestion.app.routers.ingest.storage_service")
-    mock_processing = mocker.patch("ingestion.app.routers.ingest.processing_service")
-    mock_graph = mocker.patch("ingestion.app.routers.ingest.graph_extraction_service")
-    mock_firestore = mocker.patch("ingestion.app.routers.ingest.firestore_service")
-    mock_rag = mocker.patch("ingestion.app.routers.ingest.rag_client")
+    # Mock all services used by the ingestion pipelines
+    mock_embedding = mocker.patch("ingestion.app.services.ingestion_pipeline.embedding_service")
+    mock_storage = mocker.patch("ingestion.app.services.ingestion_pipeline.storage_service")
+    mock_processing = mocker.patch("ingestion.app.services.ingestion_pipeline.processing_service")
+    mock_graph = mocker.patch("ingestion.app.services.ingestion_pipeline.graph_extraction_service")
+    mock_firestore = mocker.patch("ingestion.app.services.ingestion_pipeline.firestore_service")
+    mock_rag = mocker.patch("ingestion.app.services.ingestion_pipeline.rag_client")
+    mock_summary = mocker.patch("ingestion.app.services.ingestion_pipeline.summary_service")
+    mock_snapshot = mocker.patch("ingestion.app.services.ingestion_pipeline.graph_snapshot_service")
+    mock_analysis = mocker.patch("ingestion.app.services.ingestion_pipeline.graph_analysis_service")
+    mock_mentions = mocker.patch("ingestion.app.services.ingestion_pipeline.entity_mention_service")
     
     # Setup default async return values
     mock_embedding.generate_embedding = AsyncMock(return_value=[0.1] * 768)
     mock_embedding.chunk_text = MagicMock(return_value=["chunk1", "chunk2"])
     
     mock_storage.upload_file = AsyncMock(return_value="https://mock-storage.com/file.pdf")
+    mock_storage.upload_bytes = AsyncMock(side_effect=lambda data, folder, name, content_type=None: f"https://mock-storage.com/{name}")
     
-    mock_processing.extract_text_from_pdf = AsyncMock(return_value="Mock PDF text content")
+    @asynccontextmanager
+    async def stream_pdf(file):
+        pdf = PdfChunkStream()
+        pdf.pages = 2
+        
+        async def chunks():
+            pdf.add_preview("Mock PDF text content")
+            yield {"text": "chunk1", "page_start": 1, "page_end": 1}
+            pdf.complete = True
+            yield {"text": "chunk2", "page_start": 1, "page_end": 2}
+        
+        pdf._chunks = chunks()
+        yield pdf
+    
+    mock_processing.stream_pdf = MagicMock(side_effect=stream_pdf)
     mock_processing.extract_text_from_image = AsyncMock(return_value="Mock Image text content")
-    mock_processing.summarize_text = AsyncMock(return_value="Mock summary")
+    mock_summary.summarize_document = AsyncMock(return_value={"summary": "Mock summary", "sections": 1, "levels": 1})
     
     mock_graph.extract_from_chunks = AsyncMock(return_value={"entities": ["e1"], "relations": []})
     
-    mock_firestore.save_entities = AsyncMock()
-    mock_firestore.save_relations = AsyncMock()
-    mock_firestore.save_document_metadata = AsyncMock()
+    mock_firestore.save_graph = AsyncMock(return_value=True)
+    mock_firestore.save_document_metadata = AsyncMock(return_value="doc-1")
+    mock_firestore.update_document_summary = AsyncMock()
+    mock_snapshot.apply = AsyncMock()
+    mock_analysis.schedule = AsyncMock()
+    mock_mentions.record = AsyncMock(return_value=0)
     
     mock_rag.insert_chunk = AsyncMock(return_value={"status": "success"})
     
+    async def get_chunks(user_id, chunk_ids):
+        stored = {
+            call.kwargs["chunk_id"]: call.kwargs for call in mock_rag.insert_chunk.call_args_list
+            if call.kwargs["user_id"] == user_id
+        }
+        return [{"id": i, "text": stored[i]["text"], "metadata": stored[i]["metadata"]} for i in chunk_ids if i in stored]
+    
+    mock_rag.get_chunks = AsyncMock(side_effect=get_chunks)
+    
+    # Keep idempotency logic real, but store results in memory instead of Firestore
+    stored_results = {}
+    
+    async def get_result(user_id, content_hash, idempotency_key=None):
+        return stored_results.get((user_id, idempotency_key or content_hash))
+    
+    async def save_result(user_id, content_hash, result, idempotency_key=None):
+        stored_results[(user_id, content_hash)] = result
+        if idempotency_key:
+            stored_results[(user_id, idempotency_key)] = result
+    
+    mocker.patch.object(idempotency_service, "get_result", side_effect=get_result)
+    mocker.patch.object(idempotency_service, "save_result", side_effect=save_result)
+    
     return {
         "embedding": mock_embedding,
         "storage": mock_storage,
         "processing": mock_processing,
         "graph": mock_graph,
         "firestore": mock_firestore,
-        "rag": mock_rag
+        "rag": mock_rag,
+        "summary": mock_summary,
+        "snapshot": mock_snapshot,
+        "analysis": mock_analysis,
+        "mentions": mock_mentions
     }
 
+@pytest.fixture
+def job_queue(mocker, tmp_path):
+    mocker.patch("ingestion.app.services.job_queue.settings.INGEST_QUEUE_DIR", str(tmp_path / "queue"))
+    # In-memory SQLite stands in for Postgres (SKIP LOCKED is a no-op there)
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    IngestionJob.__table__.create(engine)
+    # Stages write from worker threads, and they all share the one SQLite connection
+    lock = threading.RLock()
+    
+    class LockedSession(Session):
+        def __enter__(self):
+            lock.acquire()
+            return super().__enter__()
+        
+        def __exit__(self, *exc_info):
+            try:
+                return super().__exit__(*exc_info)
+            finally:
+                lock.release()
+    
+    queue = JobQueue(sessionmaker(bind=engine, class_=LockedSession))
+    
+    mocker.patch("ingestion.app.routers.ingest.job_queue", queue)
+    mocker.patch("ingestion.app.services.job_worker.job_queue", queue)
+    mocker.patch("ingestion.app.services.batch_ingest.job_queue", queue)
+    mocker.patch("ingestion.app.services.ingestion_pipeline.job_queue", queue)
+    mocker.patch("ingestion.app.services.graph_analysis.job_queue", queue)
+    mocker.patch("ingestion.app.services.graph_snapshot.job_queue", queue)
+    return queue
+
+def make_jpeg(color, size=(32, 32)):
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, format="JPEG")
+    return out.getvalue()
+
+def make_pdf(pages):
+    """
+    Build a minimal PDF: str pages get one line of Helvetica text,
+    bytes pages are a single embedded JPEG (like a scan).
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        if isinstance(page, bytes):
+            width, height = Image.open(io.BytesIO(page)).size
+            objects.append(
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceRGB "
+                f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(page)} >>\n"
+                f"stream\n{page.decode('latin-1')}\nendstream"
+            )
+            resources = f"/XObject << /Im1 {len(objects)} 0 R >>"
+            stream = f"q {width} 0 0 {height} 0 0 cm /Im1 Do Q"
+        else:
+            resources = "/Font << /F1 3 0 R >>"
+            stream = f"BT /F1 12 Tf 72 720 Td ({page}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << {resources} >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+def run_next_job(queue):
+    job = queue.claim()
+    assert job is not None
+    asyncio.run(process_job(job))
+    return job["job_id"]
+
 def test_ingest_text(mock_services, mock_firebase, real_id_token):
     response = client.post(
         "/ingest/text",
@@ -57,32 +222,145 @@ def test_ingest_text(mock_services, mock_firebase, real_id_token):
     mock_services["embedding"].chunk_text.assert_called()
     mock_services["rag"].insert_chunk.assert_called()
     mock_services["graph"].extract_from_chunks.assert_called()
-    mock_services["firestore"].save_entities.assert_called()
+    mock_services["snapshot"].apply.assert_called_with("28fjZnSqwENHdUy0HrLEZVTvgvF2", ["e1"], [])
+    mock_services["firestore"].save_graph.assert_called()
+
+def test_ingest_text_retry_is_deduplicated(mock_services, mock_firebase, real_id_token):
+    headers = {"Authorization": f"Bearer {real_id_token}"}
+    
+    client.post("/ingest/text", json={"text": "Same text."}, headers=headers)
+    response = client.post("/ingest/text", json={"text": "Same text."}, headers=headers)
+    
+    assert response.status_code == 200
+    assert response.json()["deduplicated"] is True
+    assert mock_services["rag"].insert_chunk.call_count == 2  # Two chunks, inserted once
 
-def test_ingest_pdf(mock_services, mock_firebase, real_id_token):
+def test_ingest_pdf(mock_services, mock_firebase, job_queue, real_id_token):
     # Create a mock file
     files = {"file": ("test.pdf", b"pdf_content", "application/pdf")}
+    headers = {"Authorization": f"Bearer {real_id_token}"}
     
-    response = client.post(
-        "/ingest/pdf",
-        files=files,
-        headers={"Authorization": f"Bearer {real_id_token}"}
-    )
+    response = client.post("/ingest/pdf", files=files, headers=headers)
     
-    assert response.status_code == 200
+    assert response.status_code == 202
     data = response.json()
-    assert data["status"] == "success"
-    assert data["file_url"] == "https://mock-storage.com/file.pdf"
+    assert data["status"] == "queued"
+    job_id = data["job_id"]
+    
+    # Nothing is processed inside the request
+    mock_services["storage"].upload_file.assert_not_called()
+    
+    run_next_job(job_queue)
     
     # Verify service calls
     mock_services["storage"].upload_file.assert_called()
-    mock_services["processing"].extract_text_from_pdf.assert_called()
-    mock_services["processing"].summarize_text.assert_called() # Verify summarization
+    mock_services["processing"].stream_pdf.assert_called()
     mock_services["firestore"].save_document_metadata.assert_called()
+    # Summarization is deferred to its own job
+    mock_services["summary"].summarize_document.assert_not_called()
+    
+    job = client.get(f"/ingest/jobs/{job_id}", headers=headers).json()
+    assert job["status"] == "succeeded"
+    assert job["result"]["file_url"] == "https://mock-storage.com/file.pdf"
+    assert job["progress"]["stages"]["index"] == "done"
+    assert job["progress"]["chunks_done"] == 2
+    
+    # Chunks are inserted concurrently but keep their document order in metadata
+    chunk_calls = [
+        call.kwargs for call in mock_services["rag"].insert_chunk.call_args_list
+        if not call.kwargs["metadata"].get("is_summary")
+    ]
+    assert sorted(c["metadata"]["chunk_index"] for c in chunk_calls) == [0, 1]
+    pages = {c["text"]: (c["metadata"]["page_start"], c["metadata"]["page_end"]) for c in chunk_calls}
+    assert pages == {"chunk1": (1, 1), "chunk2": (1, 2)}
+    
+    # The summary job references the document; its chunks are read back from rag_service
+    summary_row = job_queue.claim()
+    assert json.loads(bytes(summary_row["payload"])) == {
+        "filename": "test.pdf",
+        "file_url": "https://mock-storage.com/file.pdf",
+        "doc_id": "doc-1",
+        "content_hash": idempotency_service.hash_content(b"pdf_content"),
+        "chunk_count": 2
+    }
+    job_queue.release(summary_row["job_id"])
+    
+    summary_job_id = run_next_job(job_queue)
+    assert summary_job_id == job["result"]["summary_job_id"]
+    mock_services["summary"].summarize_document.assert_awaited_once()
+    assert mock_services["summary"].summarize_document.call_args.args[0] == ["chunk1", "chunk2"]
+    mock_services["firestore"].update_document_summary.assert_awaited_once_with(
+        mock_services["firestore"].save_document_metadata.call_args.kwargs["user_id"], "doc-1", "Mock summary"
+    )
+    summary_call = mock_services["rag"].insert_chunk.call_args_list[-1].kwargs
+    assert summary_call["metadata"]["is_summary"] is True
+    assert summary_call["metadata"]["file_url"] == "https://mock-storage.com/file.pdf"
+    
+    summary_job = client.get(f"/ingest/jobs/{summary_job_id}", headers=headers).json()
+    assert summary_job["kind"] == "summary"
+    assert summary_job["result"]["summary"] == "Mock summary"
 
-def test_ingest_image(mock_services, mock_firebase, real_id_token):
-    # Create a mock file
-    files = {"file": ("test.png", b"image_content", "image/png")}
+def test_pdf_chunks_are_indexed_while_pages_are_parsed(mock_services, mocker):
+    from ingestion.app.services.ingestion_pipeline import process_pdf
+    indexed = asyncio.Event()
+    mock_services["rag"].insert_chunk.side_effect = lambda **kwargs: indexed.set() or {"status": "success"}
+    
+    @asynccontextmanager
+    async def stream_pdf(file):
+        pdf = PdfChunkStream()
+        pdf.pages = 3
+        
+        async def chunks():
+            pdf.add_preview("Page one text.")
+            yield {"text": "Page one text.", "page_start": 1, "page_end": 1}
+            # The rest of the document is only parsed once the first chunk is stored
+            await asyncio.wait_for(indexed.wait(), 5)
+            pdf.add_preview("Page two text.")
+            pdf.complete = True
+            yield {"text": "Page two text.", "page_start": 2, "page_end": 3}
+        
+        pdf._chunks = chunks()
+        yield pdf
+    
+    mock_services["processing"].stream_pdf = MagicMock(side_effect=stream_pdf)
+    mocker.patch("ingestion.app.services.ingestion_pipeline.enqueue_summary", return_value={"job_id": "s1"})
+    
+    with SpooledUpload.from_bytes(b"pdf_content", "doc.pdf", "application/pdf") as spooled:
+        result = asyncio.run(process_pdf("u1", spooled))
+    
+    assert result["chunks_processed"] == 2
+    assert result["pages"] == 3
+    # Graph extraction saw every chunk, in order
+    assert mock_services["graph"].extract_from_chunks.call_args.args[0] == ["Page one text.", "Page two text."]
+
+def test_pdf_without_text_fails_before_indexing(mock_services):
+    from ingestion.app.services.ingestion_pipeline import IngestionError, process_pdf
+    
+    @asynccontextmanager
+    async def stream_pdf(file):
+        pdf = PdfChunkStream()
+        pdf.pages = 1
+        
+        async def chunks():
+            pdf.add_preview("x")
+            pdf.complete = True
+            yield {"text": "x", "page_start": 1, "page_end": 1}
+        
+        pdf._chunks = chunks()
+        yield pdf
+    
+    mock_services["processing"].stream_pdf = MagicMock(side_effect=stream_pdf)
+    
+    with SpooledUpload.from_bytes(b"pdf_content", "doc.pdf", "application/pdf") as spooled:
+        with pytest.raises(IngestionError):
+            asyncio.run(process_pdf("u1", spooled))
+    
+    mock_services["rag"].insert_chunk.assert_not_called()
+
+def test_ingest_image(mock_services, mock_firebase, job_queue, real_id_token):
+    png = io.BytesIO()
+    Image.new("RGB", (1200, 800), "navy").save(png, format="PNG")
+    files = {"file": ("test.png", png.getvalue(), "image/png")}
     
     response = client.post(
         "/ingest/image",
@@ -90,11 +368,1263 @@ def test_ingest_image(mock_services, mock_firebase, real_id_token):
         headers={"Authorization": f"Bearer {real_id_token}"}
     )
     
-    assert response.status_code == 200
-    data = response.json()
-    assert data["status"] == "success"
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    
+    run_next_job(job_queue)
     
     # Verify service calls
     mock_services["storage"].upload_file.assert_called()
     mock_services["processing"].extract_text_from_image.assert_called()
     mock_services["rag"].insert_chunk.assert_called()
+    
+    # Thumbnails are stored alongside the original and attached to image chunks
+    digest = idempotency_service.hash_content(png.getvalue())
+    metadata = mock_services["rag"].insert_chunk.call_args.kwargs["metadata"]
+    assert metadata["thumbnail_urls"] == {
+        "small": f"https://mock-storage.com/{digest}_small.webp",
+        "medium": f"https://mock-storage.com/{digest}_medium.webp"
+    }
+    stored = {c.kwargs["name"]: c.args[0] for c in mock_services["storage"].upload_bytes.call_args_list}
+    assert Image.open(io.BytesIO(stored[f"{digest}_small.webp"])).size == (128, 85)
+    assert Image.open(io.BytesIO(stored[f"{digest}_medium.webp"])).format == "WEBP"
+
+def test_queued_upload_is_stored_by_reference(mock_services, mock_firebase, job_queue, real_id_token, tmp_path):
+    response = client.post(
+        "/ingest/pdf",
+        files={"file": ("test.pdf", b"pdf_content", "application/pdf")},
+        headers={"Authorization": f"Bearer {real_id_token}"}
+    )
+    
+    job = job_queue.claim()
+    assert job["payload"] is None
+    assert job["payload_path"].startswith(str(tmp_path / "queue"))
+    with open(job["payload_path"], "rb") as f:
+        assert f.read() == b"pdf_content"
+    
+    asyncio.run(process_job(job))
+    assert client.get(
+        response.json()["status_url"], headers={"Authorization": f"Bearer {real_id_token}"}
+    ).json()["status"] == "succeeded"
+    # The queued file is removed once the job finishes
+    assert not os.path.exists(job["payload_path"])
+
+def test_ingest_pdf_rejects_oversized_upload(mock_services, mock_firebase, job_queue, real_id_token, mocker):
+    mocker.patch("ingestion.app.routers.ingest.settings.INGEST_UPLOAD_MAX_BYTES", 10)
+    response = client.post(
+        "/ingest/pdf",
+        files={"file": ("big.pdf", b"x" * 11, "application/pdf")},
+        headers={"Authorization": f"Bearer {real_id_token}"}
+    )
+    
+    assert response.status_code == 413
+    assert job_queue.claim() is None
+
+def test_ingest_pdf_retry_is_deduplicated(mock_services, mock_firebase, job_queue, real_id_token):
+    files = {"file": ("test.pdf", b"same_pdf_content", "application/pdf")}
+    headers = {"Authorization": f"Bearer {real_id_token}"}
+    
+    first = client.post("/ingest/pdf", files=files, headers=headers).json()
+    
+    # Retry while the job is still queued attaches to it
+    second = client.post("/ingest/pdf", files=files, headers=headers)
+    assert second.status_code == 202
+    assert second.json()["job_id"] == first["job_id"]
+    assert second.json()["deduplicated"] is True
+    
+    run_next_job(job_queue)
+    
+    # Retry after processing short-circuits to the previous result
+    third = client.post("/ingest/pdf", files=files, headers=headers)
+    assert third.status_code == 200
+    assert third.json()["result"]["file_url"] == "https://mock-storage.com/file.pdf"
+    
+    # Only the document's deferred summary job is left
+    assert job_queue.claim()["kind"] == "summary"
+    assert job_queue.claim() is None
+    assert mock_services["storage"].upload_file.call_count == 1
+
+def test_ingest_image_idempotency_key(mock_services, mock_firebase, job_queue, real_id_token):
+    headers = {"Authorization": f"Bearer {real_id_token}", "Idempotency-Key": "upload-42"}
+    
+    first = client.post("/ingest/image", files={"file": ("a.png", b"image_v1", "image/png")}, headers=headers)
+    second = client.post("/ingest/image", files={"file": ("a.png", b"image_v2", "image/png")}, headers=headers)
+    
+    assert second.json()["deduplicated"] is True
+    assert second.json()["job_id"] == first.json()["job_id"]
+
+def test_job_is_retried_then_failed(mock_services, mock_firebase, job_queue, mocker):
+    mocker.patch("ingestion.app.services.job_queue.settings.INGEST_JOB_RETRY_BACKOFF", 0)
+    mock_services["storage"].upload_file.side_effect = RuntimeError("storage unavailable")
+    job = job_queue.enqueue("user1", "pdf", b"pdf", "hash1", "a.pdf", "application/pdf")
+    
+    for attempt in range(job["max_attempts"]):
+        run_next_job(job_queue)
+    
+    failed = job_queue.get(job["job_id"], "user1")
+    assert failed["status"] == "failed"
+    assert failed["attempts"] == job["max_attempts"]
+    assert failed["error"] == "storage unavailable"
+    assert job_queue.claim() is None
+
+def test_job_reads_do_not_load_payload(job_queue):
+    statements = []
+    engine = job_queue._session_factory.kw["bind"]
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    
+    job = job_queue.enqueue("user1", "pdf", b"pdf", "hash1", "a.pdf", "application/pdf")
+    job_queue.enqueue("user1", "pdf", b"pdf", "hash1", "a.pdf", "application/pdf")
+    job_queue.get(job["job_id"], "user1")
+    reads = [statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+    assert reads and not any(re.search(r"\.payload\b", statement) for statement in reads)
+    
+    assert job_queue.claim()["payload"] == b"pdf"
+    job_queue.update_progress(job["job_id"], "extract")
+    job_queue.complete(job["job_id"], {"status": "success"})
+    reads = [statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+    assert sum(bool(re.search(r"\.payload\b", statement)) for statement in reads) == 1
+
+def test_get_job_of_other_user_is_not_found(mock_firebase, job_queue, real_id_token):
+    job = job_queue.enqueue("someone-else", "pdf", b"pdf", "hash2", "a.pdf", "application/pdf")
+    
+    response = client.get(
+        f"/ingest/jobs/{job['job_id']}",
+        headers={"Authorization": f"Bearer {real_id_token}"}
+    )
+    assert response.status_code == 404
+
+def test_pipeline_runs_independent_stages_concurrently():
+    events = []
+    
+    def stage(name, delay, value):
+        async def run(results):
+            events.append(f"start:{name}")
+            await asyncio.sleep(delay)
+            events.append(f"end:{name}")
+            return value
+        return run
+    
+    async def combine(results):
+        return results["upload"] + results["extract"]
+    
+    pipeline = Pipeline([
+        Stage("upload", stage("upload", 0.05, "url:")),
+        Stage("extract", stage("extract", 0.05, "text")),
+        Stage("combine", combine, depends_on=["upload", "extract"]),
+    ])
+    outcome = asyncio.run(pipeline.run())
+    
+    assert outcome["combine"] == "url:text"
+    # Both independent stages started before either finished
+    assert events[:2] == ["start:upload", "start:extract"]
+    assert set(outcome.timings_ms) == {"upload", "extract", "combine"}
+
+def test_pipeline_stage_timeout_cancels_remaining_stages():
+    cancelled = []
+    
+    async def slow(results):
+        await asyncio.sleep(1)
+    
+    async def other(results):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append("other")
+            raise
+    
+    pipeline = Pipeline([
+        Stage("slow", slow, timeout=0.01),
+        Stage("other", other),
+    ])
+    with pytest.raises(StageTimeoutError):
+        asyncio.run(pipeline.run())
+    assert cancelled == ["other"]
+
+def test_pipeline_rejects_cycles():
+    async def noop(results):
+        return None
+    
+    with pytest.raises(ValueError):
+        Pipeline([Stage("a", noop, ["b"]), Stage("b", noop, ["a"])])
+
+def test_chunk_pool_bounds_concurrency_and_keeps_order():
+    running = 0
+    peak = 0
+    
+    async def worker(index, item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # Later chunks finish first
+        await asyncio.sleep(0.01 * (10 - index))
+        running -= 1
+        return item * 2
+    
+    pool = ChunkPool(per_request_limit=3, global_limit=10)
+    results = asyncio.run(pool.map(list(range(10)), worker))
+    
+    assert results == [i * 2 for i in range(10)]
+    assert peak == 3
+
+def test_chunk_pool_global_limit_applies_across_requests():
+    running = 0
+    peak = 0
+    
+    async def worker(index, item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return item
+    
+    async def two_requests():
+        pool = ChunkPool(per_request_limit=4, global_limit=5)
+        return await asyncio.gather(
+            pool.map(list(range(8)), worker),
+            pool.map(list(range(8)), worker)
+        )
+    
+    asyncio.run(two_requests())
+    assert peak == 5
+
+def test_chunk_pages_matches_chunk_text_and_tracks_pages():
+    pages = [(1, "First page. " * 150), (2, ""), (3, "Third page! " * 300), (4, "Tail.")]
+    full_text = "".join(text + "\n" for _, text in pages if text)
+    
+    chunks = list(embedding_service.chunk_pages(pages))
+    
+    assert [c["text"] for c in chunks] == embedding_service.chunk_text(full_text)
+    assert chunks[0]["page_start"] == 1
+    assert chunks[-1]["page_end"] == 4
+    assert any(c["page_start"] == 1 and c["page_end"] == 3 for c in chunks)
+    assert all(c["page_start"] in (1, 3, 4) for c in chunks)
+
+def test_estimate_tokens_by_script():
+    assert estimate_tokens("a" * 400) == 100
+    assert estimate_tokens("я" * 300) == 100
+    assert estimate_tokens("字" * 100) == 100
+    assert estimate_tokens("") == 0
+
+@pytest.mark.parametrize("sentence", [
+    "The quick brown fox jumps over the lazy dog. ",
+    "Бұл жүйе әр құжатты сақтайды. Система хранит документы! ",
+    "系统将每个文档片段存储起来。",
+    "words without any sentence punctuation at all ",
+])
+def test_chunk_text_fits_token_limit_and_streams(sentence):
+    text = sentence * 400
+    chunks = chunk_text(text, max_tokens=64, overlap_tokens=16)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 64 for chunk in chunks)
+    # No slivers: every chunk but the last is at least half full
+    assert all(estimate_tokens(chunk) >= 32 for chunk in chunks[:-1])
+    assert chunks[0].startswith(sentence.strip()[:10])
+    assert chunks[-1].endswith(sentence.strip()[-10:])
+
+    chunker = TextChunker(max_tokens=64, overlap_tokens=16)
+    streamed = []
+    for start in range(0, len(text), 37):
+        streamed += chunker.feed(text[start:start + 37])
+    streamed += chunker.finish()
+    assert [chunk["text"] for chunk in streamed] == chunks
+
+def test_token_chunker_is_the_default(mocker):
+    assert type(make_chunker()) is TextChunker
+    mocker.patch("ingestion.app.services.chunker.settings.CHUNKER", "chars")
+    assert type(make_chunker()) is CharacterChunker
+
+def test_character_chunker_streams(mocker):
+    mocker.patch("ingestion.app.services.chunker.settings.CHUNKER", "chars")
+    text = "".join(f"Sentence number {i} is here. " for i in range(200))
+    chunks = chunk_text(text)
+    
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    # Consecutive chunks overlap by CHUNK_OVERLAP_CHARS
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous[-50:] in chunk
+    
+    chunker = CharacterChunker()
+    streamed = []
+    for start in range(0, len(text), 37):
+        streamed += chunker.feed(text[start:start + 37])
+    streamed += chunker.finish()
+    assert [chunk["text"] for chunk in streamed] == chunks
+
+def test_chunk_text_overlaps_whole_sentences():
+    text = "".join(f"Sentence number {i} is here. " for i in range(100))
+    chunks = chunk_text(text, max_tokens=40, overlap_tokens=10)
+
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.startswith("Sentence number")
+        first_sentence = chunk.split(". ")[0] + "."
+        assert first_sentence in previous
+
+def test_extract_pdf_chunks_streams_pages():
+    pdf = make_pdf([f"Page {n} says hello." for n in range(1, 4)])
+    
+    extraction = processing_service.extract_pdf_chunks(io.BytesIO(pdf))
+    
+    assert extraction["pages"] == 3
+    assert "Page 1 says hello." in extraction["preview"]
+    assert extraction["chunks"][0]["page_start"] == 1
+    assert extraction["chunks"][-1]["page_end"] == 3
+
+@pytest.fixture
+def pdf_pool_service(mocker):
+    settings = get_settings()
+    mocker.patch.object(settings, "PDF_PARSE_WORKERS", 2)
+    mocker.patch.object(settings, "PDF_PARSE_MIN_PAGES_PER_TASK", 1)
+    service = ProcessingService()
+    yield service
+    service.shutdown()
+
+def chunk_pdf_bytes(service, pdf):
+    with SpooledUpload.from_bytes(pdf, "doc.pdf", "application/pdf") as spooled:
+        with spooled.as_upload_file() as file:
+            return asyncio.run(service.chunk_pdf(file))
+
+def test_chunk_pdf_parses_page_ranges_in_process_pool(pdf_pool_service):
+    pdf = make_pdf([f"Page {n} says hello." for n in range(1, 6)])
+    
+    extraction = chunk_pdf_bytes(pdf_pool_service, pdf)
+    
+    assert extraction["pages"] == 5
+    # Ranges are reassembled in page order
+    assert extraction["preview"] == "\n".join(f"Page {n} says hello." for n in range(1, 6))
+    assert extraction["chunks"][0]["page_start"] == 1
+    assert extraction["chunks"][-1]["page_end"] == 5
+    # Same chunks as parsing the whole file in one pass
+    assert extraction["chunks"] == processing_service.extract_pdf_chunks(io.BytesIO(pdf))["chunks"]
+
+def test_chunk_pdf_enforces_cpu_limit(pdf_pool_service, mocker):
+    mocker.patch.object(get_settings(), "PDF_PARSE_CPU_LIMIT", -1)
+    pdf = make_pdf(["Too expensive."])
+    
+    with pytest.raises(PdfCpuLimitError):
+        chunk_pdf_bytes(pdf_pool_service, pdf)
+
+def test_chunk_pdf_recycles_workers_after_cpu_limit(pdf_pool_service, mocker):
+    old_pool = pdf_pool_service._get_pdf_pool()
+    mocker.patch.object(get_settings(), "PDF_PARSE_CPU_LIMIT", -1)
+    pdf = make_pdf([f"Page {n} says hello." for n in range(1, 4)])
+    
+    with pytest.raises(PdfCpuLimitError):
+        chunk_pdf_bytes(pdf_pool_service, pdf)
+    
+    # Ranges of the abandoned document don't keep the old workers busy
+    assert pdf_pool_service._pdf_pool is not old_pool
+    mocker.patch.object(get_settings(), "PDF_PARSE_CPU_LIMIT", 30)
+    assert chunk_pdf_bytes(pdf_pool_service, pdf)["pages"] == 3
+
+def test_pdf_cpu_limit_interrupts_work_in_progress():
+    before = resource.getrlimit(resource.RLIMIT_CPU)
+    
+    with pytest.raises(PdfCpuLimitError):
+        with _cpu_limit(0.2):
+            while True:
+                pass
+    
+    assert resource.getrlimit(resource.RLIMIT_CPU) == before
+
+def test_spooled_upload_hashes_once_and_shares_a_view():
+    content = b"x" * (3 * 1024 * 1024 + 17)
+    file = UploadFile(file=io.BytesIO(content), filename="big.pdf")
+    
+    spooled = asyncio.run(SpooledUpload.from_upload(file))
+    with spooled:
+        assert spooled.size == len(content)
+        assert spooled.sha256 == idempotency_service.hash_content(content)
+        with spooled.view() as view:
+            assert view.readonly
+            assert view[:4] == b"xxxx" and len(view) == len(content)
+        # Readers get independent cursors
+        with spooled.open() as a, spooled.open() as b:
+            a.read(10)
+            assert b.tell() == 0
+    assert not os.path.exists(spooled.path)
+
+def test_local_storage_is_content_addressed(tmp_path, mocker):
+    backend = LocalStorageBackend(root=str(tmp_path), base_url="http://files.local")
+    upload = mocker.spy(backend, "upload")
+    service = StorageService(backend)
+    
+    async def store(name):
+        with SpooledUpload.from_bytes(b"same bytes", name, "application/pdf") as spooled:
+            with spooled.as_upload_file() as file:
+                return await service.upload_file(file, folder="pdfs/u1", content_hash=spooled.sha256)
+    
+    first = asyncio.run(store("a.pdf"))
+    second = asyncio.run(store("renamed.pdf"))
+    
+    digest = idempotency_service.hash_content(b"same bytes")
+    assert first == second == f"http://files.local/pdfs/u1/{digest}.pdf"
+    assert (tmp_path / "pdfs" / "u1" / f"{digest}.pdf").read_bytes() == b"same bytes"
+    assert upload.call_count == 1
+
+def test_firebase_storage_uses_resumable_create_only_uploads(mocker):
+    backend = FirebaseStorageBackend(chunk_size=1000 * 1024)
+    backend._bucket = MagicMock()
+    blob = backend._bucket.blob.return_value
+    
+    backend.upload(io.BytesIO(b"data"), "pdfs/u1/abc.pdf", 4, "application/pdf")
+    
+    # Part size is aligned down to a multiple of 256 KiB
+    backend._bucket.blob.assert_called_once_with("pdfs/u1/abc.pdf", chunk_size=768 * 1024)
+    assert blob.upload_from_file.call_args.kwargs["if_generation_match"] == 0
+
+def test_chunk_pdf_ocrs_only_pages_without_text(pdf_pool_service, mocker):
+    ocr = mocker.patch.object(pdf_pool_service, "_ocr_image", return_value="Scanned words.")
+    scan = make_jpeg("white")
+    pdf = make_pdf(["Digital page one.", scan, "Digital page three.", scan])
+    
+    extraction = chunk_pdf_bytes(pdf_pool_service, pdf)
+    
+    assert extraction["ocr_pages"] == 2
+    assert extraction["preview"] == "\n".join([
+        "Digital page one.", "Scanned words.", "Digital page three.", "Scanned words."
+    ])
+    # Both scanned pages hold the same image, so it is OCR'd once
+    assert ocr.call_count == 1
+
+def test_chunk_pdf_skips_images_that_fail_ocr(pdf_pool_service, mocker):
+    blocked, readable = make_jpeg("white"), make_jpeg("black")
+    
+    def ocr_image(data, prompt):
+        if ocr.call_count == 1:
+            raise ValueError("Response was blocked")
+        return "Scanned words."
+    
+    ocr = mocker.patch.object(pdf_pool_service, "_ocr_image", side_effect=ocr_image)
+    pdf = make_pdf(["Digital page one.", blocked, readable])
+    
+    extraction = chunk_pdf_bytes(pdf_pool_service, pdf)
+    
+    assert extraction["ocr_pages"] == 2
+    assert extraction["preview"] == "\n".join(["Digital page one.", "Scanned words."])
+    # Failures aren't cached, so the blocked image is tried again next time
+    assert chunk_pdf_bytes(pdf_pool_service, pdf)["preview"].count("Scanned words.") == 2
+    assert ocr.call_count == 3
+
+@pytest.fixture
+def ocr_cache(mocker):
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    CacheEntry.__table__.create(engine)
+    cache = PersistentCache("ocr", sessionmaker(bind=engine))
+    mocker.patch("ingestion.app.services.processing_service.ocr_cache", cache)
+    return cache
+
+def test_prepare_for_ocr_downscales_and_reencodes():
+    original = io.BytesIO()
+    Image.new("RGBA", (4000, 1000), (255, 0, 0, 128)).save(original, format="PNG")
+    
+    prepared, phash = prepare_for_ocr(original.getvalue())
+    
+    image = Image.open(io.BytesIO(prepared))
+    assert image.format == "JPEG"
+    assert max(image.size) == get_settings().OCR_MAX_DIMENSION
+    assert len(phash) == 16
+
+def test_image_ocr_is_cached_by_perceptual_hash(ocr_cache, mocker):
+    service = ProcessingService()
+    ocr = mocker.patch.object(service, "_ocr_image", return_value="Screenshot text")
+    
+    screenshot = Image.effect_mandelbrot((640, 480), (-2, -1.5, 1, 1.5), 100).convert("RGB")
+    png, jpeg = io.BytesIO(), io.BytesIO()
+    screenshot.save(png, format="PNG")
+    screenshot.resize((200, 150)).save(jpeg, format="JPEG", quality=50)
+    
+    async def ocr_upload(data, name):
+        return await service.extract_text_from_image(UploadFile(file=io.BytesIO(data), filename=name))
+    
+    assert asyncio.run(ocr_upload(png.getvalue(), "shot.png")) == "Screenshot text"
+    # A smaller, re-encoded copy of the same image reuses the cached text
+    assert asyncio.run(ocr_upload(jpeg.getvalue(), "shot.jpg")) == "Screenshot text"
+    assert ocr.call_count == 1
+
+def test_graph_extraction_packs_chunks_and_caches_per_chunk(mocker):
+    import json
+    from ingestion.app.services import graph_service
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    CacheEntry.__table__.create(engine)
+    mocker.patch.object(graph_service, "graph_cache", PersistentCache("graph", sessionmaker(bind=engine)))
+    mocker.patch.object(get_settings(), "GRAPH_PROMPT_MAX_TOKENS", 100)
+    
+    service = graph_service.GraphExtractionService()
+    prompts = []
+    
+    def generate(prompt, generation_config):
+        assert generation_config.response_mime_type == "application/json"
+        prompts.append(prompt)
+        numbers = [int(line[1:-1]) for line in prompt.splitlines() if line.startswith("[") and line.endswith("]")]
+        return MagicMock(text=json.dumps({"chunks": [
+            {"chunk": n, "entities": [f"Entity {len(prompts)}-{n}"], "relations": [
+                {"source": "doc", "target": f"entity {len(prompts)}-{n}", "type": "has"}
+            ]}
+            for n in numbers
+        ]}))
+    
+    mocker.patch.object(service.model, "generate_content", side_effect=generate)
+    chunks = [f"Chunk {i} " + "words " * 30 for i in range(12)]  # ~48 tokens each
+    
+    graph = asyncio.run(service.extract_from_chunks(chunks))
+    
+    # Two chunks per 100-token prompt, and no chunk is skipped
+    assert len(prompts) == 6
+    assert len(graph["entities"]) == 12
+    assert len(graph["relations"]) == 12
+    assert graph["entities"][0] == "entity 1-1"
+    
+    # Cached chunks are not sent again; only the new one is
+    graph = asyncio.run(service.extract_from_chunks(chunks + ["A brand new chunk."]))
+    assert len(prompts) == 7
+    assert len(graph["entities"]) == 13
+
+def test_local_graph_extraction_finds_entities_and_cooccurrences():
+    from ingestion.app.services.local_graph import local_graph_extractor
+    chunks = [
+        "The Ministry of Health met WHO officials in Geneva. Then Alice Smith joined.",
+        "Alice Smith uses PostgreSQL at NASA. Today it rained.",
+        "Министерство здравоохранения открыло офис в Алматы.",
+    ]
+    
+    results = local_graph_extractor.extract(chunks)
+    
+    assert results[chunks[0]]["entities"] == ["ministry of health", "who", "geneva", "alice smith"]
+    assert results[chunks[1]]["entities"] == ["alice smith", "postgresql", "nasa"]
+    assert "алматы" in results[chunks[2]]["entities"]
+    # Entities of one sentence are linked; across sentences they are not
+    pairs = {(r["source"], r["target"]) for r in results[chunks[0]]["relations"]}
+    assert ("ministry of health", "geneva") in pairs
+    assert ("geneva", "alice smith") not in pairs
+
+def test_hybrid_graph_extraction_sends_only_related_chunks_to_llm(mocker):
+    import json
+    from ingestion.app.services import graph_service
+    mocker.patch.object(graph_service, "graph_cache", MagicMock(
+        get_many=AsyncMock(return_value={}), set_many=AsyncMock()
+    ))
+    mocker.patch.object(get_settings(), "GRAPH_EXTRACTION_BACKEND", "hybrid")
+    
+    service = graph_service.GraphExtractionService()
+    prompts = []
+    
+    def generate(prompt, generation_config):
+        prompts.append(prompt)
+        return MagicMock(text=json.dumps({"chunks": [{"chunk": 1, "entities": ["alice smith", "nasa"], "relations": [
+            {"source": "alice smith", "target": "nasa", "type": "works_at"}
+        ]}]}))
+    
+    mocker.patch.object(service.model, "generate_content", side_effect=generate)
+    chunks = ["Alice Smith works at NASA.", "Tourists love Geneva.", "nothing capitalized here."]
+    
+    graph = asyncio.run(service.extract_from_chunks(chunks))
+    
+    # Only the chunk with two entities reaches Gemini, which types the relation
+    assert len(prompts) == 1
+    assert "Geneva" not in prompts[0]
+    assert graph["entities"] == ["alice smith", "nasa", "geneva"]
+    assert graph["relations"] == [{"source": "alice smith", "target": "nasa", "type": "works_at"}]
+    # Entities per chunk, aligned with the chunks, for the mention index
+    assert graph["chunk_entities"] == [["alice smith", "nasa"], ["geneva"], []]
+    
+    # The local backend makes no calls at all
+    mocker.patch.object(get_settings(), "GRAPH_EXTRACTION_BACKEND", "local")
+    graph = asyncio.run(service.extract_from_chunks(chunks))
+    assert len(prompts) == 1
+    assert graph["relations"] == [{"source": "alice smith", "target": "nasa", "type": "relates_to"}]
+
+def test_graph_writes_are_batched_and_idempotent(mocker):
+    from firebase_admin import firestore
+    from ingestion.app.services.firestore_service import FirestoreService, entity_id, relation_id
+    service = FirestoreService()
+    service._db = MagicMock()
+    batches = []
+    
+    def new_batch():
+        batches.append(MagicMock())
+        return batches[-1]
+    
+    service._db.batch.side_effect = new_batch
+    refs = service._db.collection.return_value.document.return_value.collection.return_value
+    refs.document.side_effect = lambda doc_id: f"ref:{doc_id}"
+    
+    names = [f"Entity {i}" for i in range(1100)] + ["entity  0", "ENTITY 1"]
+    ids = asyncio.run(service.save_entities("u1", names))
+    
+    assert len(ids) == 1100
+    assert ids[0] == entity_id("entity 0")
+    # One commit per 500 writes (plus the version bump), no per-entity reads
+    assert [len(batch.set.call_args_list) for batch in batches] == [500, 500, 101]
+    assert all(batch.commit.call_count == 1 for batch in batches)
+    refs.where.assert_not_called()
+    first = batches[0].set.call_args_list[0]
+    assert first.args[0] == f"ref:{entity_id('entity 0')}"
+    assert first.args[1]["mention_count"] == firestore.Increment(2)
+    assert first.kwargs == {"merge": True}
+    
+    batches.clear()
+    relations = [
+        {"source": "A", "target": "B", "type": "has"},
+        {"source": "a", "target": "b ", "type": "has"},
+        {"source": "a", "target": "b", "type": "part_of"},
+    ]
+    ids = asyncio.run(service.save_relations("u1", relations))
+    
+    assert ids == [relation_id("a", "b", "has"), relation_id("a", "b", "part_of")]
+    writes = [call.args for call in batches[0].set.call_args_list]
+    assert writes[0][1]["weight"] == firestore.Increment(2)
+    assert writes[1][1]["weight"] == firestore.Increment(1)
+    # The graph version is bumped with the edges, for readers' caches
+    assert writes[2] == ("ref:state", {"version": firestore.Increment(1), "updated_at": writes[2][1]["updated_at"]})
+
+def test_legacy_graph_documents_are_folded_into_hashed_ids():
+    from firebase_admin import firestore
+    from ingestion.app.services.firestore_service import FirestoreService, entity_id, relation_id
+    service = FirestoreService()
+    service._db = MagicMock()
+    batches = []
+    
+    def new_batch():
+        batches.append(MagicMock())
+        return batches[-1]
+    
+    def doc(doc_id, **data):
+        return MagicMock(id=doc_id, reference=f"old:{doc_id}", to_dict=MagicMock(return_value=data))
+    
+    service._db.batch.side_effect = new_batch
+    refs = service._db.collection.return_value.document.return_value.collection.return_value
+    refs.document.side_effect = lambda doc_id: f"ref:{doc_id}"
+    refs.select.return_value.stream.side_effect = [
+        [doc(entity_id("ada"), name="ada", mention_count=3), doc("uuid-1", name="Ada ", mention_count=2),
+         doc("uuid-2", name="bob")],
+        [doc(relation_id("ada", "bob", "knows"), source="ada", target="bob", type="knows", weight=1),
+         doc("uuid-3", source="ada", target="bob", type="knows", weight=4)],
+    ] * 2
+    
+    # Reads sum both documents of a name until the migration has run
+    graph = asyncio.run(service.load_graph("u1"))
+    assert graph == {"nodes": {"ada": 5, "bob": 1}, "edges": {("ada", "bob", "knows"): 5}}
+    
+    assert asyncio.run(service.fold_legacy_graph("u1")) == {"entities": 2, "relations": 1}
+    batch = batches[0]
+    assert batch.set.call_args_list[0].args[0] == f"ref:{entity_id('ada')}"
+    assert batch.set.call_args_list[0].args[1]["mention_count"] == firestore.Increment(2)
+    assert batch.set.call_args_list[1].args[1]["mention_count"] == firestore.Increment(1)
+    assert batch.set.call_args_list[2].args[0] == f"ref:{relation_id('ada', 'bob', 'knows')}"
+    assert batch.set.call_args_list[2].args[1]["weight"] == firestore.Increment(4)
+    # Old documents are deleted in the batch that moves their counters
+    assert [call.args[0] for call in batch.delete.call_args_list] == ["old:uuid-1", "old:uuid-2", "old:uuid-3"]
+
+def test_document_metadata_is_keyed_by_content_hash():
+    from ingestion.app.services.firestore_service import FirestoreService
+    service = FirestoreService()
+    service._db = MagicMock()
+    files = service._db.collection.return_value.document.return_value.collection.return_value
+    
+    doc_id = asyncio.run(service.save_document_metadata("u1", "a.pdf", "url", "pdf", 3, content_hash="hash-1"))
+    
+    assert doc_id == "hash-1"
+    files.document.assert_called_once_with("hash-1")
+    data = files.document.return_value.set.call_args
+    assert data.args[0]["chunks_count"] == 3
+    # A retry updates the record, keeping a summary added since
+    assert data.kwargs == {"merge": True}
+
+def test_save_graph_is_applied_once_per_content_hash():
+    from firebase_admin import firestore
+    from ingestion.app.services.firestore_service import FirestoreService, entity_id
+    service = FirestoreService()
+    service._db = MagicMock()
+    batches = []
+    
+    def new_batch():
+        batches.append(MagicMock())
+        return batches[-1]
+    
+    service._db.batch.side_effect = new_batch
+    refs = service._db.collection.return_value.document.return_value.collection.return_value
+    applied = set()
+    docs = {}
+    
+    def document(doc_id):
+        if doc_id not in docs:
+            docs[doc_id] = MagicMock(doc_id=doc_id)
+            docs[doc_id].get.side_effect = lambda: MagicMock(exists=doc_id in applied)
+        return docs[doc_id]
+    
+    def commit_markers(batch):
+        applied.update(call.args[0].doc_id for call in batch.set.call_args_list if "applied_at" in call.args[1])
+    
+    refs.document.side_effect = document
+    
+    relations = [{"source": "a", "target": "b", "type": "has"}]
+    assert asyncio.run(service.save_graph("u1", ["A", "a"], relations, "hash-1")) is True
+    for batch in batches:
+        commit_markers(batch)
+    writes = [call.args for call in batches[0].set.call_args_list]
+    assert writes[0][0].doc_id == entity_id("a")
+    assert writes[0][1]["mention_count"] == firestore.Increment(2)
+    # The marker goes out in the same batch as the counters and the version bump
+    assert [ref.doc_id for ref, _ in writes[-2:]] == ["hash-1", "state"]
+    
+    # A retry of the same document adds nothing
+    batches.clear()
+    assert asyncio.run(service.save_graph("u1", ["A", "a"], relations, "hash-1")) is False
+    assert batches == []
+    # Without a content hash, every call counts
+    assert asyncio.run(service.save_graph("u1", ["A"], [])) is True
+    assert len(batches) == 1
+
+def test_store_graph_skips_already_applied_documents(mock_services):
+    from ingestion.app.services.ingestion_pipeline import store_graph
+    mock_services["firestore"].save_graph.return_value = False
+    
+    graph = {"entities": ["e1"], "relations": []}
+    assert asyncio.run(store_graph("u1", graph, None, "hash-1")) == graph
+    
+    mock_services["firestore"].save_graph.assert_called_once_with("u1", ["e1"], [], "hash-1")
+    mock_services["snapshot"].apply.assert_not_called()
+
+def test_graph_snapshot_is_built_once_then_compacted(mocker):
+    from ingestion.app.core.database import GraphSnapshot, GraphSnapshotDelta
+    from ingestion.app.services import graph_snapshot
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    GraphSnapshot.__table__.create(engine)
+    GraphSnapshotDelta.__table__.create(engine)
+    service = graph_snapshot.GraphSnapshotService(sessionmaker(bind=engine))
+    enqueue = mocker.patch.object(graph_snapshot.job_queue, "enqueue")
+    load_graph = mocker.patch.object(graph_snapshot.firestore_service, "load_graph", AsyncMock(return_value={
+        "nodes": {"a": 1, "b": 1}, "edges": {("a", "b", "has"): 1}
+    }))
+    
+    # The first snapshot comes from Firestore, which already holds this document
+    asyncio.run(service.apply("u1", ["A", "b"], [{"source": "a", "target": "B", "type": "has"}]))
+    enqueue.assert_not_called()
+    # Later documents only queue their counts, without reading Firestore or the snapshot
+    decode = mocker.spy(graph_snapshot, "decode_snapshot")
+    asyncio.run(service.apply("u1", ["a", "C"], [{"source": "a", "target": "b", "type": "has"},
+                                               {"source": "c", "target": "a"}]))
+    asyncio.run(service.apply("u1", ["c"], []))
+    
+    assert load_graph.call_count == 1
+    assert decode.call_count == 0
+    assert [call.kwargs["kind"] for call in enqueue.call_args_list] == ["graph_snapshot"] * 2
+    assert json.loads(gzip.decompress(service._get("u1")))["version"] == 1
+    
+    # One compaction folds both documents in a single rewrite
+    assert asyncio.run(service.compact("u1")) == 2
+    assert decode.call_count == 1
+    assert asyncio.run(service.compact("u1")) is None
+    snapshot = asyncio.run(service.get("u1"))
+    assert snapshot["version"] == 2
+    assert snapshot["nodes"]["rows"] == [["a", 2], ["b", 1], ["c", 2]]
+    assert snapshot["edges"]["rows"] == [["a", "b", "has", 2], ["c", "a", "relates_to", 1]]
+    
+    # Reads fold pending documents first
+    asyncio.run(service.apply("u1", ["b"], []))
+    assert asyncio.run(service.get("u1"))["nodes"]["rows"] == [["a", 2], ["b", 2], ["c", 2]]
+    
+    # A failed compaction drops the snapshot and its deltas, so the next write rebuilds it
+    mocker.patch.object(graph_snapshot, "decode_snapshot", side_effect=ValueError("corrupt"))
+    asyncio.run(service.apply("u1", ["d"], []))
+    assert asyncio.run(service.get("u1")) is None
+    with sessionmaker(bind=engine)() as db:
+        assert db.query(GraphSnapshotDelta).count() == 0
+
+def test_graph_analysis_finds_communities_and_ranks(mocker):
+    from ingestion.app.core.database import GraphOverview
+    from ingestion.app.services import graph_analysis
+    from ingestion.app.services.ingestion_pipeline import process_graph_analysis
+    # Two triangles joined by a bridge; "hub" is the target of every "is_a"
+    edges = {}
+    for group in (["hub", "b", "c"], ["x", "y", "z"]):
+        for source in group:
+            for target in group:
+                if source != target:
+                    edges[(source, target, "is_a" if target == "hub" else "near")] = 4 if target == "hub" else 2
+    edges[("c", "x", "near")] = edges[("x", "c", "near")] = 1
+    nodes = {name: 1 for name in ["hub", "b", "c", "x", "y", "z"]}
+    
+    overview = graph_analysis.analyze_graph(nodes, edges)
+    
+    assert [cluster["size"] for cluster in overview["clusters"]] == [3, 3]
+    clusters = {name: cluster for name, cluster, _, _, _ in overview["nodes"]}
+    assert clusters["hub"] == clusters["b"] == clusters["c"] != clusters["x"] == clusters["y"] == clusters["z"]
+    assert overview["cluster_edges"] == [[0, 1, 2.0]]
+    assert overview["nodes"][0][0] == "hub"
+    assert overview["clusters"][0]["label"] == "hub"
+    # Edges among the top k nodes are a prefix of the edge list
+    ends = [max(source, target) for source, target, _, _ in overview["edges"]]
+    assert ends == sorted(ends)
+    
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    GraphOverview.__table__.create(engine)
+    service = graph_analysis.GraphAnalysisService(sessionmaker(bind=engine))
+    mocker.patch("ingestion.app.services.ingestion_pipeline.graph_analysis_service", service)
+    snapshot = {"version": 4, "nodes": {"rows": [[name, count] for name, count in nodes.items()]},
+                "edges": {"rows": [[*key, weight] for key, weight in edges.items()]}}
+    mocker.patch("ingestion.app.services.ingestion_pipeline.graph_snapshot_service.get",
+                 AsyncMock(return_value=snapshot))
+    
+    result = asyncio.run(process_graph_analysis("u1", {}))
+    assert (result["version"], result["clusters"], result["nodes"]) == (4, 2, 6)
+    assert asyncio.run(service.analyzed_version("u1")) == 4
+    # A retried job finds the version already analyzed
+    assert asyncio.run(process_graph_analysis("u1", {}))["message"] == "Graph analysis is up to date"
+
+def test_graph_analysis_is_scheduled_once_per_interval(job_queue):
+    from ingestion.app.services import graph_analysis
+    service = graph_analysis.GraphAnalysisService()
+    
+    first = service._enqueue("u1")
+    second = service._enqueue("u1")
+    
+    assert first["kind"] == "graph_analysis"
+    assert second["job_id"] == first["job_id"] and second["deduplicated"]
+    # It runs once the interval is over
+    assert job_queue.claim() is None
+
+def test_succeeded_housekeeping_jobs_are_pruned(job_queue):
+    from ingestion.app.services import graph_snapshot
+    graph_snapshot.graph_snapshot_service._enqueue_compaction("u1")
+    upload = job_queue.enqueue(user_id="u1", kind="summary", payload=b"{}", content_hash="summary:1")
+    
+    with job_queue._session_factory() as db:
+        db.query(IngestionJob).update({"run_after": datetime.utcnow()})
+        db.commit()
+    jobs = [job_queue.claim(), job_queue.claim()]
+    for job in jobs:
+        job_queue.complete(job["job_id"], {"status": "success"})
+    
+    # Only the document's job is kept for status polling
+    with job_queue._session_factory() as db:
+        assert [job.kind for job in db.query(IngestionJob)] == ["summary"]
+    assert job_queue.get(upload["job_id"], "u1")["status"] == "succeeded"
+
+def test_ingest_text_links_entities_to_their_chunks(mock_services, mock_firebase, real_id_token):
+    mock_services["graph"].extract_from_chunks.return_value = {
+        "entities": ["e1", "e2"], "relations": [], "chunk_entities": [["e1"], ["e1", "e2"]]
+    }
+    
+    response = client.post(
+        "/ingest/text",
+        json={"text": "Linked text."},
+        headers={"Authorization": f"Bearer {real_id_token}"}
+    )
+    
+    assert response.status_code == 200
+    # Chunks are stored under the ids the mentions point to
+    inserted = {
+        call.kwargs["metadata"]["chunk_index"]: call.kwargs["chunk_id"]
+        for call in mock_services["rag"].insert_chunk.call_args_list
+    }
+    user_id, chunk_ids, chunk_entities = mock_services["mentions"].record.call_args.args
+    assert user_id == "28fjZnSqwENHdUy0HrLEZVTvgvF2"
+    assert list(chunk_ids) == [inserted[0], inserted[1]]
+    assert chunk_entities == [["e1"], ["e1", "e2"]]
+
+def test_chunk_ids_are_stable_across_retries(mock_services):
+    from ingestion.app.services import ingestion_pipeline
+    
+    def inserted_ids():
+        ids = [call.kwargs["chunk_id"] for call in mock_services["rag"].insert_chunk.call_args_list]
+        mock_services["rag"].insert_chunk.reset_mock()
+        return sorted(ids)
+    
+    class Stream:
+        metadata = {}
+        
+        async def __aiter__(self):
+            for piece in ["Stable streamed text. " * 50] * 4:
+                yield piece
+    
+    asyncio.run(ingestion_pipeline.process_text("user1", "Same text."))
+    first = inserted_ids()
+    asyncio.run(ingestion_pipeline.process_text("user1", "Same text."))
+    assert inserted_ids() == first
+    asyncio.run(ingestion_pipeline.process_text("user2", "Same text."))
+    assert not set(inserted_ids()) & set(first)
+    
+    asyncio.run(ingestion_pipeline.process_text_stream("user1", Stream()))
+    streamed = inserted_ids()
+    asyncio.run(ingestion_pipeline.process_text_stream("user1", Stream()))
+    assert inserted_ids() == streamed
+    assert len(set(streamed)) == len(streamed)
+
+def test_entity_mentions_are_recorded_once():
+    from ingestion.app.core.database import EntityMention
+    from ingestion.app.services.entity_mentions import EntityMentionService
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    EntityMention.__table__.create(engine)
+    Session = sessionmaker(bind=engine)
+    service = EntityMentionService(Session)
+    chunk_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+    
+    assert asyncio.run(service.record("u1", chunk_ids, [["a", "b", "a"], ["b"]])) == 3
+    # Re-ingesting the same chunks adds nothing
+    asyncio.run(service.record("u1", chunk_ids, [["a"], ["b"]]))
+    
+    with Session() as db:
+        links = db.query(EntityMention.entity, EntityMention.chunk_id).order_by(EntityMention.entity).all()
+    assert sorted(links) == sorted([("a", chunk_ids[0]), ("b", chunk_ids[0]), ("b", chunk_ids[1])])
+
+def test_summary_is_map_reduced_and_cached(mocker):
+    from ingestion.app.services import summary_service as summaries
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    CacheEntry.__table__.create(engine)
+    mocker.patch.object(summaries, "summary_cache", PersistentCache("summary", sessionmaker(bind=engine)))
+    mocker.patch.object(get_settings(), "SUMMARY_SECTION_CHARS", 100)
+    
+    service = summaries.SummaryService()
+    prompts = []
+    
+    def generate(prompt):
+        prompts.append(prompt)
+        return MagicMock(text=f"S{len(prompts)}")
+    
+    mocker.patch.object(service.model, "generate_content", side_effect=generate)
+    chunks = [f"Chunk {i} " + "x" * 40 for i in range(10)]
+    
+    result = asyncio.run(service.summarize_document(chunks))
+    
+    # 10 chunks -> 5 sections of two chunks -> one final call over the section summaries
+    assert result["sections"] == 5
+    assert result["levels"] == 2
+    assert len(prompts) == 6
+    assert prompts[-1].startswith(summaries.FINAL_PROMPT.split("{text}")[0])
+    assert result["summary"] == "S6"
+    
+    # Retries reuse every cached call
+    assert asyncio.run(service.summarize_document(chunks))["summary"] == "S6"
+    assert len(prompts) == 6
+    
+    # A short document is a single call
+    assert asyncio.run(service.summarize_document(["Short note."]))["levels"] == 1
+
+def test_ingest_batch_extracts_and_dedupes_archive(mock_firebase, job_queue, real_id_token):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("docs/a.pdf", b"pdf one")
+        zf.writestr("docs/copy-of-a.pdf", b"pdf one")
+        zf.writestr("scan.png", b"png bytes")
+        zf.writestr("notes.txt", b"plain text")
+        zf.writestr("__MACOSX/docs/._a.pdf", b"resource fork")
+    
+    files = [
+        ("files", ("batch.zip", archive.getvalue(), "application/zip")),
+        ("files", ("b.pdf", b"pdf two", "application/pdf")),
+        ("files", ("broken.zip", b"not a zip", "application/zip"))
+    ]
+    response = client.post("/ingest/batch", files=files, headers={"Authorization": f"Bearer {real_id_token}"})
+    
+    assert response.status_code == 202
+    report = {entry["filename"]: entry for entry in response.json()["files"]}
+    assert set(report) == {"docs/a.pdf", "docs/copy-of-a.pdf", "scan.png", "notes.txt", "b.pdf", "broken.zip"}
+    assert report["docs/a.pdf"]["status"] == "queued"
+    assert report["docs/a.pdf"]["archive"] == "batch.zip"
+    assert report["docs/copy-of-a.pdf"]["status"] == "duplicate"
+    assert report["notes.txt"]["status"] == "skipped"
+    assert report["broken.zip"]["status"] == "failed"
+    assert response.json()["summary"] == {"queued": 3, "duplicate": 1, "skipped": 1, "failed": 1}
+    
+    # Each supported member became its own job
+    image_job = job_queue.get(report["scan.png"]["job_id"], "28fjZnSqwENHdUy0HrLEZVTvgvF2")
+    assert image_job["kind"] == "image"
+    assert image_job["content_type"] == "image/png"
+    
+    # Re-sending a file reuses its job
+    again = client.post(
+        "/ingest/batch",
+        files=[("files", ("b.pdf", b"pdf two", "application/pdf"))],
+        headers={"Authorization": f"Bearer {real_id_token}"}
+    ).json()
+    assert again["files"][0]["status"] == "deduplicated"
+    assert again["files"][0]["job_id"] == report["b.pdf"]["job_id"]
+
+def test_ingest_batch_enforces_member_size_limit(mock_firebase, job_queue, real_id_token, mocker):
+    mocker.patch("ingestion.app.services.batch_ingest.settings.INGEST_BATCH_MAX_FILE_BYTES", 10)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("big.pdf", b"x" * 1000)
+        zf.writestr("small.pdf", b"tiny")
+    
+    response = client.post(
+        "/ingest/batch",
+        files=[("files", ("batch.zip", archive.getvalue(), "application/zip"))],
+        headers={"Authorization": f"Bearer {real_id_token}"}
+    )
+    
+    statuses = {entry["filename"]: entry["status"] for entry in response.json()["files"]}
+    assert statuses == {"big.pdf": "skipped", "small.pdf": "queued"}
+    
+    # Top-level files get the same per-file limit, and archives the upload
+    # limit, both while they are spooled
+    mocker.patch("ingestion.app.services.batch_ingest.settings.INGEST_UPLOAD_MAX_BYTES", 100)
+    spool = mocker.spy(SpooledUpload, "from_upload")
+    response = client.post(
+        "/ingest/batch",
+        files=[
+            ("files", ("loose.pdf", b"y" * 50, "application/pdf")),
+            ("files", ("huge.zip", b"z" * 500, "application/zip")),
+            ("files", ("ok.pdf", b"fine", "application/pdf")),
+        ],
+        headers={"Authorization": f"Bearer {real_id_token}"}
+    )
+    
+    report = {entry["filename"]: entry for entry in response.json()["files"]}
+    assert {name: entry["status"] for name, entry in report.items()} == {
+        "loose.pdf": "skipped", "huge.zip": "skipped", "ok.pdf": "queued"
+    }
+    assert "10 bytes" in report["loose.pdf"]["reason"] and "100 bytes" in report["huge.zip"]["reason"]
+    assert [call.kwargs["max_bytes"] for call in spool.call_args_list] == [10, 100, 10]
+
+def test_ingest_batch_counts_members_and_reports_queue_errors(mock_firebase, job_queue, real_id_token, mocker):
+    # Room for the members, but not for the archive and its members together
+    mocker.patch("ingestion.app.services.batch_ingest.settings.INGEST_BATCH_MAX_TOTAL_BYTES", 1500)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("a.pdf", b"a" * 600)
+        zf.writestr("b.pdf", b"b" * 600)
+    
+    enqueue = job_queue.enqueue
+    
+    def flaky_enqueue(**kwargs):
+        if kwargs["filename"] == "bad.pdf":
+            raise RuntimeError("database is down")
+        return enqueue(**kwargs)
+    
+    mocker.patch.object(job_queue, "enqueue", side_effect=flaky_enqueue)
+    response = client.post(
+        "/ingest/batch",
+        files=[
+            ("files", ("batch.zip", archive.getvalue(), "application/zip")),
+            ("files", ("bad.pdf", b"bad", "application/pdf")),
+            ("files", ("c.pdf", b"c" * 400, "application/pdf")),
+        ],
+        headers={"Authorization": f"Bearer {real_id_token}"}
+    )
+    
+    assert response.status_code == 202
+    report = {entry["filename"]: entry for entry in response.json()["files"]}
+    assert {name: entry["status"] for name, entry in report.items()} == {
+        "a.pdf": "queued", "b.pdf": "queued", "bad.pdf": "failed", "c.pdf": "skipped"
+    }
+    assert "database is down" in report["bad.pdf"]["reason"]
+
+def test_concurrent_embeddings_are_batched(mocker):
+    mocker.patch("ingestion.app.services.embedding_service.settings.EMBED_BATCH_SIZE", 4)
+    mocker.patch("ingestion.app.services.embedding_service.settings.EMBED_BATCH_WAIT_MS", 5)
+    embed = mocker.patch(
+        "ingestion.app.services.embedding_service.genai.embed_content",
+        side_effect=lambda model, content, **kwargs: {"embedding": [[float(len(text))] for text in content]}
+    )
+    service = EmbeddingService()
+    
+    async def run():
+        return await asyncio.gather(*(service.generate_embedding("x" * n) for n in range(1, 7)))
+    
+    embeddings = asyncio.run(run())
+    
+    # Results map back to their callers; 6 texts take one full batch plus one timed flush
+    assert embeddings == [[float(n)] for n in range(1, 7)]
+    assert [len(c.kwargs["content"]) for c in embed.call_args_list] == [4, 2]
+
+def test_bulk_cli_inserts_directly_and_resumes_from_checkpoint(tmp_path, mocker):
+    from ingestion.app import cli
+    
+    root = tmp_path / "export"
+    (root / "sub").mkdir(parents=True)
+    (root / "a.txt").write_text("Plain text note about bulk loading.")
+    (root / "sub" / "doc.pdf").write_bytes(make_pdf(["Quarterly report page one", "Page two text"]))
+    (root / "data.csv").write_text("a,b")
+    (root / ".hidden.txt").write_text("ignored")
+    
+    mocker.patch.object(cli.embedding_service, "generate_embedding", AsyncMock(return_value=[0.1] * 768))
+    mocker.patch.object(cli.summary_service, "summarize_document", AsyncMock(return_value={"summary": "Mock summary"}))
+    mocker.patch.object(cli.storage_service, "upload_file", AsyncMock(return_value="https://mock-storage.com/doc.pdf"))
+    save_metadata = mocker.patch.object(cli.firestore_service, "save_document_metadata", AsyncMock())
+    save_graph = mocker.patch("ingestion.app.cli.save_graph", AsyncMock(return_value={"entities": [], "relations": []}))
+    
+    inserted = []
+    
+    def insert_rows(rows):
+        if any(row["metadata"]["type"] == "pdf" for row in rows):
+            raise RuntimeError("connection reset")
+        inserted.extend(rows)
+    
+    insert = mocker.patch("ingestion.app.cli.insert_chunk_rows", side_effect=insert_rows)
+    
+    def run():
+        checkpoint = cli.Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+        try:
+            return asyncio.run(cli.BulkIngestor("user1", checkpoint, workers=1).run(str(root)))
+        finally:
+            checkpoint.close()
+    
+    # The PDF insert fails, so only the text file is checkpointed
+    assert run() == {"files": 1, "failed": 1, "skipped": 0, "chunks": 1}
+    assert [row["metadata"]["source"] for row in inserted] == ["a.txt"]
+    
+    # The rerun skips the finished file and retries only the PDF
+    insert.side_effect = inserted.extend
+    assert run() == {"files": 1, "failed": 0, "skipped": 1, "chunks": 1}
+    
+    pdf_rows = [row for row in inserted if row["metadata"]["source"] == "doc.pdf"]
+    assert pdf_rows[0]["metadata"]["page_start"] == 1
+    assert pdf_rows[0]["metadata"]["file_url"] == "https://mock-storage.com/doc.pdf"
+    assert pdf_rows[1]["metadata"]["is_summary"] is True
+    # Ids are deterministic, so re-inserting a half-written file can't duplicate chunks
+    pdf_hash = idempotency_service.hash_content((root / "sub" / "doc.pdf").read_bytes())
+    assert pdf_rows[0]["id"] == cli.chunk_id("user1", pdf_hash, 0)
+    # The graph and metadata of the retried PDF are keyed by its hash too, so they aren't counted twice
+    assert [call.args[3] for call in save_graph.call_args_list if call.args[3] == pdf_hash] == [pdf_hash] * 2
+    save_metadata.assert_called_once()
+    assert save_metadata.call_args.kwargs["content_hash"] == pdf_hash
+
+def test_ingest_text_stream_ndjson_indexes_chunks_incrementally(mock_services, mock_firebase, real_id_token):
+    import json
+    sentences = [f"Sentence number {i} of a very long transcript. " for i in range(60)]
+    full_text = "".join(sentences)
+    
+    def body():
+        yield json.dumps({"metadata": {"title": "Transcript"}}).encode() + b"\n"
+        for sentence in sentences:
+            # Pieces split mid-line, like network reads
+            line = json.dumps({"text": sentence}).encode() + b"\n"
+            yield line[:7]
+            yield line[7:]
+    
+    response = client.post(
+        "/ingest/text/stream",
+        content=body(),
+        headers={"Authorization": f"Bearer {real_id_token}", "Content-Type": "application/x-ndjson"}
+    )
+    
+    assert response.status_code == 200
+    expected = embedding_service.chunk_text(full_text)
+    assert response.json()["chunks_processed"] == len(expected)
+    assert response.json()["timings_ms"]["first_chunk"] is not None
+    
+    inserted = sorted(mock_services["rag"].insert_chunk.call_args_list, key=lambda c: c.kwargs["metadata"]["chunk_index"])
+    assert [c.kwargs["text"] for c in inserted] == expected
+    assert inserted[0].kwargs["metadata"]["title"] == "Transcript"
+    assert inserted[0].kwargs["metadata"]["source"] == "text_stream"
+    # Every chunk reaches graph extraction (one prompt-sized group here)
+    assert mock_services["graph"].extract_from_chunks.call_args.args[0] == expected
+
+def test_text_then_text_stream_reuses_chunk_ids(mock_services, mock_firebase, real_id_token):
+    headers = {"Authorization": f"Bearer {real_id_token}"}
+    text = "".join(f"Sentence {i} of a document sent to both endpoints. " for i in range(200))
+    mock_services["embedding"].chunk_text.side_effect = embedding_service.chunk_text
+    
+    first = client.post("/ingest/text", json={"text": text}, headers=headers)
+    assert first.status_code == 200
+    inserted = mock_services["rag"].insert_chunk.call_args_list
+    ids = {call.kwargs["chunk_id"] for call in inserted}
+    assert len(ids) == len(embedding_service.chunk_text(text)) > 1
+    
+    again = client.post(
+        "/ingest/text/stream",
+        content=iter([text[:777].encode("utf-8"), text[777:].encode("utf-8")]),
+        headers={**headers, "Content-Type": "text/plain"}
+    )
+    assert again.json()["deduplicated"] is True
+    # The stream re-indexed the same chunks under the same ids: no second copy
+    assert {call.kwargs["chunk_id"] for call in inserted} == ids
+    assert len(inserted) == 2 * len(ids)
+
+def test_ingest_text_stream_is_deduplicated_by_text(mock_services, mock_firebase, real_id_token):
+    import json
+    headers = {"Authorization": f"Bearer {real_id_token}"}
+    text = "A document sent more than once. " * 20
+    
+    first = client.post(
+        "/ingest/text/stream",
+        content=iter([json.dumps({"text": text[:100]}).encode() + b"\n", json.dumps({"text": text[100:]}).encode()]),
+        headers={**headers, "Content-Type": "application/x-ndjson"}
+    )
+    assert first.status_code == 200 and "deduplicated" not in first.json()
+    
+    # Same text in another body format, and through /ingest/text
+    again = client.post(
+        "/ingest/text/stream",
+        content=iter([text.encode("utf-8")]),
+        headers={**headers, "Content-Type": "text/plain"}
+    )
+    assert again.json()["deduplicated"] is True
+    assert again.json()["chunks_processed"] == first.json()["chunks_processed"]
+    posted = client.post("/ingest/text", json={"text": text}, headers=headers)
+    assert posted.json()["deduplicated"] is True
+    # The graph was only saved for the first upload
+    assert mock_services["firestore"].save_graph.call_count == 1
+    
+    # Retries with an Idempotency-Key are answered before the body is read
+    keyed = {**headers, "Content-Type": "text/plain", "Idempotency-Key": "stream-1"}
+    client.post("/ingest/text/stream", content=b"Other text.", headers=keyed)
+    inserted = mock_services["rag"].insert_chunk.call_count
+    retry = client.post("/ingest/text/stream", content=b"Other text.", headers=keyed)
+    assert retry.json()["deduplicated"] is True
+    assert mock_services["rag"].insert_chunk.call_count == inserted
+
+def test_text_stream_graph_groups_are_bounded(mock_services, mocker):
+    from ingestion.app.services.ingestion_pipeline import process_text_stream
+    mocker.patch.object(get_settings(), "GRAPH_PROMPT_MAX_TOKENS", 1)
+    mocker.patch.object(get_settings(), "GRAPH_EXTRACTION_CONCURRENCY", 2)
+    in_flight, peak = 0, 0
+    
+    async def extract(group):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {"entities": [], "relations": [], "chunk_entities": [[] for _ in group]}
+    
+    mock_services["graph"].extract_from_chunks = AsyncMock(side_effect=extract)
+    
+    class Stream:
+        metadata = {}
+        
+        async def __aiter__(self):
+            for i in range(40):
+                yield "x" * 2000 + f" part {i}. "
+    
+    result = asyncio.run(process_text_stream("u1", Stream()))
+    
+    # Every group is extracted, but never more than two at a time
+    groups = mock_services["graph"].extract_from_chunks.call_count
+    assert groups == result["chunks_processed"] > 2
+    assert peak == 2
+
+def test_ingest_text_stream_plain_text_and_errors(mock_services, mock_firebase, real_id_token):
+    headers = {"Authorization": f"Bearer {real_id_token}"}
+    text = "Привет, мир! " * 100
+    encoded = text.encode("utf-8")
+    
+    # Split inside a multi-byte character
+    response = client.post(
+        "/ingest/text/stream",
+        content=iter([encoded[:1], encoded[1:]]),
+        headers={**headers, "Content-Type": "text/plain; charset=utf-8"}
+    )
+    assert response.status_code == 200
+    texts = [c.kwargs["text"] for c in mock_services["rag"].insert_chunk.call_args_list]
+    assert sorted(texts) == sorted(embedding_service.chunk_text(text))
+    
+    bad_json = client.post(
+        "/ingest/text/stream",
+        content=b'{"text": "ok"}\nnot json\n',
+        headers={**headers, "Content-Type": "application/x-ndjson"}
+    )
+    assert bad_json.status_code == 400
+    assert "Line 2" in bad_json.json()["detail"]
+    
+    unsupported = client.post("/ingest/text/stream", content=b"{}", headers={**headers, "Content-Type": "application/json"})
+    assert unsupported.status_code == 415
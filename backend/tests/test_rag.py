@@ -5,6 +5,7 @@ from rag_service.app.main import app
 from rag_service.app.models.chunk import DocumentChunk
 from uuid import uuid4
 from datetime import datetime
+import asyncio
 
 client = TestClient(app)
 
@@ -87,3 +88,405 @@ def test_vector_insert(mock_rag_services, mock_db_session):
     
     # Verify service call
     mock_rag_services["vector"].insert_chunk.assert_called()
+
+def test_vector_insert_does_not_overwrite_another_users_chunk(mock_rag_services, mock_db_session):
+    from sqlalchemy.dialects import postgresql
+    from rag_service.app.services import vector_service
+    db = MagicMock()
+    # The upsert's WHERE clause left the other user's row alone: no id is returned
+    db.execute = AsyncMock(return_value=MagicMock(scalar_one_or_none=MagicMock(return_value=None)))
+    
+    with pytest.raises(vector_service.ChunkOwnershipError):
+        asyncio.run(vector_service.insert_chunk(db, uuid4(), "attacker", "text", [0.1] * 768))
+    
+    sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (id) DO UPDATE" in sql
+    assert "WHERE document_chunks.user_id =" in sql
+    
+    mock_rag_services["vector"].insert_chunk.side_effect = vector_service.ChunkOwnershipError("taken")
+    response = client.post(
+        "/vector/insert",
+        json={"id": str(uuid4()), "user_id": "attacker", "text": "x", "embedding": [0.1] * 768}
+    )
+    assert response.status_code == 409
+
+def test_vector_chunks_are_read_back_in_order(mock_rag_services, mock_db_session):
+    from rag_service.app.services import vector_service
+    first, second = uuid4(), uuid4()
+    stored = [
+        DocumentChunk(id=second, user_id="owner", text="Second", chunk_metadata={"chunk_index": 1}),
+        DocumentChunk(id=first, user_id="owner", text="First", chunk_metadata={"chunk_index": 0}),
+    ]
+    db = MagicMock()
+    db.execute = AsyncMock(return_value=MagicMock(scalars=MagicMock(return_value=stored)))
+    
+    chunks = asyncio.run(vector_service.get_chunks(db, "owner", [first, uuid4(), second]))
+    
+    # Request order, missing ids left out, scoped to the owner
+    assert [chunk.text for chunk in chunks] == ["First", "Second"]
+    assert "document_chunks.user_id =" in str(db.execute.call_args.args[0])
+    
+    mock_rag_services["vector"].get_chunks = AsyncMock(return_value=chunks)
+    response = client.post("/vector/chunks", json={"user_id": "owner", "ids": [str(first), str(second)]})
+    assert response.status_code == 200
+    assert response.json()["chunks"] == [
+        {"id": str(first), "text": "First", "metadata": {"chunk_index": 0}},
+        {"id": str(second), "text": "Second", "metadata": {"chunk_index": 1}},
+    ]
+
+def test_rag_query_returns_image_thumbnails(mock_rag_services, mock_db_session):
+    thumbnails = {
+        "small": "https://storage.example/thumbnails/u1/abc_small.webp",
+        "medium": "https://storage.example/thumbnails/u1/abc_medium.webp"
+    }
+    image_chunk = DocumentChunk(
+        id=uuid4(),
+        user_id="28fjZnSqwENHdUy0HrLEZVTvgvF2",
+        text="Whiteboard photo text",
+        chunk_metadata={
+            "type": "image",
+            "image_url": "https://storage.example/images/u1/abc.png",
+            "thumbnail_urls": thumbnails
+        },
+        created_at=datetime.utcnow()
+    )
+    mock_rag_services["search"].return_value = [(image_chunk, 0.1)]
+    
+    response = client.post(
+        "/rag/query",
+        json={"query": "whiteboard", "user_id": "28fjZnSqwENHdUy0HrLEZVTvgvF2"}
+    )
+    
+    assert response.status_code == 200
+    chunk = response.json()["chunks"][0]
+    assert chunk["type"] == "image"
+    assert chunk["thumbnail_urls"] == thumbnails
+
+class FakeGraphQuery:
+    """Ordered Firestore query over one graph collection."""
+    
+    def __init__(self, db, kind, docs, fields=None):
+        self.db, self.kind, self.docs, self.fields = db, kind, docs, fields
+    
+    def order_by(self, field):
+        return FakeGraphQuery(self.db, self.kind, sorted(self.docs, key=lambda doc: doc[0]), self.fields)
+    
+    def start_after(self, values):
+        docs = [doc for doc in self.docs if doc[0] > values["__name__"]]
+        return FakeGraphQuery(self.db, self.kind, docs, self.fields)
+    
+    def select(self, fields):
+        return FakeGraphQuery(self.db, self.kind, self.docs, fields)
+    
+    def limit(self, count):
+        return FakeGraphQuery(self.db, self.kind, self.docs[:count], self.fields)
+    
+    def stream(self):
+        if self.kind == "relations":
+            self.db.relation_loads += 1
+        self.db.doc_reads += len(self.docs)
+        return [
+            MagicMock(id=doc_id, to_dict=MagicMock(return_value={
+                key: value for key, value in data.items() if self.fields is None or key in self.fields
+            }))
+            for doc_id, data in self.docs
+        ]
+
+class FakeGraphDb:
+    """Firestore stand-in serving one user's graph and graph version."""
+    
+    def __init__(self, relations, version=1, entities=()):
+        self.relations = relations
+        self.entities = list(entities)
+        self.version = version
+        self.relation_loads = 0
+        self.version_reads = 0
+        self.doc_reads = 0
+        self._kind = None
+    
+    def collection(self, name):
+        if name == "graph" or self._kind == "meta":
+            return self
+        docs = self.relations if self._kind == "relations" else self.entities
+        return FakeGraphQuery(self, self._kind, [(f"{self._kind[0]}{i:04d}", dict(doc)) for i, doc in enumerate(docs)])
+    
+    def document(self, name):
+        if name in ("entities", "relations", "meta"):
+            self._kind = name
+        return self
+    
+    def get(self):
+        self.version_reads += 1
+        return MagicMock(exists=True, to_dict=MagicMock(return_value={"version": self.version}))
+
+def chain_relations(length):
+    return [
+        {"source": f"n{i}", "target": f"n{i + 1}", "type": "next", "weight": 1}
+        for i in range(length)
+    ]
+
+def test_graph_index_neighborhood_respects_depth_and_caps():
+    from rag_service.app.services.graph_index import GraphIndex
+    index = GraphIndex(chain_relations(10) + [
+        {"source": "hub", "target": "n0", "type": "has", "weight": 5},
+        {"source": "hub", "target": "n5", "type": "has", "weight": 1},
+    ])
+    
+    subgraph = index.neighborhood("n0", depth=2, max_nodes=100, max_edges=100)
+    assert subgraph["nodes"] == {"n0": 0, "n1": 1, "hub": 1, "n2": 2, "n5": 2}
+    assert {index.edge(e)["target"] for e in subgraph["edges"]} == {"n1", "n0", "n2", "n5"}
+    assert not subgraph["truncated"]
+    
+    # Strongest edges are followed first when the cap cuts the traversal
+    subgraph = index.neighborhood("n0", depth=3, max_nodes=2, max_edges=100)
+    assert subgraph["nodes"] == {"n0": 0, "hub": 1}
+    assert subgraph["truncated"]
+    
+    assert index.neighborhood("unknown", 3, 10, 10)["nodes"] == {"unknown": 0}
+
+def test_graph_index_cache_revalidates_by_version_and_evicts(mocker):
+    from rag_service.app.services.graph_index import GraphIndexCache
+    cache = GraphIndexCache(max_bytes=10 ** 6, version_ttl=0)
+    db = FakeGraphDb(chain_relations(5))
+    
+    first = asyncio.run(cache.get(db, "u1"))
+    assert asyncio.run(cache.get(db, "u1")) is first
+    # Unchanged version: one small read, no reload
+    assert (db.relation_loads, db.version_reads) == (1, 2)
+    
+    db.relations = chain_relations(6)
+    db.version = 2
+    assert len(asyncio.run(cache.get(db, "u1")).names) == 7
+    assert db.relation_loads == 2
+    
+    # Within the TTL the cached index is served without any read
+    cache.version_ttl = 60
+    asyncio.run(cache.get(db, "u1"))
+    assert db.version_reads == 3
+    
+    # Least recently used indexes are dropped past the memory limit
+    cache.max_bytes = first.nbytes * 2
+    asyncio.run(cache.get(FakeGraphDb(chain_relations(5)), "u2"))
+    asyncio.run(cache.get(FakeGraphDb(chain_relations(5)), "u3"))
+    assert list(cache._entries) == ["u2", "u3"]
+    
+    # Load locks don't outlive the requests using them, cached or not
+    cache.max_bytes = 1
+    asyncio.run(cache.get(FakeGraphDb(chain_relations(5)), "u4"))
+    assert "u4" not in cache._entries
+    assert cache._locks == {}
+
+@pytest.fixture
+def graph_api(mocker):
+    from rag_service.app.api import graph
+    from rag_service.app.services.graph_index import GraphIndexCache
+    mocker.patch.object(graph, "graph_index_cache", GraphIndexCache(max_bytes=10 ** 6, version_ttl=60))
+    app.dependency_overrides[graph.get_current_user] = lambda: "u1"
+    yield graph
+    app.dependency_overrides.clear()
+
+def test_query_my_entity_traverses_requested_depth(graph_api, mocker):
+    db = FakeGraphDb(chain_relations(10))
+    mocker.patch.object(graph_api, "get_firestore_db", return_value=db)
+    
+    response = client.get("/graph/entity/N3", params={"depth": 3})
+    again = client.get("/graph/entity/n3", params={"depth": 1})
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert {node["id"]: node["depth"] for node in data["nodes"]} == {
+        "n3": 0, "n2": 1, "n4": 1, "n1": 2, "n5": 2, "n0": 3, "n6": 3
+    }
+    assert len(data["edges"]) == 6
+    assert data["edges"][0] == {"source": "n2", "target": "n3", "relation": "next", "weight": 1}
+    assert len(again.json()["nodes"]) == 3
+    # One load serves both requests
+    assert db.relation_loads == 1
+
+def test_get_my_graph_pages_projects_and_revalidates(graph_api, mocker):
+    entities = [{"name": f"e{i}", "mention_count": i, "mentions": ["chunk"] * 100} for i in range(5)]
+    db = FakeGraphDb(chain_relations(4), entities=entities)
+    mocker.patch.object(graph_api, "get_firestore_db", return_value=db)
+    
+    # Nodes first, then edges, 3 elements per page
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/graph/me", params=params).json()
+        pages.append(page)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert [(len(p["nodes"]), len(p["edges"])) for p in pages] == [(3, 0), (2, 1), (0, 3)]
+    assert pages[0]["nodes"][2] == {"id": "e2", "label": "e2", "type": "entity", "mentions": 2}
+    assert pages[2]["edges"][-1] == {"source": "n3", "target": "n4", "relation": "next", "weight": 1}
+    
+    # Projection and compact rows
+    response = client.get("/graph/me", params={"select": "id,mentions,source", "format": "compact"})
+    data = response.json()
+    assert data["nodes"] == {"fields": ["id", "mentions"], "rows": [[f"e{i}", i] for i in range(5)]}
+    assert data["edges"]["fields"] == ["source"]
+    assert data["edges"]["rows"][0] == ["n0"]
+    assert client.get("/graph/me", params={"select": "color"}).status_code == 400
+    
+    # A client with the current page gets 304 without any Firestore reads
+    reads = (db.doc_reads, db.version_reads)
+    etag = response.headers["ETag"]
+    cached = client.get("/graph/me", params={"select": "id,mentions,source", "format": "compact"},
+                        headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert (db.doc_reads, db.version_reads) == reads
+    
+    # A new graph version changes the ETag
+    db.version = 2
+    graph_api.graph_index_cache.version_ttl = 0
+    changed = client.get("/graph/me", params={"select": "id,mentions,source", "format": "compact"},
+                         headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+def test_graph_snapshot_is_served_as_stored(graph_api):
+    import gzip
+    import json
+    from rag_service.app.core.db import get_db
+    body = {"user_id": "u1", "version": 7, "nodes": {"fields": ["id", "mentions"], "rows": [["a", 2]]},
+            "edges": {"fields": ["source", "target", "relation", "weight"], "rows": []}}
+    stored = gzip.compress(json.dumps(body).encode("utf-8"))
+    session = MagicMock()
+    session.scalar = AsyncMock(return_value=7)
+    session.execute = AsyncMock(return_value=MagicMock(first=MagicMock(return_value=MagicMock(version=7, data=stored))))
+    
+    async def fake_db():
+        yield session
+    
+    app.dependency_overrides[get_db] = fake_db
+    
+    response = client.get("/graph/me/snapshot")
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == '"s7"'
+    assert response.json() == body
+    
+    # Clients without gzip get it decompressed
+    plain = client.get("/graph/me/snapshot", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == body
+    
+    # The current version is a 304 without fetching the data
+    session.execute.reset_mock()
+    cached = client.get("/graph/me/snapshot", headers={"If-None-Match": '"s7"'})
+    assert cached.status_code == 304
+    session.execute.assert_not_called()
+    
+    session.execute.return_value.first.return_value = None
+    assert client.get("/graph/me/snapshot").status_code == 404
+
+def test_graph_overview_levels_and_drill_down(graph_api, mocker):
+    import gzip
+    import json
+    from rag_service.app.core.db import get_db
+    from rag_service.app.services.graph_overview import GraphOverviewCache
+    cache = mocker.patch.object(graph_api, "graph_overview_cache", GraphOverviewCache())
+    mocker.patch.object(graph_api, "OVERVIEW_LEVEL_NODES", 2)
+    body = {
+        "user_id": "u1", "version": 3, "computed_at": "2026-01-01T00:00:00",
+        "clusters": [{"id": 0, "label": "a", "size": 3, "rank": 0.6}, {"id": 1, "label": "x", "size": 2, "rank": 0.4}],
+        "cluster_edges": [[0, 1, 1.0]],
+        "nodes": [["a", 0, 0.3, 2, 5], ["x", 1, 0.2, 2, 1], ["b", 0, 0.2, 2, 1], ["c", 0, 0.1, 2, 1], ["y", 1, 0.1, 1, 1]],
+        "edges": [[0, 1, "near", 1], [0, 2, "has", 2], [2, 3, "has", 1], [1, 4, "has", 1]],
+    }
+    stored = gzip.compress(json.dumps(body).encode("utf-8"))
+    session = MagicMock()
+    session.scalar = AsyncMock(side_effect=lambda statement: stored if "data" in str(statement) else 3)
+    
+    async def fake_db():
+        yield session
+    
+    app.dependency_overrides[get_db] = fake_db
+    
+    clusters = client.get("/graph/overview").json()
+    assert clusters["clusters_total"] == 2
+    assert clusters["cluster_edges"] == [{"source": 0, "target": 1, "weight": 1.0}]
+    assert clusters["nodes"] == [] and clusters["edges"] == []
+    
+    # Level 1 adds the top 2 nodes and only the edges between them
+    level = client.get("/graph/overview", params={"level": 1})
+    data = level.json()
+    assert [node["id"] for node in data["nodes"]] == ["a", "x"]
+    assert data["edges"] == [{"source": "a", "target": "x", "relation": "near", "weight": 1}]
+    assert len(client.get("/graph/overview", params={"level": 2}).json()["edges"]) == 3
+    
+    drill = client.get("/graph/overview", params={"cluster": 0, "limit": 2}).json()
+    assert [node["id"] for node in drill["nodes"]] == ["a", "b"]
+    assert drill["edges"] == [{"source": "a", "target": "b", "relation": "has", "weight": 2}]
+    assert drill["neighbors"] == [{"cluster": 1, "label": "x", "weight": 1.0}]
+    assert drill["truncated"] is True
+    assert client.get("/graph/overview", params={"cluster": 5}).status_code == 404
+    
+    # Parsed once per version; a matching ETag skips the data query
+    assert len(cache._entries) == 1
+    data_reads = sum("data" in str(call.args[0]) for call in session.scalar.call_args_list)
+    assert data_reads == 1
+    cached = client.get("/graph/overview", params={"level": 1}, headers={"If-None-Match": level.headers["ETag"]})
+    assert cached.status_code == 304
+    
+    session.scalar = AsyncMock(return_value=None)
+    assert client.get("/graph/overview").status_code == 404
+
+def test_graph_path_finds_k_shortest_paths(graph_api, mocker):
+    relations = chain_relations(6) + [
+        {"source": "n0", "target": "a", "type": "near", "weight": 2},
+        {"source": "n3", "target": "a", "type": "near", "weight": 1},
+    ]
+    mocker.patch.object(graph_api, "get_firestore_db", return_value=FakeGraphDb(relations))
+    
+    response = client.get("/graph/path", params={"source": "N0", "target": "n6", "k": 3})
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert [path["nodes"] for path in data["paths"]] == [
+        ["n0", "a", "n3", "n4", "n5", "n6"],
+        ["n0", "n1", "n2", "n3", "n4", "n5", "n6"],
+    ]
+    assert data["found"] is True and data["truncated"] is False
+    # Only the sub-graph the paths span
+    assert len(data["nodes"]) == 8
+    assert len(data["edges"]) == 8
+    assert data["edges"][0] == {"source": "n0", "target": "a", "relation": "near", "weight": 2}
+    
+    # Depth and fan-out limits
+    assert client.get("/graph/path", params={"source": "n0", "target": "n6", "max_depth": 4}).json()["found"] is False
+    # Following only each entity's strongest relation, "a" leads back to "n0"
+    assert client.get("/graph/path", params={"source": "n0", "target": "n6", "max_fanout": 1}).json()["found"] is False
+    
+    assert client.get("/graph/path", params={"source": "n0", "target": "nowhere"}).status_code == 404
+
+def test_rag_query_scopes_search_to_entities(mock_rag_services, mock_db_session, mocker):
+    from rag_service.app.services import rag_service
+    general = DocumentChunk(id=uuid4(), user_id="u1", text="General", chunk_metadata={}, created_at=datetime.utcnow())
+    mentioning = DocumentChunk(id=uuid4(), user_id="u1", text="About ML", chunk_metadata={}, created_at=datetime.utcnow())
+    
+    async def search(db, query_embedding, user_id, top_k, entities=None):
+        return [(mentioning, 0.3)] if entities else [(general, 0.25), (mentioning, 0.3)]
+    
+    mock_rag_services["search"].side_effect = search
+    match = mocker.patch.object(rag_service, "match_entities", AsyncMock(return_value=["machine learning"]))
+    body = {"query": "What is machine learning?", "user_id": "u1"}
+    
+    boosted = client.post("/rag/query", json={**body, "entity_mode": "boost"}).json()
+    # Mentioning chunks rank entity_boost closer; scores stay raw distances
+    assert [c["text"] for c in boosted["chunks"]] == ["About ML", "General"]
+    assert boosted["scores"] == [0.3, 0.25]
+    assert boosted["entities"] == ["machine learning"]
+    
+    filtered = client.post("/rag/query", json={**body, "entity_mode": "filter"}).json()
+    assert [c["text"] for c in filtered["chunks"]] == ["About ML"]
+    
+    # Explicit entities skip matching; the default mode ignores entities
+    client.post("/rag/query", json={**body, "entity_mode": "filter", "entities": ["  Deep   Learning"]})
+    assert mock_rag_services["search"].call_args.kwargs["entities"] == ["deep learning"]
+    assert match.call_count == 2
+    assert client.post("/rag/query", json=body).json()["entities"] == []
+    
+    assert "machine learning" in rag_service.query_phrases("What is Machine Learning?")
+    assert "c++" in rag_service.query_phrases("Who wrote C++?")
@@ -10,6 +10,29 @@ export const useIngestionApi = () => {
     );
   }
 
+  const waitForJob = async (
+    jobId: string,
+    headers: Record<string, string>,
+    intervalMs = 2000
+  ) => {
+    while (true) {
+      // @ts-ignore
+      const job: any = await $fetch(`${baseUrl}/ingest/jobs/${jobId}`, {
+        headers,
+        timeout: 30000,
+      });
+
+      if (job.status === "succeeded") {
+        return job.result;
+      }
+      if (job.status === "failed") {
+        throw new Error(job.error || "Ingestion failed");
+      }
+
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+  };
+
   const uploadDocument = async (file: File) => {
     const formData = new FormData();
     formData.append("file", file);
@@ -40,14 +63,19 @@ export const useIngestionApi = () => {
       }
 
       // @ts-ignore
-      const data = await $fetch(`${baseUrl}${endpoint}`, {
+      const data: any = await $fetch(`${baseUrl}${endpoint}`, {
         method: "POST",
         headers,
         body: formData,
         // Add timeout to prevent hanging
         timeout: 120000, // 2 minutes timeout
       });
-      return data;
+
+      // PDF and image uploads are processed as background jobs
+      if (data?.job_id && data.status !== "succeeded") {
+        return await waitForJob(data.job_id, headers);
+      }
+      return data?.result ?? data;
     } catch (error: any) {
       console.error("Error uploading document:", error);
 